@@ -0,0 +1,183 @@
+"""
+This file contains the backfill of the past seasons of the leagues: the schedule and the statistics
+of every (league, season) are scraped in parallel and saved to the dataset and to the history.
+
+The finished (league, season) pairs are recorded in a checkpoint file, so an interrupted backfill
+resumes where it stopped.
+
+Usage:
+    python backfill.py [--leagues Premier-League Ligue-1] [--seasons 10] [--workers 4] [--rate 0.15]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from football_scraper import League, FootballScrapper, FBREF_URL, current_season
+from http_client import HttpClient
+from http_cache import ResponseCache
+from dataset_store import DatasetStore
+from history_store import HistoryStore
+
+
+def get_past_seasons(n_seasons: int, date: datetime.date = None) -> list:
+    """
+    Returns the last finished seasons, the most recent first.
+
+    Args:
+        n_seasons (int): The number of seasons.
+        date (datetime.date, optional): The date of the current season. Defaults to today.
+
+    Returns:
+        list: The seasons (e.g. ["2022-2023", "2021-2022"]).
+    """
+    start = int(current_season(date).split("-")[0])
+    return [f"{year}-{year + 1}" for year in range(start - 1, start - 1 - n_seasons, -1)]
+
+
+def get_season_end(season: str) -> datetime.date:
+    """
+    Returns the last day of a season, the date of the snapshots of its final statistics.
+    """
+    return datetime.date(int(season.split("-")[1]), 6, 30)
+
+
+class Checkpoint:
+    """
+    This class is used to store the (league, season) pairs already backfilled.
+    """
+    def __init__(self, path: str = "data/backfill.json"):
+        """
+        Args:
+            path (str, optional): The path of the json file. Defaults to "data/backfill.json".
+        """
+        self.path = path
+        self.done = set()
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.done = set(json.load(file)["done"])
+
+    def is_done(self, league: League, season: str) -> bool:
+        """
+        Returns True if the season of the league was already backfilled.
+        """
+        return f"{league.value}/{season}" in self.done
+
+    def mark_done(self, league: League, season: str):
+        """
+        Records that the season of the league was backfilled and saves the file.
+        """
+        with self.lock:
+            self.done.add(f"{league.value}/{season}")
+
+            # Create the directory if it does not exist
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+            # Write to a temporary file first so that an interrupted run does not corrupt the file
+            with open(self.path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump({"done": sorted(self.done)}, file, indent=2)
+            os.replace(self.path + ".tmp", self.path)
+
+
+def backfill_season(league: League, season: str, client: HttpClient, store: DatasetStore = None,
+                    history: HistoryStore = None, base_url: str = FBREF_URL):
+    """
+    Scrapes a past season of a league and saves it.
+
+    Args:
+        league (League): The league.
+        season (str): The season (e.g. "2021-2022").
+        client (HttpClient): The HTTP client.
+        store (DatasetStore, optional): The dataset. Defaults to None (not saved to the dataset).
+        history (HistoryStore, optional): The history. Defaults to None (not saved to the history).
+        base_url (str, optional): The root url of the website. Defaults to FBREF_URL.
+    """
+    scrapper = FootballScrapper(league, client=client, base_url=base_url, season=season)
+    scrapper.get_data()
+    if scrapper.schedule is None or not scrapper.statistics:
+        raise RuntimeError(f"No data for {league.value} {season}")
+
+    if store is not None:
+        scrapper.to_parquet(store)
+    if history is not None:
+        scrapper.to_history(history, snapshot_date=get_season_end(season))
+
+
+def backfill(leagues: list = None, seasons: list = None, client: HttpClient = None,
+             store: DatasetStore = None, history: HistoryStore = None, checkpoint: Checkpoint = None,
+             max_workers: int = 4, base_url: str = FBREF_URL) -> dict:
+    """
+    Backfills the past seasons of the leagues in parallel, skipping the ones already in the checkpoint.
+    The workers share the client, so the requests stay within its rate limit.
+
+    Args:
+        leagues (list, optional): The leagues. Defaults to all the leagues.
+        seasons (list, optional): The seasons. Defaults to the last 10 finished seasons.
+        client (HttpClient, optional): The HTTP client. Defaults to a cached client with 1 request every 6 seconds.
+        store (DatasetStore, optional): The dataset. Defaults to the dataset in data/dataset.
+        history (HistoryStore, optional): The history. Defaults to the database in data/history.db.
+        checkpoint (Checkpoint, optional): The checkpoint. Defaults to data/backfill.json.
+        max_workers (int, optional): The number of threads. Defaults to 4.
+        base_url (str, optional): The root url of the website. Defaults to FBREF_URL.
+
+    Returns:
+        dict: The error of each (league, season) that failed (empty if all succeeded).
+    """
+    leagues = list(League) if leagues is None else leagues
+    seasons = get_past_seasons(10) if seasons is None else seasons
+    client = client if client is not None else HttpClient(rate=1 / 6, cache=ResponseCache())
+    store = store if store is not None else DatasetStore()
+    history = history if history is not None else HistoryStore()
+    checkpoint = checkpoint if checkpoint is not None else Checkpoint()
+
+    # The most recent seasons first, alternating the leagues
+    jobs = [(league, season) for season in seasons for league in leagues if not checkpoint.is_done(league, season)]
+    print(f"{len(jobs)} seasons to backfill, {len(leagues) * len(seasons) - len(jobs)} already done")
+
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(backfill_season, league, season, client, store, history, base_url):
+                   (league, season) for league, season in jobs}
+
+        for i, future in enumerate(as_completed(futures)):
+            league, season = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                errors[league, season] = e
+                print(f"[{i + 1}/{len(jobs)}] {league.value} {season}: failed: {e}")
+                continue
+
+            checkpoint.mark_done(league, season)
+            print(f"[{i + 1}/{len(jobs)}] {league.value} {season}: done")
+
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leagues", nargs="*", choices=[league.value for league in League],
+                        help="The leagues to backfill (default: all).")
+    parser.add_argument("--seasons", type=int, default=10, help="The number of past seasons (default: 10).")
+    parser.add_argument("--workers", type=int, default=4, help="The number of threads (default: 4).")
+    parser.add_argument("--rate", type=float, default=1 / 6,
+                        help="The maximum number of requests per second (default: 1 every 6 seconds).")
+    parser.add_argument("--checkpoint", default="data/backfill.json", help="The path of the checkpoint.")
+    args = parser.parse_args()
+
+    leagues = [League(name) for name in args.leagues] if args.leagues else None
+    errors = backfill(leagues, get_past_seasons(args.seasons), client=HttpClient(rate=args.rate, cache=ResponseCache()),
+                      checkpoint=Checkpoint(args.checkpoint), max_workers=args.workers)
+    if errors:
+        print(f"{len(errors)} seasons failed, run the backfill again to retry them")
+
+
+if __name__ == "__main__":
+    main()
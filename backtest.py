@@ -0,0 +1,292 @@
+"""
+This file contains the walk-forward backtest of the betting strategies.
+
+The matches are replayed in chronological order: the goal models are retrained at a fixed interval
+on the matches played before, the 1X2 probabilities of the next matches are priced with the scoreline
+engine, and the bets are placed against the supplied odds with a staking rule.
+"""
+
+import pandas as pd
+import numpy as np
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+from training import DEFAULT_PARAMS, fit_model, get_param_combinations
+from scoreline import expected_goals, poisson_matrices
+
+
+ODDS_COLUMNS = ["odds_home", "odds_draw", "odds_away"]
+
+# Index of the outcomes in the probabilities and the odds
+HOME_WIN, DRAW, AWAY_WIN = 0, 1, 2
+
+DEFAULT_STAKING_GRID = {"staking": ["flat", "kelly"], "kelly_fraction": [0.25], "min_edge": [0.0, 0.05]}
+
+
+class BacktestResult(NamedTuple):
+    """
+    This class is used to store the result of a backtest.
+    """
+    bets: pd.DataFrame
+    metrics: dict
+    calibration: pd.DataFrame
+
+
+def load_odds(path: str) -> pd.DataFrame:
+    """
+    Loads an odds file: a csv with the Date ("%Y-%m-%d"), Domicile, Extérieur, odds_home, odds_draw
+    and odds_away columns.
+    """
+    return pd.read_csv(path, dtype={"Date": str, "Domicile": str, "Extérieur": str})
+
+
+def attach_odds(matches: pd.DataFrame, odds: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the odds to the matches, matching them on the date and the teams.
+    The matches without odds are kept with missing odds (no bet is placed on them).
+    """
+    keys = pd.DataFrame({"Date": matches["FullDate"].dt.strftime("%Y-%m-%d"),
+                         "Domicile": matches["Domicile"].astype(str),
+                         "Extérieur": matches["Extérieur"].astype(str)})
+    merged = keys.merge(odds[["Date", "Domicile", "Extérieur"] + ODDS_COLUMNS], how="left",
+                        on=["Date", "Domicile", "Extérieur"])
+    return matches.assign(**{column: merged[column].to_numpy() for column in ODDS_COLUMNS})
+
+
+def get_results(matches: pd.DataFrame) -> np.ndarray:
+    """
+    Returns the outcome of each match (HOME_WIN, DRAW or AWAY_WIN).
+    """
+    home = matches["domicile_but"].to_numpy()
+    away = matches["exterieur_but"].to_numpy()
+    return np.select([home > away, home == away], [HOME_WIN, DRAW], AWAY_WIN)
+
+
+def walk_forward_probabilities(matches: pd.DataFrame, features: list, retrain_days: int = 7,
+                               min_train_matches: int = 100, params: dict = None, rho: float = 0.0,
+                               max_goals: int = 10) -> np.ndarray:
+    """
+    Returns the 1X2 probabilities of the matches, each one predicted by models trained only on earlier matches.
+    The models are retrained every retrain_days days on all the matches played before.
+
+    Args:
+        matches (pd.DataFrame): The matches sorted by FullDate, with the features and the goals.
+        features (list): The feature columns (point-in-time features, e.g. from RollingFeatureEngine).
+        retrain_days (int, optional): The number of days between two trainings. Defaults to 7.
+        min_train_matches (int, optional): The number of matches before the first training. Defaults to 100.
+        params (dict, optional): The parameters of the goal models. Defaults to DEFAULT_PARAMS.
+        rho (float, optional): The Dixon-Coles dependence of the low scores. Defaults to 0.0.
+        max_goals (int, optional): The maximum number of goals of a team. Defaults to 10.
+
+    Returns:
+        np.ndarray: The probabilities, of shape (matches, 3), missing before the first training.
+    """
+    params = params if params is not None else DEFAULT_PARAMS
+    dates = matches["FullDate"].to_numpy()
+    X = matches[features].fillna(0)
+    probabilities = np.full((len(matches), 3), np.nan)
+
+    if len(matches) <= min_train_matches:
+        return probabilities
+
+    # Start of each training window
+    start = dates[min_train_matches]
+    boundaries = np.arange(start, dates[-1] + np.timedelta64(1, "ns"), np.timedelta64(retrain_days, "D"))
+    positions = np.searchsorted(dates, boundaries)
+
+    for begin, end in zip(positions, np.append(positions[1:], len(matches))):
+        if begin == end:
+            continue
+        X_train = X.iloc[:begin]
+        home_model = fit_model(X_train, matches["domicile_but"].iloc[:begin], params)
+        away_model = fit_model(X_train, matches["exterieur_but"].iloc[:begin], params)
+
+        X_window = X.iloc[begin:end]
+        matrices = poisson_matrices(expected_goals(home_model, X_window), expected_goals(away_model, X_window),
+                                    max_goals=max_goals, rho=rho)
+        # The home goals are the rows of the matrices
+        probabilities[begin:end, HOME_WIN] = np.tril(matrices, -1).sum(axis=(1, 2))
+        probabilities[begin:end, DRAW] = np.trace(matrices, axis1=1, axis2=2)
+        probabilities[begin:end, AWAY_WIN] = np.triu(matrices, 1).sum(axis=(1, 2))
+
+    return probabilities
+
+
+def apply_staking(probabilities: np.ndarray, odds: np.ndarray, results: np.ndarray, staking: str = "flat",
+                  kelly_fraction: float = 0.25, min_edge: float = 0.0, stake: float = 1.0,
+                  bankroll: float = 100.0, max_fraction: float = 0.05) -> pd.DataFrame:
+    """
+    Places the bets of a staking rule: on each match, the outcome with the best expected value
+    is backed when its edge (probability x odds - 1) is above min_edge. The bets are settled in order.
+
+    Args:
+        probabilities (np.ndarray): The 1X2 probabilities, of shape (matches, 3).
+        odds (np.ndarray): The 1X2 decimal odds, of shape (matches, 3).
+        results (np.ndarray): The outcome of each match.
+        staking (str, optional): "flat" (the same stake on every bet) or "kelly" (a fraction of the Kelly
+            stake of the current bankroll). Defaults to "flat".
+        kelly_fraction (float, optional): The fraction of the Kelly stake. Defaults to 0.25.
+        min_edge (float, optional): The minimum edge of a bet. Defaults to 0.0.
+        stake (float, optional): The stake of the flat bets. Defaults to 1.0.
+        bankroll (float, optional): The initial bankroll. Defaults to 100.0.
+        max_fraction (float, optional): The maximum fraction of the bankroll of a Kelly bet. Defaults to 0.05.
+
+    Returns:
+        pd.DataFrame: One row per match with the outcome backed (-1 for no bet), the stake, the profit
+            and the bankroll after the match.
+    """
+    edges = np.nan_to_num(probabilities * odds - 1, nan=-np.inf)
+    outcome = edges.argmax(axis=1)
+    rows = np.arange(len(outcome))
+    edge = edges[rows, outcome]
+    bet = edge > min_edge
+
+    price = odds[rows, outcome]
+    won = results == outcome
+    # Return of one unit staked
+    returns = np.where(bet, np.where(won, price - 1, -1.0), 0.0)
+
+    if staking == "flat":
+        stakes = np.where(bet, stake, 0.0)
+        profits = stakes * returns
+        equity = bankroll + np.cumsum(profits)
+    elif staking == "kelly":
+        fractions = np.where(bet, np.clip(kelly_fraction * edge / np.where(bet, price - 1, 1), 0, max_fraction), 0)
+        equity = bankroll * np.cumprod(1 + fractions * returns)
+        before = np.concatenate([[bankroll], equity[:-1]])
+        stakes = fractions * before
+        profits = equity - before
+    else:
+        raise ValueError(f"Unknown staking: {staking}")
+
+    return pd.DataFrame({"outcome": np.where(bet, outcome, -1), "edge": np.where(bet, edge, np.nan),
+                         "odds": np.where(bet, price, np.nan), "stake": stakes, "profit": profits,
+                         "bankroll": equity})
+
+
+def evaluate(bets: pd.DataFrame, probabilities: np.ndarray, results: np.ndarray, bankroll: float = 100.0,
+             bins: int = 10) -> tuple:
+    """
+    Returns the metrics of the bets (ROI, drawdown, ...) and of the probabilities (Brier score, log loss),
+    and the calibration table of the probabilities.
+
+    Args:
+        bets (pd.DataFrame): The bets (see apply_staking).
+        probabilities (np.ndarray): The 1X2 probabilities, of shape (matches, 3).
+        results (np.ndarray): The outcome of each match.
+        bankroll (float, optional): The initial bankroll. Defaults to 100.0.
+        bins (int, optional): The number of probability bins of the calibration. Defaults to 10.
+
+    Returns:
+        tuple: The metrics and the calibration table.
+    """
+    staked = bets["stake"].sum()
+    equity = np.concatenate([[bankroll], bets["bankroll"].to_numpy()])
+    peaks = np.maximum.accumulate(equity)
+    placed = bets["outcome"].to_numpy() >= 0
+
+    priced = ~np.isnan(probabilities).any(axis=1)
+    observed = np.eye(3)[results[priced]]
+    predicted = probabilities[priced]
+
+    metrics = {
+        "bets": int(placed.sum()),
+        "staked": float(staked),
+        "profit": float(bets["profit"].sum()),
+        "roi": float(bets["profit"].sum() / staked) if staked else np.nan,
+        "hit_rate": float((bets["outcome"].to_numpy() == results)[placed].mean()) if placed.any() else np.nan,
+        "max_drawdown": float(((peaks - equity) / peaks).max()),
+        "final_bankroll": float(equity[-1]),
+        "brier": float(((predicted - observed) ** 2).sum(axis=1).mean()) if priced.any() else np.nan,
+        "log_loss": float(-np.log(np.clip((predicted * observed).sum(axis=1), 1e-15, 1)).mean())
+        if priced.any() else np.nan,
+    }
+
+    bin_index = np.minimum((predicted.ravel() * bins).astype(int), bins - 1)
+    calibration = pd.DataFrame({"bin": bin_index, "predicted": predicted.ravel(), "observed": observed.ravel()}) \
+        .groupby("bin").agg(predicted=("predicted", "mean"), observed=("observed", "mean"),
+                            count=("observed", "size"))
+
+    return metrics, calibration
+
+
+def backtest(matches: pd.DataFrame, features: list, retrain_days: int = 7, min_train_matches: int = 100,
+             params: dict = None, rho: float = 0.0, staking: str = "flat", kelly_fraction: float = 0.25,
+             min_edge: float = 0.0, bankroll: float = 100.0) -> BacktestResult:
+    """
+    Replays the matches chronologically and bets on them with a staking rule.
+
+    Args:
+        matches (pd.DataFrame): The matches with the features, the goals and the odds (see attach_odds).
+        features (list): The feature columns.
+        retrain_days (int, optional): The number of days between two trainings. Defaults to 7.
+        min_train_matches (int, optional): The number of matches before the first training. Defaults to 100.
+        params (dict, optional): The parameters of the goal models. Defaults to DEFAULT_PARAMS.
+        rho (float, optional): The Dixon-Coles dependence of the low scores. Defaults to 0.0.
+        staking (str, optional): "flat" or "kelly". Defaults to "flat".
+        kelly_fraction (float, optional): The fraction of the Kelly stake. Defaults to 0.25.
+        min_edge (float, optional): The minimum edge of a bet. Defaults to 0.0.
+        bankroll (float, optional): The initial bankroll. Defaults to 100.0.
+
+    Returns:
+        BacktestResult: The bets, the metrics and the calibration table.
+    """
+    matches = matches.sort_values("FullDate", kind="stable").reset_index(drop=True)
+    probabilities = walk_forward_probabilities(matches, features, retrain_days=retrain_days,
+                                               min_train_matches=min_train_matches, params=params, rho=rho)
+    results = get_results(matches)
+
+    bets = apply_staking(probabilities, matches[ODDS_COLUMNS].to_numpy(dtype=np.float64), results,
+                         staking=staking, kelly_fraction=kelly_fraction, min_edge=min_edge, bankroll=bankroll)
+    metrics, calibration = evaluate(bets, probabilities, results, bankroll=bankroll)
+
+    bets = pd.concat([matches[["FullDate", "Domicile", "Extérieur"]], bets], axis=1)
+    return BacktestResult(bets, metrics, calibration)
+
+
+def _sweep_predictions(matches: pd.DataFrame, features: list, prediction: dict, staking_combinations: list,
+                       bankroll: float) -> list:
+    """
+    Computes the walk-forward probabilities of one prediction setting, then evaluates all the staking rules on them.
+    """
+    probabilities = walk_forward_probabilities(matches, features, **prediction)
+    results = get_results(matches)
+    odds = matches[ODDS_COLUMNS].to_numpy(dtype=np.float64)
+
+    rows = []
+    for staking in staking_combinations:
+        bets = apply_staking(probabilities, odds, results, bankroll=bankroll, **staking)
+        metrics, _ = evaluate(bets, probabilities, results, bankroll=bankroll)
+        rows.append({**prediction, **staking, **metrics})
+    return rows
+
+
+def sweep(matches: pd.DataFrame, features: list, prediction_grid: dict = None, staking_grid: dict = None,
+          bankroll: float = 100.0, max_workers: int = None) -> pd.DataFrame:
+    """
+    Backtests every combination of the grids in a process pool. The walk-forward predictions, which need the
+    trainings, are computed once per prediction setting and shared by all the staking rules.
+
+    Args:
+        matches (pd.DataFrame): The matches with the features, the goals and the odds (see attach_odds).
+        features (list): The feature columns.
+        prediction_grid (dict, optional): The values of the walk_forward_probabilities arguments
+            (retrain_days, min_train_matches, params, rho). Defaults to the default arguments.
+        staking_grid (dict, optional): The values of the apply_staking arguments. Defaults to DEFAULT_STAKING_GRID.
+        bankroll (float, optional): The initial bankroll. Defaults to 100.0.
+        max_workers (int, optional): The number of processes. Defaults to the number of CPUs.
+
+    Returns:
+        pd.DataFrame: The settings and the metrics of each combination, sorted by ROI.
+    """
+    matches = matches.sort_values("FullDate", kind="stable").reset_index(drop=True)
+    predictions = get_param_combinations(prediction_grid or {})
+    staking_combinations = get_param_combinations(staking_grid or DEFAULT_STAKING_GRID)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_sweep_predictions, matches, features, prediction, staking_combinations, bankroll)
+                   for prediction in predictions]
+        rows = list(itertools.chain.from_iterable(future.result() for future in futures))
+
+    return pd.DataFrame(rows).sort_values("roi", ascending=False, ignore_index=True)
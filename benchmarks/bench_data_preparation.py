@@ -0,0 +1,80 @@
+"""
+This file benchmarks the preparation of the schedule on a synthetic multi-season schedule,
+comparing add_fulldate_column + get_finished_matches + add_goals_column with prepare_schedule.
+
+Usage:
+    python benchmarks/bench_data_preparation.py [--matches N] [--repeat N]
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from data_preparation import add_fulldate_column, get_finished_matches, add_goals_column, prepare_schedule
+from fbref_fixtures import generate_schedule_frame
+
+
+# After the end of the synthetic schedule, so that all the matches are finished
+AS_OF = datetime.datetime(2500, 1, 1)
+
+
+def legacy_prepare(df):
+    """
+    Prepares the schedule with the column functions, as in the notebooks.
+    """
+    df = add_fulldate_column(df.copy())
+    df = get_finished_matches(df, now=AS_OF)
+    df = add_goals_column(df)
+    return df[['FullDate', 'Domicile', 'Extérieur', 'domicile_but', 'exterieur_but']]
+
+
+def measure(function, df, repeat: int) -> dict:
+    """
+    Measures the best time, the peak memory and the size of the result of a preparation.
+    """
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function(df)
+        times.append(perf_counter() - start)
+
+    tracemalloc.start()
+    result = function(df)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"time": min(times), "peak": peak, "size": result.memory_usage(deep=True).sum(), "rows": len(result)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--matches", type=int, default=100_000, help="Number of matches of the schedule")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs of each preparation")
+    args = parser.parse_args()
+
+    # The column functions fail on malformed scores, so they are compared on a clean schedule
+    df = generate_schedule_frame(args.matches)
+    legacy = measure(legacy_prepare, df, args.repeat)
+    typed = measure(lambda df: prepare_schedule(df, as_of=AS_OF), df, args.repeat)
+
+    print(f"{'preparation':<20}{'rows':>10}{'time (ms)':>12}{'peak (MB)':>12}{'result (MB)':>14}")
+    for label, result in (("column functions", legacy), ("prepare_schedule", typed)):
+        print(f"{label:<20}{result['rows']:>10}{result['time'] * 1000:>12.1f}"
+              f"{result['peak'] / 2 ** 20:>12.2f}{result['size'] / 2 ** 20:>14.2f}")
+    print(f"{'speedup':<20}{'':>10}{legacy['time'] / typed['time']:>11.1f}x"
+          f"{legacy['peak'] / typed['peak']:>11.1f}x{legacy['size'] / typed['size']:>13.1f}x")
+
+    # prepare_schedule masks the malformed scores instead of failing
+    malformed = measure(lambda df: prepare_schedule(df, as_of=AS_OF),
+                        generate_schedule_frame(args.matches, malformed=0.01), args.repeat)
+    print(f"{'1% malformed':<20}{malformed['rows']:>10}{malformed['time'] * 1000:>12.1f}"
+          f"{malformed['peak'] / 2 ** 20:>12.2f}{malformed['size'] / 2 ** 20:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+This file benchmarks the extraction of the tables of fbref pages,
+comparing the previous BeautifulSoup loop with table_extractor.
+
+Usage:
+    python benchmarks/bench_table_extraction.py [saved pages...] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from table_extractor import extract_tables
+from fbref_fixtures import generate_schedule_page, generate_statistics_page
+
+
+def legacy_extract_tables(content: str) -> list:
+    """
+    Extracts the tables the way FootballScrapper.get_data did before table_extractor.
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    dfs = []
+    for table in soup.find_all('table'):
+        data_rows = []
+        for row in table.find_all('tr'):
+            data_row = []
+            for td in row.find_all(['td', 'th']):
+                colspan = int(td.get('colspan', 1))
+                cell_text = td.text.strip()
+                for _ in range(colspan):
+                    data_row.append(cell_text)
+            data_rows.append(data_row)
+        dfs.append(pd.DataFrame(data_rows))
+    return dfs
+
+
+def measure(function, content: str, repeat: int) -> dict:
+    """
+    Measures the best time, the peak memory and the size of the dataframes of an extraction.
+    """
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function(content)
+        times.append(perf_counter() - start)
+
+    tracemalloc.start()
+    result = function(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    dfs = [table.data if hasattr(table, "data") else table for table in result]
+    size = sum(df.memory_usage(deep=True).sum() for df in dfs)
+
+    return {"time": min(times), "peak": peak, "size": size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*", help="Saved fbref pages (synthetic pages are used if none is given)")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs of each extraction")
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = {}
+        for path in args.pages:
+            with open(path, encoding="utf-8") as file:
+                pages[os.path.basename(path)] = file.read()
+    else:
+        pages = {"schedule (synthetic)": generate_schedule_page(),
+                 "statistics (synthetic)": generate_statistics_page()}
+
+    print(f"{'page':<28}{'extractor':<12}{'time (ms)':>12}{'peak (MB)':>12}{'frames (MB)':>14}")
+    for name, content in pages.items():
+        legacy = measure(legacy_extract_tables, content, args.repeat)
+        typed = measure(extract_tables, content, args.repeat)
+
+        for label, result in (("legacy", legacy), ("lxml", typed)):
+            print(f"{name:<28}{label:<12}{result['time'] * 1000:>12.1f}"
+                  f"{result['peak'] / 2 ** 20:>12.2f}{result['size'] / 2 ** 20:>14.2f}")
+        print(f"{name:<28}{'speedup':<12}{legacy['time'] / typed['time']:>11.1f}x"
+              f"{legacy['peak'] / typed['peak']:>11.1f}x{legacy['size'] / typed['size']:>13.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+This file contains the generation of synthetic pages shaped like the fbref schedule and statistics pages.
+They are used by the benchmarks when no recorded page is given, along with synthetic schedules.
+"""
+
+import random
+
+import numpy as np
+import pandas as pd
+
+
+TEAMS = ["Arsenal", "Aston Villa", "Bournemouth", "Brentford", "Brighton", "Burnley", "Chelsea",
+         "Crystal Palace", "Everton", "Fulham", "Liverpool", "Luton Town", "Manchester City",
+         "Manchester Utd", "Newcastle Utd", "Nott'ham Forest", "Sheffield Utd", "Tottenham",
+         "West Ham", "Wolves"]
+
+SCHEDULE_COLUMNS = ["Sem.", "Jour", "Date", "Heure", "Domicile", "xG", "Score", "xG", "Extérieur",
+                    "Affluence", "Lieu", "Arbitre", "Rapport de match", "Notes"]
+
+
+def generate_schedule_page(teams: list = TEAMS, seed: int = 0) -> str:
+    """
+    Generates a page with a schedule table of a double round-robin season.
+
+    Args:
+        teams (list, optional): The names of the teams. Defaults to TEAMS.
+        seed (int, optional): The seed of the random generator. Defaults to 0.
+
+    Returns:
+        str: The HTML content of the page.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for week, (home, away) in enumerate((h, a) for h in teams for a in teams if h != a):
+        # The repeated headers and the spacer rows of fbref
+        if week % 10 == 0 and week:
+            rows.append('<tr class="thead">' + "".join(f"<th>{c}</th>" for c in SCHEDULE_COLUMNS) + "</tr>")
+            rows.append('<tr class="spacer">' + "<td></td>" * len(SCHEDULE_COLUMNS) + "</tr>")
+        day = 1 + week % 28
+        cells = [f'<th data-stat="gameweek">{1 + week // 10}</th>', "<td>Sam.</td>",
+                 f'<td><a href="/fr/matchs/{week}">2023-{8 + week // 120:02d}-{day:02d}</a></td>',
+                 '<td><span class="venuetime">15:00</span></td>', f'<td><a href="#">{home}</a></td>',
+                 f"<td>{rng.uniform(0, 3):.1f}</td>", f"<td>{rng.randint(0, 4)}–{rng.randint(0, 4)}</td>",
+                 f"<td>{rng.uniform(0, 3):.1f}</td>", f'<td><a href="#">{away}</a></td>',
+                 f"<td>{rng.randint(10, 75)},{rng.randint(100, 999)}</td>", "<td>Stadium</td>",
+                 "<td>Referee</td>", '<td><a href="#">Rapport de match</a></td>', "<td></td>"]
+        rows.append("<tr>" + "".join(cells) + "</tr>")
+
+    header = "<tr>" + "".join(f"<th>{c}</th>" for c in SCHEDULE_COLUMNS) + "</tr>"
+    return ('<html><head><meta charset="utf-8"></head><body>'
+            '<table id="sched_2023-2024_9_1"><caption>Calendrier et résultats 2023-2024 Premier League</caption>'
+            f"<thead>{header}</thead><tbody>{''.join(rows)}</tbody></table></body></html>")
+
+
+def generate_statistics_page(teams: list = TEAMS, n_tables: int = 24, n_columns: int = 24, seed: int = 0) -> str:
+    """
+    Generates a page with statistics tables having an over header, alternating "for" and "against" tables.
+
+    Args:
+        teams (list, optional): The names of the teams. Defaults to TEAMS.
+        n_tables (int, optional): The number of tables. Defaults to 24.
+        n_columns (int, optional): The number of statistics columns of each table. Defaults to 24.
+        seed (int, optional): The seed of the random generator. Defaults to 0.
+
+    Returns:
+        str: The HTML content of the page.
+    """
+    rng = random.Random(seed)
+    tables = []
+    for i in range(n_tables):
+        against = i % 2 == 1
+        over_header = ('<tr class="over_header"><th colspan="2"></th>'
+                       f'<th colspan="{n_columns // 2}">Performance</th>'
+                       f'<th colspan="{n_columns - n_columns // 2}">Par 90 minutes</th></tr>')
+        names = [f"Stat{c % (n_columns // 2)}" for c in range(n_columns)]
+        header = "<tr><th>Équipe</th><th># JC</th>" + "".join(f"<th>{n}</th>" for n in names) + "</tr>"
+
+        rows = []
+        for team in teams:
+            name = f"vs {team}" if against else team
+            values = "".join(f"<td>{rng.uniform(0, 100):.2f}</td>" for _ in range(n_columns))
+            rows.append(f'<tr><th><a href="#">{name}</a></th><td>{rng.randint(20, 30)}</td>{values}</tr>')
+
+        tables.append(f'<table id="stats_squads_{i}"><caption>Table {i}</caption>'
+                      f"<thead>{over_header}{header}</thead><tbody>{''.join(rows)}</tbody></table>")
+
+    return f'<html><head><meta charset="utf-8"></head><body>{"".join(tables)}</body></html>'
+
+
+def generate_schedule_frame(n_matches: int = 100_000, n_teams: int = 20, malformed: float = 0.0,
+                            seed: int = 0) -> pd.DataFrame:
+    """
+    Generates a multi-season schedule as read from the csv files (text columns).
+
+    Args:
+        n_matches (int, optional): The number of matches. Defaults to 100_000.
+        n_teams (int, optional): The number of teams of a league. Defaults to 20.
+        malformed (float, optional): The ratio of postponed or forfeit matches. Defaults to 0.0.
+        seed (int, optional): The seed of the random generator. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: The schedule, with the matches of a season spread over a year.
+    """
+    rng = np.random.default_rng(seed)
+    matches_per_season = n_teams * (n_teams - 1)
+
+    season = np.arange(n_matches) // matches_per_season
+    day = (np.arange(n_matches) % matches_per_season) * 280 // matches_per_season
+    dates = (np.datetime64("2000-08-10") + season * 365 + day).astype(str)
+
+    teams = np.array(TEAMS + [f"Team {i}" for i in range(max(n_teams - len(TEAMS), 0))])[:n_teams]
+    home = rng.integers(0, n_teams, n_matches)
+    away = (home + rng.integers(1, n_teams, n_matches)) % n_teams
+
+    scores = (pd.Series(rng.poisson(1.5, n_matches)).astype(str) + "–"
+              + pd.Series(rng.poisson(1.2, n_matches)).astype(str))
+    if malformed:
+        postponed = rng.random(n_matches) < malformed
+        scores[postponed] = rng.choice(["Reporté", "", "3–0 (forfait)"], postponed.sum())
+
+    return pd.DataFrame({
+        "Date": dates,
+        "Heure": rng.choice(["13:30", "15:00", "17:30", "20:00", "21:00"], n_matches),
+        "Domicile": teams[home],
+        "Score": scores,
+        "Extérieur": teams[away],
+    })
@@ -0,0 +1,249 @@
+"""
+This file runs the benchmark suite of the pipeline: every stage (parsing, preparation, merge, features,
+prediction) on synthetic fbref pages and multi-season schedules at several scales, and the parsing of
+recorded fbref pages, fully offline.
+
+The throughput, the latency and the peak memory of each stage are saved as json, and compared with
+a previous run: the stages slower than the baseline by more than the threshold are flagged as regressions
+(and the exit code is 1).
+
+Usage:
+    python benchmarks/run.py [--scales 1x1,5x5,20x5] [--repeat 3] [--output results.json]
+                             [--baseline previous.json] [--threshold 0.2] [--recorded DIR]
+    python benchmarks/run.py --compare previous.json results.json [--threshold 0.2]
+
+A scale "SxL" is S seasons of L leagues. The parse_recorded stage parses the fbref pages of the --recorded
+directory (by default the sanitized pages of benchmarks/fixtures, see its README), with their commented tables. The cli_startup stage runs `python guru.py predict --help`,
+which must stay under STARTUP_TARGET seconds (the exit code is 1 otherwise).
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tracemalloc
+from statistics import median
+from time import perf_counter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingClassifier
+
+from table_extractor import extract_tables
+from data_preparation import prepare_schedule, merge_statistics_to_match_schedule
+from rolling_features import RollingFeatureEngine
+from team_index import TeamFeatureIndex
+from scoreline import price_fixtures
+from fbref_fixtures import TEAMS, generate_schedule_page, generate_statistics_page, generate_schedule_frame
+from bench_data_preparation import legacy_prepare, AS_OF
+
+
+MATCHES_PER_SEASON = len(TEAMS) * (len(TEAMS) - 1)
+
+# Maximum start time of the command line, in seconds
+STARTUP_TARGET = 0.2
+
+# Directory of the recorded fbref pages parsed by default
+RECORDED_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def parse_scales(text: str) -> list:
+    """
+    Returns the (seasons, leagues) of the scales (e.g. "1x1,20x5" -> [(1, 1), (20, 5)]).
+    """
+    return [tuple(int(value) for value in scale.split("x")) for scale in text.split(",")]
+
+
+def build_context(seasons: int, leagues: int, recorded: str = None) -> dict:
+    """
+    Builds the inputs of the stages at a scale. Nothing here is timed.
+    """
+    n_pages = seasons * leagues
+    schedule = generate_schedule_frame(n_pages * MATCHES_PER_SEASON, n_teams=len(TEAMS))
+    statistics_page = generate_statistics_page(TEAMS)
+    statistics = extract_tables(statistics_page)[0].data
+
+    legacy = legacy_prepare(schedule)
+    prepared = prepare_schedule(schedule, as_of=AS_OF)
+    index = TeamFeatureIndex.from_statistics(statistics)
+    X = index.get_matchup_features(prepared["Domicile"], prepared["Extérieur"])
+
+    # A small goal model, enough to time the prediction
+    sample = X.iloc[:2000]
+    model = GradientBoostingClassifier(n_estimators=20, max_depth=1, random_state=42) \
+        .fit(sample, prepared["domicile_but"].iloc[:2000].clip(upper=4))
+
+    return {
+        "pages": n_pages,
+        "schedule_page": generate_schedule_page(TEAMS),
+        "statistics_page": statistics_page,
+        "recorded": [open(path, encoding="utf-8").read() for path in sorted(glob.glob(os.path.join(recorded, "*.html")))]
+        if recorded else [],
+        "schedule": schedule,
+        "legacy": legacy,
+        "prepared": prepared,
+        "statistics": statistics,
+        "index": index,
+        "X": X,
+        "model": model,
+    }
+
+
+def parse_pages(content: str, n_pages: int) -> int:
+    return sum(len(table.data) for _ in range(n_pages) for table in extract_tables(content))
+
+
+def start_cli(*arguments) -> int:
+    subprocess.run([sys.executable, os.path.join(ROOT, "guru.py"), *arguments], stdout=subprocess.DEVNULL, check=True)
+    return 1
+
+
+# Stages of the pipeline: name -> function of the context returning the number of rows processed
+STAGES = {
+    "parse_schedule": lambda context: parse_pages(context["schedule_page"], context["pages"]),
+    "parse_statistics": lambda context: parse_pages(context["statistics_page"], context["pages"]),
+    "parse_recorded": lambda context: sum(len(table.data) for content in context["recorded"]
+                                          for table in extract_tables(content, include_commented=True)),
+    "prepare_legacy": lambda context: len(legacy_prepare(context["schedule"])),
+    "prepare_schedule": lambda context: len(prepare_schedule(context["schedule"], as_of=AS_OF)),
+    "merge_statistics": lambda context: len(merge_statistics_to_match_schedule(context["legacy"],
+                                                                               context["statistics"])),
+    "rolling_features": lambda context: len(RollingFeatureEngine().fit(context["prepared"])),
+    "matchup_features": lambda context: len(context["index"].get_matchup_features(context["prepared"]["Domicile"],
+                                                                                  context["prepared"]["Extérieur"])),
+    "predict": lambda context: len(price_fixtures(context["X"], context["model"], context["model"])),
+    "cli_startup": lambda context: start_cli("predict", "--help"),
+}
+
+
+def measure(stage, context: dict, repeat: int) -> dict:
+    """
+    Measures the median and best time of a stage, then its peak memory in a separate traced run.
+    """
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        rows = stage(context)
+        times.append(perf_counter() - start)
+
+    tracemalloc.start()
+    stage(context)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"rows": rows, "median_s": median(times), "min_s": min(times),
+            "throughput": rows / median(times) if median(times) else None, "peak_mb": peak / 2 ** 20}
+
+
+def run(scales: list, repeat: int, recorded: str = RECORDED_DIRECTORY, stages: list = None) -> dict:
+    """
+    Runs the stages at every scale.
+
+    Returns:
+        dict: The environment of the run and the measures of each (stage, scale).
+    """
+    stages = stages if stages is not None else [name for name in STAGES if name != "parse_recorded" or recorded]
+    results = []
+    for seasons, leagues in scales:
+        context = build_context(seasons, leagues, recorded)
+        for name in stages:
+            result = measure(STAGES[name], context, repeat)
+            results.append({"stage": name, "scale": f"{seasons}x{leagues}", **result})
+            print(f"{name:<20}{seasons:>3}x{leagues:<3}{result['rows']:>10}{result['median_s'] * 1000:>12.1f}"
+                  f"{(result['throughput'] or 0):>14.0f}{result['peak_mb']:>11.1f}")
+
+    return {
+        "environment": {"date": datetime.datetime.now().isoformat(timespec="seconds"),
+                        "python": platform.python_version(), "platform": platform.platform(),
+                        "pandas": pd.__version__, "numpy": np.__version__, "repeat": repeat},
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.2) -> list:
+    """
+    Compares two runs and prints the ratio of the median times of each (stage, scale) of both.
+
+    Args:
+        baseline (dict): The previous run.
+        current (dict): The new run.
+        threshold (float, optional): The slowdown above which a stage is a regression. Defaults to 0.2 (20%).
+
+    Returns:
+        list: The (stage, scale) pairs that regressed.
+    """
+    previous = {(result["stage"], result["scale"]): result for result in baseline["results"]}
+    regressions = []
+
+    print(f"\n{'stage':<20}{'scale':<7}{'baseline (ms)':>15}{'current (ms)':>14}{'ratio':>8}")
+    for result in current["results"]:
+        key = (result["stage"], result["scale"])
+        if key not in previous:
+            continue
+        ratio = result["median_s"] / previous[key]["median_s"]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key[0]:<20}{key[1]:<7}{previous[key]['median_s'] * 1000:>15.1f}{result['median_s'] * 1000:>14.1f}"
+              f"{ratio:>7.2f}x{flag}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1x1,5x5,20x5", help="Scales as SEASONSxLEAGUES, comma separated")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs of each stage")
+    parser.add_argument("--stages", nargs="*", choices=list(STAGES), help="Stages to run (default: all)")
+    parser.add_argument("--recorded", default=RECORDED_DIRECTORY,
+                        help="Directory of recorded fbref pages (*.html) to parse (default: benchmarks/fixtures, "
+                             "an empty value skips them)")
+    parser.add_argument("--output", help="Path of the json results")
+    parser.add_argument("--baseline", help="Path of the json results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown ratio flagged as a regression")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two saved runs")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as file:
+            baseline = json.load(file)
+        with open(args.compare[1], encoding="utf-8") as file:
+            current = json.load(file)
+        sys.exit(1 if compare(baseline, current, args.threshold) else 0)
+
+    print(f"{'stage':<20}{'scale':<7}{'rows':>9}{'median (ms)':>12}{'rows/s':>14}{'peak (MB)':>11}")
+    current = run(parse_scales(args.scales), args.repeat, recorded=args.recorded, stages=args.stages)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(current, file, indent=2)
+
+    failed = False
+    startup = [result["median_s"] for result in current["results"] if result["stage"] == "cli_startup"]
+    if startup and max(startup) > STARTUP_TARGET:
+        print(f"The command line starts in {max(startup) * 1000:.0f} ms, above the target of "
+              f"{STARTUP_TARGET * 1000:.0f} ms")
+        failed = True
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions above {args.threshold:.0%}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
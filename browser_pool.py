@@ -0,0 +1,217 @@
+"""
+This file contains the pool of headless browser pages used to render the javascript pages (ESPN tables,
+team results) before their extraction.
+
+Unlike AsyncChromiumLoader, which launches and closes a browser for every call, the pool keeps one browser
+running in a background event loop and renders the pages of all the calls in parallel.
+"""
+
+import asyncio
+import threading
+from time import perf_counter
+
+from langchain.schema import Document
+from playwright.async_api import async_playwright
+
+
+# Resources that are not needed to read the tables of a page
+BLOCKED_RESOURCES = ("image", "font", "stylesheet", "media")
+
+
+class BrowserPool:
+    """
+    This class is used to render pages with a long-lived headless browser. The number of pages open
+    at the same time is bounded, the images, fonts and stylesheets are not downloaded, every page has
+    a timeout, and the browser contexts are replaced after a number of pages to cap the memory.
+
+    The browser runs in its own event loop thread, so the pool can be used from synchronous code (load)
+    and from any event loop (load_async).
+    """
+    def __init__(self, max_pages: int = 4, pages_per_context: int = 50, timeout: float = 30,
+                 blocked_resources: tuple = BLOCKED_RESOURCES, wait_until: str = "domcontentloaded",
+                 wait_for_selector: str = None, headless: bool = True):
+        """
+        Args:
+            max_pages (int, optional): The maximum number of pages rendered at the same time. Defaults to 4.
+            pages_per_context (int, optional): The number of pages after which a context is replaced.
+                Defaults to 50.
+            timeout (float, optional): The number of seconds to render a page. Defaults to 30.
+            blocked_resources (tuple, optional): The resource types that are not downloaded.
+                Defaults to BLOCKED_RESOURCES.
+            wait_until (str, optional): The event that ends the navigation. Defaults to "domcontentloaded".
+            wait_for_selector (str, optional): A selector to wait for after the navigation (e.g. "table").
+                Defaults to None.
+            headless (bool, optional): Whether to run the browser without window. Defaults to True.
+        """
+        self.max_pages = max_pages
+        self.pages_per_context = pages_per_context
+        self.timeout = timeout
+        self.blocked_resources = set(blocked_resources)
+        self.wait_until = wait_until
+        self.wait_for_selector = wait_for_selector
+        self.headless = headless
+
+        self.loop = None
+        self.thread = None
+        self.playwright = None
+        self.browser = None
+        self.semaphore = None
+        self.lock = None
+
+        # Current context, number of pages it rendered and number of pages it has open
+        self.context = None
+        self.context_pages = 0
+        self.open_pages = {}
+        self.rendered = 0
+        self.contexts_created = 0
+
+    def start(self):
+        """
+        Starts the event loop thread and launches the browser.
+        """
+        if self.loop is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="browser-pool", daemon=True)
+        self.thread.start()
+        self._run(self._start())
+
+    def close(self):
+        """
+        Closes the browser and stops the event loop thread.
+        """
+        if self.loop is None:
+            return
+        self._run(self._close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def load(self, urls: list) -> list:
+        """
+        Renders pages in parallel.
+
+        Args:
+            urls (list): The URLs of the pages (file:// URLs are supported).
+
+        Returns:
+            list: The Document of each page, in the order of the URLs. The content of a page that failed
+                is empty and its error is in the metadata.
+        """
+        self.start()
+        return self._run(self._load(urls))
+
+    async def load_async(self, urls: list) -> list:
+        """
+        Renders pages in parallel from another event loop (see load).
+        """
+        self.start()
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._load(urls), self.loop))
+
+    def stats(self) -> dict:
+        """
+        Returns the number of pages rendered and of contexts created.
+        """
+        return {"pages": self.rendered, "contexts": self.contexts_created}
+
+    def _run(self, coroutine):
+        """
+        Runs a coroutine in the event loop of the pool and waits for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _start(self):
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=self.headless)
+        self.semaphore = asyncio.Semaphore(self.max_pages)
+        self.lock = asyncio.Lock()
+
+    async def _close(self):
+        if self.browser is not None:
+            await self.browser.close()
+        if self.playwright is not None:
+            await self.playwright.stop()
+        self.browser = None
+        self.playwright = None
+        self.context = None
+
+    async def _load(self, urls: list) -> list:
+        return await asyncio.gather(*(self._render(url) for url in urls))
+
+    async def _render(self, url: str) -> Document:
+        """
+        Renders one page in a page of the current context.
+        """
+        async with self.semaphore:
+            context = await self._get_context()
+            start = perf_counter()
+            page = None
+            try:
+                page = await context.new_page()
+                page.set_default_timeout(self.timeout * 1000)
+                await page.goto(url, wait_until=self.wait_until, timeout=self.timeout * 1000)
+                if self.wait_for_selector is not None:
+                    await page.wait_for_selector(self.wait_for_selector, timeout=self.timeout * 1000)
+                content = await page.content()
+                metadata = {"source": url, "seconds": perf_counter() - start}
+            except Exception as e:
+                print(f"Error rendering {url}: {e}")
+                content = ""
+                metadata = {"source": url, "seconds": perf_counter() - start, "error": str(e)}
+            finally:
+                if page is not None:
+                    await page.close()
+                await self._release_context(context)
+
+            self.rendered += 1
+            return Document(page_content=content, metadata=metadata)
+
+    async def _get_context(self):
+        """
+        Returns the context of the next page, creating a new context when the current one rendered
+        pages_per_context pages.
+        """
+        async with self.lock:
+            if self.context is None or self.context_pages >= self.pages_per_context:
+                previous = self.context
+                self.context = await self.browser.new_context()
+                await self.context.route("**/*", self._route)
+                self.context_pages = 0
+                self.open_pages[self.context] = 0
+                self.contexts_created += 1
+
+                # The previous context is closed now if it has no open page, else by its last page
+                if previous is not None and self.open_pages.get(previous) == 0:
+                    del self.open_pages[previous]
+                    await previous.close()
+
+            self.context_pages += 1
+            self.open_pages[self.context] += 1
+            return self.context
+
+    async def _release_context(self, context):
+        """
+        Marks a page of the context as closed, and closes the context if it was replaced and has no open page.
+        """
+        async with self.lock:
+            self.open_pages[context] -= 1
+            if context is not self.context and self.open_pages[context] == 0:
+                del self.open_pages[context]
+                await context.close()
+
+    async def _route(self, route):
+        """
+        Aborts the requests of the blocked resources.
+        """
+        if route.request.resource_type in self.blocked_resources:
+            await route.abort()
+        else:
+            await route.continue_()
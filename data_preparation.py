@@ -3,7 +3,11 @@ This file contains functions that are used to prepare the data for analysis.
 """
 
 import pandas as pd
+import numpy as np
 import datetime
+from typing import Callable, Union
+
+from instrumentation import Stage
 
 def add_fulldate_column(df: pd.DataFrame, date_column: str = "Date", time_column: str = "Heure") -> pd.DataFrame:
     """
@@ -18,22 +22,27 @@ def add_fulldate_column(df: pd.DataFrame, date_column: str = "Date", time_column
         pd.DataFrame: The dataframe with the new column.
     """
 
-    df['FullDate'] = pd.to_datetime(df[date_column] + " " + df[time_column], format='%Y-%m-%d %H:%M')
+    # Note: the columns can be categorical, so they are converted to strings before being concatenated.
+    df['FullDate'] = pd.to_datetime(df[date_column].astype("string") + " " + df[time_column].astype("string"),
+                                    format='%Y-%m-%d %H:%M')
     return df
 
-def get_finished_matches(df: pd.DataFrame) -> pd.DataFrame:
+def get_finished_matches(df: pd.DataFrame, now: datetime.datetime = None) -> pd.DataFrame:
     """
     Returns a dataframe with only the finished matches.
 
     Args:
         df (pd.DataFrame): The dataframe to filter.
+        now (datetime.datetime, optional): The current time. Defaults to datetime.datetime.now().
 
     Returns:
         pd.DataFrame: The filtered dataframe.
     """
 
+    now = now if now is not None else datetime.datetime.now()
+
     # Note: We remove 3 hours because the matches are not updated immediately.
-    df = df[df['FullDate'] < datetime.datetime.now() - datetime.timedelta(hours=3)]
+    df = df[df['FullDate'] < now - datetime.timedelta(hours=3)]
     return df
 
 def add_goals_column(df: pd.DataFrame) -> pd.DataFrame:
@@ -50,6 +59,7 @@ def add_goals_column(df: pd.DataFrame) -> pd.DataFrame:
     df[['domicile_but', 'exterieur_but']] = df['Score'].str.split('–', expand=True).astype(int)
     return df
 
+@Stage("merge_statistics")
 def merge_statistics_to_match_schedule(df_schedule: pd.DataFrame, df_statistics: pd.DataFrame) -> pd.DataFrame:
     """
     Merges teams general statistics to the match schedule.
@@ -134,6 +144,81 @@ def create_confrontation_stats_df(home_team: str, away_team: str, df_statistics:
     )
 
 
+# Home and away goals of a score (e.g. "2–1", "(4) 1–1 (3)" after penalties, "3-0")
+SCORE_PATTERN = r"(\d+)\s*[–-]\s*(\d+)"
+
 
+@Stage("prepare_schedule")
+def prepare_schedule(df: pd.DataFrame, as_of: Union[datetime.datetime, Callable] = None,
+                     finished_only: bool = True, date_column: str = "Date", time_column: str = "Heure",
+                     score_column: str = "Score", keep_columns: tuple = ()) -> pd.DataFrame:
+    """
+    Prepares a raw schedule in one pass: full date, finished matches and goals, with compact types.
+    The dates, times and scores are parsed once per distinct value, and the malformed values
+    (postponed matches, missing scores, ...) give missing values instead of exceptions.
+
+    Args:
+        df (pd.DataFrame): The raw schedule.
+        as_of (datetime.datetime or callable, optional): The current time, or a function returning it.
+            Defaults to datetime.datetime.now.
+        finished_only (bool, optional): Whether to only return the finished matches with a valid score.
+            Otherwise all the matches are returned with the "finished" and "valid_score" masks.
+            Defaults to True.
+        date_column (str, optional): The name of the column with the date. Defaults to "Date".
+        time_column (str, optional): The name of the column with the time. Defaults to "Heure".
+        score_column (str, optional): The name of the column with the score. Defaults to "Score".
+        keep_columns (tuple, optional): Other columns of the schedule to keep. Defaults to ().
+
+    Returns:
+        pd.DataFrame: The schedule with the FullDate (datetime64), Domicile and Extérieur (category),
+            domicile_but and exterieur_but (int8, or nullable Int8 when finished_only is False) columns.
+    """
+    if as_of is None:
+        as_of = datetime.datetime.now()
+    elif callable(as_of):
+        as_of = as_of()
 
+    full_date = _parse_unique(df[date_column], lambda dates: pd.to_datetime(dates, format='%Y-%m-%d',
+                                                                            errors="coerce"))
+    full_date = full_date + _parse_unique(df[time_column], lambda times: pd.to_timedelta(
+        pd.Series(times, dtype="string") + ":00", errors="coerce"))
 
+    goals = _parse_unique(df[score_column], lambda scores: pd.Series(scores, dtype="string")
+                          .str.extract(SCORE_PATTERN).astype("float64").to_numpy())
+
+    # Note: We remove 3 hours because the matches are not updated immediately.
+    finished = full_date < np.datetime64(as_of - datetime.timedelta(hours=3))
+    valid_score = ~np.isnan(goals).any(axis=1)
+
+    # The home and away teams share the same categories
+    codes, teams = pd.factorize(pd.concat([df["Domicile"], df["Extérieur"]], ignore_index=True), sort=True)
+
+    prepared = pd.DataFrame({
+        "FullDate": full_date,
+        "Domicile": pd.Categorical.from_codes(codes[:len(df)], categories=teams),
+        "Extérieur": pd.Categorical.from_codes(codes[len(df):], categories=teams),
+    }, index=df.index)
+    for column in keep_columns:
+        prepared[column] = df[column].to_numpy()
+
+    if finished_only:
+        mask = finished & valid_score
+        prepared = prepared[mask]
+        prepared["domicile_but"] = goals[mask, 0].astype(np.int8)
+        prepared["exterieur_but"] = goals[mask, 1].astype(np.int8)
+    else:
+        prepared["domicile_but"] = pd.array(goals[:, 0], dtype="Int8")
+        prepared["exterieur_but"] = pd.array(goals[:, 1], dtype="Int8")
+        prepared["finished"] = finished
+        prepared["valid_score"] = valid_score
+
+    return prepared
+
+
+def _parse_unique(values: pd.Series, parse: Callable) -> np.ndarray:
+    """
+    Parses each distinct value once and spreads the results back to all the rows (missing values give NaN/NaT).
+    """
+    codes, uniques = pd.factorize(values)
+    parsed = np.asarray(parse(np.asarray(uniques, dtype=object)))
+    return pd.api.extensions.take(parsed, codes, allow_fill=True)
@@ -0,0 +1,152 @@
+"""
+This file contains the storage of the scraped tables as a partitioned Parquet dataset.
+
+The tables are stored as <root>/<table>/league=<league>/season=<season>/part-0.parquet,
+so that a read only opens the partitions it needs and only decodes the requested columns.
+"""
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pyarrow.fs
+import pandas as pd
+import os
+import re
+import shutil
+
+
+PARTITIONING = ds.partitioning(pa.schema([("league", pa.string()), ("season", pa.string())]), flavor="hive")
+
+# Season and competition ids embedded in the fbref table ids (e.g. "results2023-202491_overall")
+SEASON_PATTERN = re.compile(r"\d{4}-\d{4}(_?\d+)*")
+
+
+def normalize_table_name(table_id: str, position: int) -> str:
+    """
+    Returns a table name that is the same for every league and season.
+
+    Args:
+        table_id (str): The id of the table on fbref (can be None).
+        position (int): The position of the table on the page, used when the table has no id.
+
+    Returns:
+        str: The name of the table (e.g. "results_overall" or "stats_squads_standard_for").
+    """
+    if not table_id:
+        return f"stats_{position}"
+    return re.sub("_+", "_", SEASON_PATTERN.sub("", table_id)).strip("_")
+
+
+class DatasetStore:
+    """
+    This class is used to store the tables of every league and season as a partitioned Parquet dataset.
+    """
+    def __init__(self, root: str = "data/dataset"):
+        """
+        Args:
+            root (str, optional): The directory of the dataset. Defaults to "data/dataset".
+        """
+        self.root = root
+        # Memory map the files instead of reading them into buffers
+        self.filesystem = pyarrow.fs.LocalFileSystem(use_mmap=True)
+
+    def write(self, df: pd.DataFrame, table: str, league: str, season: str):
+        """
+        Writes the partition of a table, replacing the previous one.
+
+        Args:
+            df (pd.DataFrame): The data of the table.
+            table (str): The name of the table.
+            league (str): The name of the league.
+            season (str): The season (e.g. "2023-2024").
+        """
+        directory = os.path.join(self.root, table, f"league={league}", f"season={season}")
+
+        # Replace the partition
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+
+        data = pa.Table.from_pandas(df, preserve_index=False)
+
+        # A column without any value (e.g. the empty "Notes" of a league) is parsed as float: store it as null,
+        # which merges with the type of the column in the other partitions
+        for i, field in enumerate(data.schema):
+            if len(data) and data.column(i).null_count == len(data) and not pa.types.is_null(field.type):
+                data = data.set_column(i, pa.field(field.name, pa.null()), pa.nulls(len(data)))
+
+        pq.write_table(data, os.path.join(directory, "part-0.parquet"))
+
+    def read(self, table: str, columns: list = None, leagues: list = None, seasons: list = None,
+             filters: list = None) -> pd.DataFrame:
+        """
+        Reads a table, only decoding the requested columns of the requested partitions.
+
+        Args:
+            table (str): The name of the table.
+            columns (list, optional): The columns to read. Defaults to None (all the columns).
+            leagues (list, optional): The leagues to read. Defaults to None (all the leagues).
+            seasons (list, optional): The seasons to read. Defaults to None (all the seasons).
+            filters (list, optional): The row filters, in the format of pandas.read_parquet
+                (e.g. [("Pts", ">", 50)]). Defaults to None.
+
+        Returns:
+            pd.DataFrame: The data of the table.
+        """
+        expression = None
+        if leagues is not None:
+            expression = ds.field("league").isin(leagues)
+        if seasons is not None:
+            condition = ds.field("season").isin(seasons)
+            expression = condition if expression is None else expression & condition
+        if filters:
+            condition = pq.filters_to_expression(filters)
+            expression = condition if expression is None else expression & condition
+
+        dataset = self._get_dataset(table)
+        return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    def get_modified_time(self, table: str, league: str, season: str) -> float:
+        """
+        Returns the time of the last write of a partition (as os.path.getmtime), or None if it does not exist.
+        """
+        path = os.path.join(self.root, table, f"league={league}", f"season={season}", "part-0.parquet")
+        return os.path.getmtime(path) if os.path.exists(path) else None
+
+    def tables(self) -> list:
+        """
+        Returns the names of the stored tables.
+        """
+        if not os.path.exists(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def _get_dataset(self, table: str) -> ds.Dataset:
+        """
+        Returns the dataset of a table, with a schema common to all its partitions.
+        """
+        path = os.path.join(self.root, table)
+        dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING, filesystem=self.filesystem)
+
+        # A column can be int in a partition and float in another one (missing values)
+        schemas = [fragment.physical_schema for fragment in dataset.get_fragments()]
+        try:
+            schema = pa.unify_schemas(schemas + [PARTITIONING.schema], promote_options="permissive")
+        except pa.ArrowTypeError:
+            # A column without values was stored as float in the partitions written before it was stored as null:
+            # read the columns that are text in a partition and another type in another one as text
+            types = {}
+            for partition_schema in schemas:
+                for field in partition_schema:
+                    types.setdefault(field.name, set()).add(field.type)
+            text = {name for name, field_types in types.items()
+                    if len(field_types) > 1 and any(pa.types.is_string(field_type) or pa.types.is_large_string(
+                        field_type) for field_type in field_types)}
+
+            schemas = [pa.schema([field.with_type(pa.large_string()) if field.name in text else field
+                                  for field in partition_schema], metadata=partition_schema.metadata)
+                       for partition_schema in schemas]
+            schema = pa.unify_schemas(schemas + [PARTITIONING.schema], promote_options="permissive")
+
+        return ds.dataset(path, schema=schema, format="parquet", partitioning=PARTITIONING,
+                          filesystem=self.filesystem)
@@ -0,0 +1,135 @@
+"""
+This file contains the on-disk cache of the LLM extraction results.
+"""
+
+import sqlite3
+import threading
+import hashlib
+import json
+import os
+from time import time
+
+
+def hash_content(content: str) -> str:
+    """
+    Returns the hash of a page chunk.
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def hash_schema(schema: dict) -> str:
+    """
+    Returns the hash of an extraction schema (independent of the order of the keys).
+    """
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """
+    This class is used to store the extraction results, keyed by the content, the schema and the model,
+    so that an unchanged page chunk is never sent to the LLM again.
+    The entries expire after a TTL and the least recently used entries are evicted when the cache is too big.
+    """
+    def __init__(self, path: str = "data/cache/extractions.db", ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 10000):
+        """
+        Args:
+            path (str, optional): The path of the database. Defaults to "data/cache/extractions.db".
+            ttl (float, optional): The number of seconds an entry is kept. Defaults to 7 days.
+            max_entries (int, optional): The maximum number of entries. Defaults to 10000.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        # Create the directory if it does not exist
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS extractions (
+                content_hash TEXT NOT NULL,
+                schema_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (content_hash, schema_hash, model)
+            )
+            """
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS extractions_accessed_at ON extractions (accessed_at)")
+        self.connection.commit()
+
+    def get(self, content: str, schema: dict, model: str):
+        """
+        Returns the cached extraction result, or None if there is none or it expired.
+        """
+        key = (hash_content(content), hash_schema(schema), model)
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT result, created_at FROM extractions "
+                "WHERE content_hash = ? AND schema_hash = ? AND model = ?", key
+            ).fetchone()
+
+            if row is None or time() - row[1] >= self.ttl:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.connection.execute(
+                "UPDATE extractions SET accessed_at = ? WHERE content_hash = ? AND schema_hash = ? AND model = ?",
+                (time(),) + key
+            )
+            self.connection.commit()
+
+        return json.loads(row[0])
+
+    def put(self, content: str, schema: dict, model: str, result):
+        """
+        Stores an extraction result, then removes the expired entries and evicts the least recently used ones.
+        """
+        now = time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?, ?)",
+                (hash_content(content), hash_schema(schema), model, json.dumps(result), now, now)
+            )
+            self.connection.execute("DELETE FROM extractions WHERE created_at <= ?", (now - self.ttl,))
+            self.connection.execute(
+                "DELETE FROM extractions WHERE rowid IN "
+                "(SELECT rowid FROM extractions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        """
+        Returns the number of hits, misses and entries of the cache.
+        """
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": entries,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        """
+        Deletes all the entries.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM extractions")
+            self.connection.commit()
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        self.connection.close()
@@ -0,0 +1,261 @@
+"""
+This file contains the routing of the page extractions: the tables of a page are first mapped
+to the extraction schema without any LLM, and the LLM is only called when the result does not validate.
+"""
+
+import re
+import unicodedata
+from typing import NamedTuple
+from collections import Counter
+from time import perf_counter
+
+from table_extractor import find_tables, get_table_grid, to_float
+
+
+# Tiers of the extractions
+STRUCTURAL = "structural"
+LLM = "llm"
+FAILED = "failed"
+
+# Headers of the tables (fbref in french, ESPN in english) of the properties of the schemas of main.py
+COLUMN_ALIASES = {
+    "position": ("Clt", "Rk", "#"),
+    "team_name": ("Équipe", "Team", "Squad"),
+    "player_name": ("Joueur", "Player", "Name"),
+    "hour": ("Heure", "Time"),
+    "first_team_name": ("Domicile", "Home"),
+    "second_team_name": ("Extérieur", "Away"),
+}
+
+# String properties filled with the caption of the table
+CAPTION_PROPERTIES = ("table_title",)
+
+TYPES = {"string": str, "integer": int, "number": (int, float), "boolean": bool, "array": list, "object": dict}
+
+
+class PageExtraction(NamedTuple):
+    """
+    This class is used to store the extraction of a page: its result, the tier that produced it,
+    the validation errors of the tiers that failed and the time spent.
+    """
+    source: str
+    tier: str
+    result: list
+    errors: list
+    seconds: float
+
+
+def validate(value, schema: dict, path: str = "$") -> list:
+    """
+    Validates a value against a JSON schema. Only the subset of JSON schema used by the extraction
+    schemas is supported: type, properties, items and required. The required names that are not properties
+    are ignored, since a few schemas of main.py list properties they do not declare.
+
+    Args:
+        value: The value to validate.
+        schema (dict): The schema. A schema without type but with properties is an object.
+        path (str, optional): The path of the value, used in the errors. Defaults to "$".
+
+    Returns:
+        list: The errors (empty if the value is valid).
+    """
+    kind = schema.get("type", "object" if "properties" in schema else None)
+    if kind is None:
+        return []
+
+    expected = TYPES[kind]
+    # bool is a subclass of int, but true is not a number
+    if not isinstance(value, expected) or (isinstance(value, bool) and kind in ("integer", "number")):
+        return [f"{path}: expected {kind}, got {type(value).__name__}"]
+
+    errors = []
+    if kind == "object":
+        properties = schema.get("properties", {})
+        for name in schema.get("required", []):
+            if name in properties and name not in value:
+                errors.append(f"{path}: missing {name}")
+        for name, item in value.items():
+            if name in properties:
+                errors += validate(item, properties[name], f"{path}.{name}")
+    elif kind == "array" and "items" in schema:
+        for i, item in enumerate(value):
+            errors += validate(item, schema["items"], f"{path}[{i}]")
+    return errors
+
+
+def validate_extraction(result: list, schema: dict) -> list:
+    """
+    Validates an extraction result: a non-empty list of objects of the schema,
+    whose array properties are not all empty.
+    """
+    if not isinstance(result, list) or not result:
+        return ["$: no object extracted"]
+
+    errors = []
+    for i, item in enumerate(result):
+        errors += validate(item, schema, f"$[{i}]")
+        if isinstance(item, dict):
+            arrays = [value for value in item.values() if isinstance(value, list)]
+            if arrays and not any(arrays):
+                errors.append(f"$[{i}]: no row extracted")
+    return errors
+
+
+def structural_extract(content: str, schema: dict) -> list:
+    """
+    Extracts a page without LLM, by mapping the columns of its tables to the properties of the schema.
+    Each array property of objects is filled with the rows of the table whose headers match
+    the most properties, and each array property of arrays with the rows of the first table.
+
+    Args:
+        content (str): The HTML content of the page.
+        schema (dict): The schema of the extraction.
+
+    Returns:
+        list: The extracted object in a list, like the extraction chain, or None if no table matches.
+    """
+    tables = [get_table_grid(element) for element in find_tables(content, include_commented=True)]
+    tables = [table for table in tables if table[2]]
+    if not tables:
+        return None
+
+    extracted = {}
+    caption = None
+    for name, prop in schema.get("properties", {}).items():
+        if prop.get("type") != "array":
+            continue
+        items = prop.get("items", {})
+
+        if items.get("type", "object") == "object" and "properties" in items:
+            match = _match_table(tables, items)
+            if match is None:
+                continue
+            (table_caption, _, body), positions = match
+            extracted[name] = [{key: _convert(row[position], items["properties"][key])
+                                for key, position in positions.items()} for row in body]
+        elif items.get("type") == "array":
+            table_caption, header, body = tables[0]
+            extracted[name] = header[-1:] + body
+        else:
+            continue
+        caption = caption if caption is not None else table_caption
+
+    if not extracted:
+        return None
+
+    for name in CAPTION_PROPERTIES:
+        if name in schema.get("properties", {}) and caption:
+            extracted[name] = caption
+    return [extracted]
+
+
+def _match_table(tables: list, schema: dict) -> tuple:
+    """
+    Returns the table whose headers match all the required properties and the most properties of the schema,
+    with the position of the column of each property, or None if no table matches.
+    """
+    properties = schema["properties"]
+    required = [name for name in schema.get("required", properties) if name in properties]
+
+    best = None
+    for table in tables:
+        header = table[1][-1] if table[1] else []
+        columns = {}
+        for position, name in enumerate(header):
+            columns.setdefault(_normalize(name), position)
+
+        positions = {}
+        for name in properties:
+            for alias in (name,) + COLUMN_ALIASES.get(name, ()):
+                if _normalize(alias) in columns:
+                    positions[name] = columns[_normalize(alias)]
+                    break
+
+        if all(name in positions for name in required) and (best is None or len(positions) > len(best[1])):
+            best = (table, positions)
+    return best
+
+
+def _normalize(name: str) -> str:
+    """
+    Returns a header without case, accents and punctuation ("Équipe" -> "equipe", "Pts/MJ" -> "ptsmj").
+    """
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def _convert(text: str, schema: dict):
+    """
+    Converts the text of a cell to the type of the property. A text that can not be converted is kept,
+    so that the validation fails.
+    """
+    kind = schema.get("type")
+    if kind not in ("integer", "number"):
+        return text
+    if not text:
+        return None
+
+    try:
+        number = to_float(text)
+    except ValueError:
+        return text
+    if kind == "integer":
+        return int(number) if number.is_integer() else text
+    return number
+
+
+class ExtractionRouter:
+    """
+    This class is used to extract the pages with the cheapest tier that gives a valid result:
+    the structural extraction of the tables first, then the fallback (the LLM) when it does not validate.
+    The tier that answered each page is recorded.
+    """
+    def __init__(self, fallback=None, structural=structural_extract):
+        """
+        Args:
+            fallback (callable, optional): The extraction of the pages that the structural extraction
+                does not answer, called with the content and the schema. Defaults to None (no fallback).
+            structural (callable, optional): The structural extraction. Defaults to structural_extract.
+        """
+        self.fallback = fallback
+        self.structural = structural
+        self.pages = []
+
+    def extract(self, content: str, schema: dict, source: str = None) -> PageExtraction:
+        """
+        Extracts a page.
+
+        Args:
+            content (str): The HTML content of the page.
+            schema (dict): The schema of the extraction.
+            source (str, optional): The URL of the page, recorded with the tier. Defaults to None.
+
+        Returns:
+            PageExtraction: The tier, the result and the validation errors of the page.
+        """
+        start = perf_counter()
+
+        result = self.structural(content, schema)
+        errors = validate_extraction(result, schema)
+        tier = STRUCTURAL
+
+        if errors and self.fallback is not None:
+            result = self.fallback(content, schema)
+            errors = validate_extraction(result, schema)
+            tier = LLM
+        elif errors:
+            tier = FAILED
+
+        page = PageExtraction(source, tier, result, errors, perf_counter() - start)
+        self.pages.append(page)
+        return page
+
+    def stats(self) -> dict:
+        """
+        Returns the number of pages and the total seconds of each tier.
+        """
+        pages = Counter(page.tier for page in self.pages)
+        seconds = Counter()
+        for page in self.pages:
+            seconds[page.tier] += page.seconds
+        return {tier: {"pages": pages[tier], "seconds": seconds[tier]} for tier in pages}
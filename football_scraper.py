@@ -1,10 +1,18 @@
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
 from enum import Enum
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+import datetime
 import os
 
+from http_client import HttpClient
+from http_cache import ResponseCache
+from table_extractor import extract_tables
+from dataset_store import DatasetStore, normalize_table_name
+from history_store import HistoryStore
+from instrumentation import Stage
+
+
+FBREF_URL = "https://fbref.com/fr"
+
 
 class League(Enum):
     """
@@ -17,76 +25,123 @@ class League(Enum):
     LIGA = "La-Liga"
 
 
+# Competition ids of the leagues on fbref
+COMPETITION_IDS = {
+    League.PREMIER_LEAGUE: 9,
+    League.LIGUE_1: 13,
+    League.BUNDESLIGA: 20,
+    League.SERIE_A: 11,
+    League.LIGA: 12,
+}
+
+
+def get_urls(league: League, season: str = None, base_url: str = FBREF_URL) -> tuple:
+    """
+    Returns the urls of the schedule and of the statistics of a league.
+
+    Args:
+        league (League): The league.
+        season (str, optional): A past season (e.g. "2021-2022"). Defaults to None (the current season).
+        base_url (str, optional): The root url of the website. Defaults to FBREF_URL.
+
+    Returns:
+        tuple: The url of the schedule and the url of the statistics.
+    """
+    competition = f"{base_url}/comps/{COMPETITION_IDS[league]}"
+    if season is None:
+        return (f"{competition}/calendrier/Scores-et-tableaux-{league.value}",
+                f"{competition}/Statistiques-{league.value}")
+    return (f"{competition}/{season}/calendrier/Scores-et-tableaux-{season}-{league.value}",
+            f"{competition}/{season}/Statistiques-{season}-{league.value}")
+
+
+def current_season(date: datetime.date = None) -> str:
+    """
+    Returns the season of the date (the seasons start in July).
+
+    Args:
+        date (datetime.date, optional): The date. Defaults to today.
+
+    Returns:
+        str: The season (e.g. "2023-2024").
+    """
+    date = date if date is not None else datetime.date.today()
+    start = date.year if date.month >= 7 else date.year - 1
+    return f"{start}-{start + 1}"
+
+
 class FootballScrapper:
     """
     This class is used to scrape football data from the fbref.
     """
-    def __init__(self, league_name: League):
+    def __init__(self, league_name: League, client: HttpClient = None, base_url: str = FBREF_URL,
+                 season: str = None):
+        self.league = league_name
         self.league_name = league_name.value
+        # The client created here is closed by close, a client given by the caller is left open
+        self.own_client = client is None
+        self.client = client if client is not None else HttpClient(cache=ResponseCache())
+        self.base_url = base_url
+        # None for the current season
+        self.season = season
         self.schedule = None
         self.statistics = []
+        self.statistics_ids = []
 
 
-    def get_data(self):
+    def close(self):
+        """
+        Closes the HTTP client and its cache if they were created by the scrapper.
+        """
+        if self.own_client:
+            self.client.close()
+            self.client.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_data(self, schedule: bool = True, statistics: bool = True, max_age: float = None):
         """
         Scrapes the data from the fbref.
         It scrapes the schedule and the statistics.
+
+        Args:
+            schedule (bool, optional): Whether to scrape the schedule. Defaults to True.
+            statistics (bool, optional): Whether to scrape the statistics. Defaults to True.
+            max_age (float, optional): The maximum age in seconds of the cached pages
+                (0 to always revalidate them). Defaults to None (the TTL of the cache).
         """
 
-        urls = ["https://fbref.com/fr/comps/9/calendrier/Scores-et-tableaux-" + self.league_name,
-                "https://fbref.com/fr/comps/9/Statistiques-" + self.league_name]
+        urls = get_urls(self.league, season=self.season, base_url=self.base_url)
 
         for i, url in enumerate(urls):
-            # Send an HTTP GET request to the URL
-            response = requests.get(url=url)
+            if (i == 0 and not schedule) or (i == 1 and not statistics):
+                continue
+
+            # Send an HTTP GET request to the URL (the client handles the rate limit and the retries)
+            with Stage("fetch", league=self.league_name) as measure:
+                response = self.client.get(url=url, max_age=max_age)
+                measure.add(bytes=len(response.content))
 
             # Check if the request was successful (status code 200)
             if response.status_code == 200:
-                # Parse the HTML content of the page using BeautifulSoup
-                soup = BeautifulSoup(response.text, 'html.parser')
-
-                # Find all the tables on the page
-                tables = soup.find_all('table')
-
-                # Initialize a list to store table names
-                table_names = []
+                # Extract all the tables of the page with their id and caption
+                with Stage("parse", league=self.league_name) as measure:
+                    tables = extract_tables(response.text)
+                    measure.add(rows=sum(len(table.data) for table in tables), tables=len(tables))
 
-                # Loop through each table and extract the data
                 for table in tables:
-                    # Process and extract data from the table as needed
-                    data_rows = []
-
-                    # Extract the table caption (if available) as the table name
-                    caption = table.find('caption')
-                    table_name = caption.text.strip() if caption else None
-                    table_names.append(table_name)
-
-                    # Extract table data rows
-                    rows = table.find_all('tr')
-                    for row in rows:
-                        data_row = []
-                        td_elements = row.find_all(['td', 'th'])  # Include 'th' elements for header rows
-                        for td in td_elements:
-                            # Check for colspan attribute
-                            colspan = int(td.get('colspan', 1))
-                            cell_text = td.text.strip()
-                            # Replicate cell data for multiple columns if colspan > 1
-                            for _ in range(colspan):
-                                data_row.append(cell_text)
-                        data_rows.append(data_row)
-
-                    df = pd.DataFrame(data_rows)
-
                     # The first url is the schedule
                     if i == 0:
-                        self.schedule = df
+                        self.schedule = table.data
                     else:
-                        self.statistics.append(df)
+                        self.statistics.append(table.data)
+                        self.statistics_ids.append(table.id)
             else:
                 print("Failed to retrieve the webpage. Status code:", response.status_code)
-            
-            # Wait 1 second to avoid being blocked
-            sleep(1)
 
     def to_csv(self):
         """
@@ -102,3 +157,79 @@ class FootballScrapper:
         # Save the statistics
         for i, df in enumerate(self.statistics):
             df.to_csv(f"data/{self.league_name}/{self.league_name}_stats_{i}.csv")
+
+    def to_parquet(self, store: DatasetStore = None, season: str = None):
+        """
+        Saves the dataframes to the partitioned Parquet dataset, one table per fbref table.
+
+        Args:
+            store (DatasetStore, optional): The dataset. Defaults to the dataset in data/dataset.
+            season (str, optional): The season of the data. Defaults to the season of the scrapper.
+        """
+        store = store if store is not None else DatasetStore()
+        season = season if season is not None else self.season or current_season()
+
+        # Save the schedule
+        store.write(self.schedule, "schedule", self.league_name, season)
+
+        # Save the statistics
+        for i, (df, table_id) in enumerate(zip(self.statistics, self.statistics_ids)):
+            store.write(df, normalize_table_name(table_id, i), self.league_name, season)
+
+    def to_history(self, store: HistoryStore = None, season: str = None, snapshot_date: datetime.date = None):
+        """
+        Saves the matches and a dated snapshot of the statistics to the history database.
+
+        Args:
+            store (HistoryStore, optional): The history. Defaults to the database in data/history.db.
+            season (str, optional): The season of the data. Defaults to the season of the scrapper.
+            snapshot_date (datetime.date, optional): The date of the statistics. Defaults to today.
+        """
+        store = store if store is not None else HistoryStore()
+        season = season if season is not None else self.season or current_season()
+
+        # Save the matches
+        store.write_schedule(self.schedule, self.league_name, season)
+
+        # Save the statistics (the tables without team column are not snapshots of the teams)
+        for i, (df, table_id) in enumerate(zip(self.statistics, self.statistics_ids)):
+            if "Équipe" in df.columns:
+                # The teams of the "against" tables are named "vs <team>": their rows are snapshots of the team
+                df = df.assign(**{"Équipe": df["Équipe"].astype("string").str.removeprefix("vs ")})
+                store.write_snapshot(df, normalize_table_name(table_id, i), self.league_name, season,
+                                     snapshot_date=snapshot_date)
+
+
+def scrape_leagues(leagues: list = None, client: HttpClient = None, max_workers: int = None,
+                   base_url: str = FBREF_URL) -> dict:
+    """
+    Scrapes several leagues at once, sharing one HTTP client.
+    The total time is bounded by the rate limit of the client, not by the sequential round-trips.
+
+    Args:
+        leagues (list, optional): The leagues to scrape. Defaults to all the leagues.
+        client (HttpClient, optional): The client shared by the scrappers. Defaults to a new cached client,
+            closed when the leagues are scraped.
+        max_workers (int, optional): The number of threads. Defaults to one per league.
+        base_url (str, optional): The root url of the website. Defaults to FBREF_URL.
+
+    Returns:
+        dict: The scrappers with their data, by league.
+    """
+    leagues = list(League) if leagues is None else leagues
+    # The client created here is closed at the end, a client given by the caller is left open
+    own_client = client is None
+    client = client if client is not None else HttpClient(cache=ResponseCache())
+
+    scrappers = {league: FootballScrapper(league, client=client, base_url=base_url) for league in leagues}
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or len(scrappers)) as executor:
+            # Consume the results to raise the exceptions of the threads
+            list(executor.map(FootballScrapper.get_data, scrappers.values()))
+    finally:
+        if own_client:
+            client.close()
+            client.cache.close()
+
+    return scrappers
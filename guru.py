@@ -0,0 +1,290 @@
+"""
+This file contains the command line of the pipeline: scrape the leagues, prepare the matches,
+train the models, read or compute the predictions and serve them.
+
+Only the standard library is imported at start: each command imports pandas, sklearn and the other
+heavy dependencies when it runs, so `python guru.py predict --help` answers in about 30 ms (the target,
+checked by the cli_startup stage of benchmarks/run.py, is 200 ms) and reading the saved predictions
+does not import pandas at all.
+
+Usage:
+    python guru.py scrape [--leagues Premier-League Ligue-1] [--seasons 10]
+    python guru.py prepare [--leagues ...] [--seasons 2023-2024 ...]
+    python guru.py train [--leagues ...] [--seasons ...] [--force]
+    python guru.py predict [--league Premier-League] [--home Fulham --away Chelsea]
+    python guru.py serve [--port 8000] [--leagues ...]
+"""
+
+import argparse
+import csv
+import os
+import sys
+
+
+LEAGUES_HELP = "The leagues (e.g. Premier-League Ligue-1, default: all)."
+
+
+def get_leagues(names: list) -> list:
+    """
+    Returns the leagues of their names (all the leagues when no name is given).
+    """
+    from football_scraper import League
+
+    try:
+        return [League(name) for name in names] if names else list(League)
+    except ValueError as e:
+        raise SystemExit(f"{e}, the leagues are {', '.join(league.value for league in League)}")
+
+
+def scrape(args):
+    """
+    Scrapes the current season of the leagues, or backfills their past seasons, to the dataset and the history.
+    """
+    from http_client import HttpClient
+    from http_cache import ResponseCache
+    from dataset_store import DatasetStore
+    from history_store import HistoryStore
+
+    leagues = get_leagues(args.leagues)
+    store = DatasetStore(args.dataset)
+    history = HistoryStore(args.history)
+
+    if args.seasons:
+        from backfill import backfill, get_past_seasons, Checkpoint
+
+        rate = args.rate if args.rate is not None else 1 / 6
+        errors = backfill(leagues, get_past_seasons(args.seasons), client=HttpClient(rate=rate, cache=ResponseCache()),
+                          store=store, history=history, checkpoint=Checkpoint(args.checkpoint),
+                          max_workers=args.workers)
+        return 1 if errors else 0
+
+    from football_scraper import scrape_leagues
+
+    rate = args.rate if args.rate is not None else 1.0
+    failed = 0
+    for league, scrapper in scrape_leagues(leagues, client=HttpClient(rate=rate, cache=ResponseCache())).items():
+        if scrapper.schedule is None or not scrapper.statistics:
+            print(f"{league.value}: no data")
+            failed += 1
+            continue
+
+        scrapper.to_parquet(store)
+        scrapper.to_history(history)
+        print(f"{league.value}: {len(scrapper.schedule)} matches, {len(scrapper.statistics)} statistics tables")
+    return 1 if failed else 0
+
+
+def prepare(args):
+    """
+    Merges the finished matches with the statistics of the teams (the "merged" table of the dataset),
+    and writes the feature cache of the current season.
+    """
+    from dataset_store import DatasetStore
+    from data_preparation import prepare_schedule, merge_statistics_to_match_schedule
+    from football_scraper import current_season
+    from team_index import TeamFeatureIndex
+
+    leagues = [league.value for league in get_leagues(args.leagues)]
+    seasons = args.seasons if args.seasons else [current_season()]
+    store = DatasetStore(args.dataset)
+
+    for league in leagues:
+        for season in seasons:
+            df_schedule = store.read("schedule", leagues=[league], seasons=[season])
+            df_statistics = store.read(args.table, leagues=[league], seasons=[season])
+            if df_schedule.empty or df_statistics.empty:
+                print(f"{league} {season}: no data, scrape it first")
+                continue
+
+            # The partition columns are not features
+            df_schedule = df_schedule.drop(columns=["league", "season"])
+            df_statistics = df_statistics.drop(columns=["league", "season"])
+
+            merged = merge_statistics_to_match_schedule(prepare_schedule(df_schedule), df_statistics)
+            store.write(merged, "merged", league, season)
+
+            if season == current_season():
+                TeamFeatureIndex.from_statistics(df_statistics).save(os.path.join(args.features, f"{league}.npz"))
+            print(f"{league} {season}: {len(merged)} matches")
+    return 0
+
+
+def train(args):
+    """
+    Trains the goal models of the leagues on their merged matches.
+    """
+    from dataset_store import DatasetStore
+    from training import get_training_data, train_leagues
+
+    leagues = [league.value for league in get_leagues(args.leagues)]
+    store = DatasetStore(args.dataset)
+    if "merged" not in store.tables():
+        print("No merged matches, run the prepare command first")
+        return 1
+
+    merged = store.read("merged", leagues=leagues, seasons=args.seasons or None)
+    datasets = {}
+    for league in leagues:
+        merged_league = merged[merged["league"] == league].drop(columns=["league", "season"])
+        if merged_league.empty:
+            print(f"{league}: no merged matches")
+            continue
+
+        X, y_home, y_away = get_training_data(merged_league)
+        datasets[league] = (X.select_dtypes("number").reset_index(drop=True), y_home.reset_index(drop=True),
+                            y_away.reset_index(drop=True))
+
+    train_leagues(datasets, directory=args.models, max_workers=args.workers, force=args.force)
+    return 0
+
+
+def predict(args):
+    """
+    Prints the saved predictions of the upcoming fixtures, or predicts a matchup with the latest models.
+    """
+    if args.home or args.away:
+        return predict_matchup(args)
+
+    if args.league:
+        names = [args.league]
+    elif os.path.isdir(args.predictions):
+        names = sorted(name[:-len(".csv")] for name in os.listdir(args.predictions) if name.endswith(".csv"))
+    else:
+        names = []
+
+    if not names:
+        print(f"No predictions in {args.predictions}, run the scheduler or predict a matchup with --home and --away")
+        return 1
+
+    for name in names:
+        path = os.path.join(args.predictions, f"{name}.csv")
+        if not os.path.exists(path):
+            print(f"{name}: no predictions")
+            continue
+
+        print(name)
+        with open(path, newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                print(f"  {row['FullDate'][:16]:<18}{row['Domicile']:>25} {_format_goals(row['domicile_but_pred'])}"
+                      f" - {_format_goals(row['exterieur_but_pred'])} {row['Extérieur']}")
+    return 0
+
+
+def predict_matchup(args):
+    """
+    Predicts the expected goals and the market probabilities of a matchup.
+    """
+    if not (args.league and args.home and args.away):
+        print("A matchup needs --league, --home and --away")
+        return 1
+
+    from dataset_store import DatasetStore
+    from prediction_server import PredictionService, load_team_index
+
+    store = DatasetStore(args.dataset)
+    service = PredictionService([args.league], model_directory=args.models, reload_interval=0,
+                                index_loader=lambda league, columns: load_team_index(league, columns, args.features,
+                                                                                     store=store))
+    try:
+        result = service.predict_many(args.league, [{"home": args.home, "away": args.away}])[0]
+    except KeyError as e:
+        print(e.args[0])
+        return 1
+    finally:
+        service.close()
+
+    if "error" in result:
+        print(f"{args.home} - {args.away}: {result['error']}")
+        return 1
+    for key, value in result.items():
+        print(f"{key:<20}{value:.3f}" if isinstance(value, float) else f"{key:<20}{value}")
+    return 0
+
+
+def serve(args):
+    """
+    Serves the predictions over HTTP (see prediction_server).
+    """
+    from dataset_store import DatasetStore
+    from prediction_server import PredictionService, load_team_index, serve as serve_predictions
+
+    store = DatasetStore(args.dataset)
+    leagues = [league.value for league in get_leagues(args.leagues)]
+    service = PredictionService(leagues, model_directory=args.models, reload_interval=args.reload_interval,
+                                index_loader=lambda league, columns: load_team_index(league, columns, args.features,
+                                                                                     store=store))
+    serve_predictions(service, args.host, args.port)
+    return 0
+
+
+def _format_goals(value: str) -> str:
+    """
+    Returns the predicted goals of a saved prediction ("?" when a team is unknown).
+    """
+    return value if value else "?"
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="guru", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("scrape", help="Scrape the leagues to the dataset and the history.")
+    command.add_argument("--leagues", nargs="*", help=LEAGUES_HELP)
+    command.add_argument("--seasons", type=int, help="Backfill this number of past seasons instead of the current one.")
+    command.add_argument("--rate", type=float,
+                         help="The maximum number of requests per second (default: 1, 1 every 6 seconds to backfill).")
+    command.add_argument("--workers", type=int, default=4, help="The number of threads of the backfill (default: 4).")
+    command.add_argument("--dataset", default="data/dataset", help="The directory of the dataset.")
+    command.add_argument("--history", default="data/history.db", help="The path of the history database.")
+    command.add_argument("--checkpoint", default="data/backfill.json", help="The path of the checkpoint of the backfill.")
+    command.set_defaults(run=scrape)
+
+    command = commands.add_parser("prepare", help="Merge the matches with the statistics and cache the features.")
+    command.add_argument("--leagues", nargs="*", help=LEAGUES_HELP)
+    command.add_argument("--seasons", nargs="*", help="The seasons (e.g. 2023-2024, default: the current one).")
+    command.add_argument("--table", default="results_overall", help="The table of the statistics of the teams.")
+    command.add_argument("--dataset", default="data/dataset", help="The directory of the dataset.")
+    command.add_argument("--features", default="data/features", help="The directory of the feature cache.")
+    command.set_defaults(run=prepare)
+
+    command = commands.add_parser("train", help="Train the goal models of the leagues.")
+    command.add_argument("--leagues", nargs="*", help=LEAGUES_HELP)
+    command.add_argument("--seasons", nargs="*", help="The seasons of the matches (default: all the prepared ones).")
+    command.add_argument("--models", default="models", help="The directory of the models.")
+    command.add_argument("--workers", type=int, help="The number of processes (default: the number of CPUs).")
+    command.add_argument("--force", action="store_true", help="Retrain the leagues whose data did not change.")
+    command.add_argument("--dataset", default="data/dataset", help="The directory of the dataset.")
+    command.set_defaults(run=train)
+
+    command = commands.add_parser("predict", help="Print the saved predictions or predict a matchup.")
+    command.add_argument("--league", help="The league (default: all the leagues with predictions).")
+    command.add_argument("--home", help="The home team of a matchup to predict with the models.")
+    command.add_argument("--away", help="The away team of a matchup to predict with the models.")
+    command.add_argument("--predictions", default="data/predictions", help="The directory of the saved predictions.")
+    command.add_argument("--models", default="models", help="The directory of the models.")
+    command.add_argument("--features", default="data/features", help="The directory of the feature cache.")
+    command.add_argument("--dataset", default="data/dataset", help="The directory of the dataset.")
+    command.set_defaults(run=predict)
+
+    command = commands.add_parser("serve", help="Serve the predictions over HTTP.")
+    command.add_argument("--host", default="127.0.0.1", help="The address of the server (default: 127.0.0.1).")
+    command.add_argument("--port", type=int, default=8000, help="The port of the server (default: 8000).")
+    command.add_argument("--leagues", nargs="*", help=LEAGUES_HELP)
+    command.add_argument("--models", default="models", help="The directory of the models.")
+    command.add_argument("--features", default="data/features", help="The directory of the feature cache.")
+    command.add_argument("--reload-interval", type=float, default=30,
+                         help="The seconds between two checks for new models (default: 30).")
+    command.add_argument("--dataset", default="data/dataset", help="The directory of the dataset.")
+    command.set_defaults(run=serve)
+
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = get_parser().parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+This file contains the history of the leagues in an SQLite database: the matches, the teams
+and dated snapshots of the statistics tables, kept across scrapes and seasons.
+
+The matches are stored once per (league, season, home team, away team) and updated in place, so
+a rescrape or a postponed match never duplicates a row. The snapshots keep every scrape of the statistics,
+so the statistics of a team can be read as they were at any date.
+"""
+
+import pandas as pd
+import numpy as np
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+from data_preparation import SCORE_PATTERN
+
+
+# Columns of the fbref schedule stored in their own columns, the others are stored in the extra json
+SCHEDULE_COLUMNS = {"Date": "date", "Heure": "time", "Domicile": "home", "Extérieur": "away",
+                    "Score": "score", "xG": "home_xg", "xG.1": "away_xg"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS teams (
+    team_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS matches (
+    match_id INTEGER PRIMARY KEY,
+    league TEXT NOT NULL,
+    season TEXT NOT NULL,
+    date TEXT,
+    time TEXT,
+    home_id INTEGER NOT NULL REFERENCES teams (team_id),
+    away_id INTEGER NOT NULL REFERENCES teams (team_id),
+    home_goals INTEGER,
+    away_goals INTEGER,
+    home_xg REAL,
+    away_xg REAL,
+    extra TEXT,
+    updated_at TEXT NOT NULL,
+    UNIQUE (league, season, home_id, away_id)
+);
+CREATE INDEX IF NOT EXISTS matches_league_season_date ON matches (league, season, date);
+CREATE INDEX IF NOT EXISTS matches_home_date ON matches (home_id, date);
+CREATE INDEX IF NOT EXISTS matches_away_date ON matches (away_id, date);
+CREATE TABLE IF NOT EXISTS snapshots (
+    team_id INTEGER NOT NULL REFERENCES teams (team_id),
+    table_name TEXT NOT NULL,
+    snapshot_date TEXT NOT NULL,
+    league TEXT NOT NULL,
+    season TEXT NOT NULL,
+    stats TEXT NOT NULL,
+    PRIMARY KEY (team_id, table_name, snapshot_date)
+);
+CREATE INDEX IF NOT EXISTS snapshots_team_date ON snapshots (team_id, snapshot_date);
+CREATE INDEX IF NOT EXISTS snapshots_table_league ON snapshots (table_name, league, season);
+"""
+
+
+class HistoryStore:
+    """
+    This class is used to store the history of the leagues in an SQLite database.
+    All the rows of a call are written in one transaction, and writing the same data twice changes nothing.
+    """
+    def __init__(self, path: str = "data/history.db"):
+        """
+        Args:
+            path (str, optional): The path of the database. Defaults to "data/history.db".
+        """
+        self.path = path
+        self.lock = threading.Lock()
+
+        # Create the directory if it does not exist
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # The write-ahead log lets the readers run during the writes
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def write_schedule(self, df_schedule: pd.DataFrame, league: str, season: str) -> int:
+        """
+        Inserts or updates the matches of a raw fbref schedule.
+
+        Args:
+            df_schedule (pd.DataFrame): The raw schedule (Date, Heure, Domicile, Score, Extérieur, ...).
+            league (str): The name of the league.
+            season (str): The season (e.g. "2023-2024").
+
+        Returns:
+            int: The number of matches written.
+        """
+        # The rows without teams are the separators of the matchweeks
+        df = df_schedule[df_schedule["Domicile"].notna() & df_schedule["Extérieur"].notna()]
+
+        goals = df["Score"].astype("string").str.extract(SCORE_PATTERN).astype("float64") \
+            if "Score" in df.columns else pd.DataFrame(np.nan, index=df.index, columns=[0, 1])
+        extra_columns = [column for column in df.columns if column not in SCHEDULE_COLUMNS]
+        extras = df[extra_columns].astype(object).where(df[extra_columns].notna(), None).to_dict("records")
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+
+        rows = [(league, season, _to_text(date), _to_text(time), home, away, _to_int(home_goals), _to_int(away_goals),
+                 _to_float(home_xg), _to_float(away_xg), json.dumps(extra, ensure_ascii=False, default=str), now)
+                for date, time, home, away, home_goals, away_goals, home_xg, away_xg, extra in zip(
+                    _get_column(df, "Date"), _get_column(df, "Heure"), df["Domicile"].astype(str),
+                    df["Extérieur"].astype(str), goals[0], goals[1], _get_column(df, "xG"),
+                    _get_column(df, "xG.1"), extras)]
+
+        with self.lock, self.connection:
+            self._upsert_teams(set(df["Domicile"].astype(str)) | set(df["Extérieur"].astype(str)))
+            self.connection.executemany(
+                """
+                INSERT INTO matches (league, season, date, time, home_id, away_id, home_goals, away_goals,
+                                     home_xg, away_xg, extra, updated_at)
+                VALUES (?, ?, ?, ?, (SELECT team_id FROM teams WHERE name = ?),
+                        (SELECT team_id FROM teams WHERE name = ?), ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (league, season, home_id, away_id) DO UPDATE SET
+                    date = excluded.date, time = excluded.time, home_goals = excluded.home_goals,
+                    away_goals = excluded.away_goals, home_xg = excluded.home_xg, away_xg = excluded.away_xg,
+                    extra = excluded.extra, updated_at = excluded.updated_at
+                """, rows)
+        return len(rows)
+
+    def write_snapshot(self, df_statistics: pd.DataFrame, table_name: str, league: str, season: str,
+                       snapshot_date: datetime.date = None, team_column: str = "Équipe") -> int:
+        """
+        Inserts or replaces the snapshot of a statistics table at a date.
+
+        Args:
+            df_statistics (pd.DataFrame): The statistics, one row per team.
+            table_name (str): The name of the table (see normalize_table_name).
+            league (str): The name of the league.
+            season (str): The season (e.g. "2023-2024").
+            snapshot_date (datetime.date, optional): The date of the snapshot. Defaults to today.
+            team_column (str, optional): The name of the column with the team. Defaults to "Équipe".
+
+        Returns:
+            int: The number of teams written.
+        """
+        snapshot_date = snapshot_date if snapshot_date is not None else datetime.date.today()
+        df = df_statistics[df_statistics[team_column].notna()]
+
+        stats = df.drop(columns=team_column)
+        stats = stats.astype(object).where(stats.notna(), None).to_dict("records")
+        rows = [(team, table_name, snapshot_date.isoformat(), league, season,
+                 json.dumps(values, ensure_ascii=False, default=str))
+                for team, values in zip(df[team_column].astype(str), stats)]
+
+        with self.lock, self.connection:
+            self._upsert_teams(set(df[team_column].astype(str)))
+            self.connection.executemany(
+                """
+                INSERT OR REPLACE INTO snapshots (team_id, table_name, snapshot_date, league, season, stats)
+                VALUES ((SELECT team_id FROM teams WHERE name = ?), ?, ?, ?, ?, ?)
+                """, rows)
+        return len(rows)
+
+    def read_matches(self, leagues: list = None, seasons: list = None, start: datetime.date = None,
+                     end: datetime.date = None, team: str = None) -> pd.DataFrame:
+        """
+        Reads a slice of the matches, in the format of the fbref schedule (Date, Heure, Domicile, xG, Score,
+        xG.1, Extérieur), so that it can be given to the data preparation functions (e.g. prepare_schedule).
+
+        Args:
+            leagues (list, optional): The leagues to read. Defaults to None (all the leagues).
+            seasons (list, optional): The seasons to read. Defaults to None (all the seasons).
+            start (datetime.date, optional): The first date. Defaults to None.
+            end (datetime.date, optional): The last date. Defaults to None.
+            team (str, optional): Only the matches of this team (home or away). Defaults to None.
+
+        Returns:
+            pd.DataFrame: The matches sorted by date, with the league and season columns.
+        """
+        conditions, params = [], []
+        if leagues is not None:
+            conditions.append(f"m.league IN ({', '.join('?' * len(leagues))})")
+            params += list(leagues)
+        if seasons is not None:
+            conditions.append(f"m.season IN ({', '.join('?' * len(seasons))})")
+            params += list(seasons)
+        if start is not None:
+            conditions.append("m.date >= ?")
+            params.append(start.isoformat())
+        if end is not None:
+            conditions.append("m.date <= ?")
+            params.append(end.isoformat())
+        if team is not None:
+            conditions.append("(m.home_id = (SELECT team_id FROM teams WHERE name = ?) "
+                              "OR m.away_id = (SELECT team_id FROM teams WHERE name = ?))")
+            params += [team, team]
+
+        query = f"""
+            SELECT m.league, m.season, m.date AS "Date", m.time AS "Heure", h.name AS "Domicile",
+                   m.home_xg AS "xG", m.home_goals, m.away_goals, m.away_xg AS "xG.1", a.name AS "Extérieur"
+            FROM matches m JOIN teams h ON h.team_id = m.home_id JOIN teams a ON a.team_id = m.away_id
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY m.date, m.time, m.match_id
+        """
+        with self.lock:
+            df = pd.read_sql_query(query, self.connection, params=params)
+
+        # The score of the fbref schedule, e.g. "2–1"
+        played = df["home_goals"].notna()
+        score = pd.Series(None, index=df.index, dtype=object)
+        score[played] = df.loc[played, "home_goals"].astype(int).astype(str) + "–" + \
+            df.loc[played, "away_goals"].astype(int).astype(str)
+        df.insert(df.columns.get_loc("home_goals"), "Score", score)
+        return df.drop(columns=["home_goals", "away_goals"])
+
+    def read_snapshot(self, table_name: str, as_of: datetime.date = None, leagues: list = None,
+                      seasons: list = None, teams: list = None, team_column: str = "Équipe") -> pd.DataFrame:
+        """
+        Reads the statistics of the teams as they were at a date: the last snapshot of each team
+        taken on or before the date.
+
+        Args:
+            table_name (str): The name of the table (see normalize_table_name).
+            as_of (datetime.date, optional): The date. Defaults to None (the last snapshots).
+            leagues (list, optional): The leagues to read. Defaults to None (all the leagues).
+            seasons (list, optional): The seasons to read. Defaults to None (all the seasons).
+            teams (list, optional): The teams to read. Defaults to None (all the teams).
+            team_column (str, optional): The name of the column with the team. Defaults to "Équipe".
+
+        Returns:
+            pd.DataFrame: The statistics, one row per team, in the format of the scraped table,
+                with the league, season and snapshot_date columns.
+        """
+        as_of = (as_of if as_of is not None else datetime.date.max).isoformat()
+        conditions, params = ["s.table_name = ?", "s.snapshot_date <= ?"], [table_name, as_of]
+        for column, values in (("s.league", leagues), ("s.season", seasons), ("t.name", teams)):
+            if values is not None:
+                conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params += list(values)
+        params += [as_of]
+
+        query = f"""
+            SELECT t.name, s.league, s.season, s.snapshot_date, s.stats
+            FROM snapshots s JOIN teams t ON t.team_id = s.team_id
+            WHERE {" AND ".join(conditions)}
+            AND s.snapshot_date = (SELECT MAX(snapshot_date) FROM snapshots
+                                   WHERE team_id = s.team_id AND table_name = s.table_name AND snapshot_date <= ?)
+            ORDER BY s.league, t.name
+        """
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+
+        df = pd.DataFrame([json.loads(row[4]) for row in rows])
+        df.insert(0, team_column, [row[0] for row in rows])
+        for position, column in enumerate(("league", "season", "snapshot_date")):
+            df[column] = [row[1 + position] for row in rows]
+        return df
+
+    def _upsert_teams(self, names: set):
+        """
+        Inserts the teams that are not in the database yet (called in the transaction of the caller).
+        """
+        self.connection.executemany("INSERT OR IGNORE INTO teams (name) VALUES (?)", [(name,) for name in names])
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        self.connection.close()
+
+
+def _get_column(df: pd.DataFrame, column: str):
+    """
+    Returns the values of a column of the schedule, or missing values if the schedule does not have it.
+    """
+    return df[column].to_numpy(dtype=object) if column in df.columns else [None] * len(df)
+
+
+def _to_text(value) -> str:
+    return None if value is None or pd.isna(value) else str(value)
+
+
+def _to_int(value) -> int:
+    return None if value is None or pd.isna(value) else int(value)
+
+
+def _to_float(value) -> float:
+    return None if value is None or pd.isna(value) else float(value)
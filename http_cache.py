@@ -0,0 +1,148 @@
+"""
+This file contains the on-disk cache of the HTTP responses.
+"""
+
+import sqlite3
+import threading
+import zlib
+import os
+from time import time
+from typing import NamedTuple
+
+
+class CachedResponse(NamedTuple):
+    """
+    This class is used to store a cached response.
+    """
+    url: str
+    body: bytes
+    encoding: str
+    etag: str
+    last_modified: str
+    validated_at: float
+
+
+class ResponseCache:
+    """
+    This class is used to store the responses on disk, keyed by url.
+    The bodies are compressed and the least recently used entries are evicted when the cache is too big.
+    """
+    def __init__(self, path: str = "data/cache/responses.db", ttl: float = 3600,
+                 max_size: int = 200 * 1024 * 1024):
+        """
+        Args:
+            path (str, optional): The path of the database. Defaults to "data/cache/responses.db".
+            ttl (float, optional): The number of seconds a response is used without revalidation. Defaults to 3600.
+            max_size (int, optional): The maximum size in bytes of the compressed bodies. Defaults to 200 MB.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+        # Create the directory if it does not exist
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                encoding TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                validated_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.connection.commit()
+
+    def get(self, url: str) -> CachedResponse:
+        """
+        Returns the cached response of the url, or None if there is none.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT body, encoding, etag, last_modified, validated_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (time(), url))
+            self.connection.commit()
+
+        body, encoding, etag, last_modified, validated_at = row
+        return CachedResponse(url, zlib.decompress(body), encoding, etag, last_modified, validated_at)
+
+    def is_fresh(self, response: CachedResponse, max_age: float = None) -> bool:
+        """
+        Returns True if the response can be used without revalidation.
+
+        Args:
+            response (CachedResponse): The cached response.
+            max_age (float, optional): The maximum age in seconds accepted by the caller, when it is
+                shorter than the TTL. Defaults to None (the TTL).
+        """
+        ttl = self.ttl if max_age is None else min(self.ttl, max_age)
+        return time() - response.validated_at < ttl
+
+    def put(self, url: str, body: bytes, encoding: str = None, etag: str = None, last_modified: str = None):
+        """
+        Stores the response of the url, then evicts the least recently used entries if needed.
+        """
+        compressed = zlib.compress(body)
+        now = time()
+
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, compressed, encoding, etag, last_modified, len(compressed), now, now)
+            )
+            self._evict()
+            self.connection.commit()
+
+    def revalidate(self, url: str):
+        """
+        Marks the response of the url as validated now (the server answered 304 Not Modified).
+        """
+        with self.lock:
+            self.connection.execute("UPDATE responses SET validated_at = ? WHERE url = ?", (time(), url))
+            self.connection.commit()
+
+    def _evict(self):
+        """
+        Deletes the least recently used entries until the cache fits in max_size.
+        """
+        total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+
+        rows = self.connection.execute("SELECT url, size FROM responses ORDER BY accessed_at").fetchall()
+        evicted = []
+        for url, size in rows:
+            if total_size <= self.max_size:
+                break
+            evicted.append((url,))
+            total_size -= size
+
+        self.connection.executemany("DELETE FROM responses WHERE url = ?", evicted)
+
+    def clear(self):
+        """
+        Deletes all the entries.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        self.connection.close()
@@ -0,0 +1,206 @@
+"""
+This file contains the HTTP client shared by the scrapers.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlsplit
+from time import sleep, monotonic
+import threading
+import asyncio
+
+from http_cache import ResponseCache, CachedResponse
+from instrumentation import METRICS
+
+
+# Status codes that are worth retrying (rate limited or temporary server errors)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    This class is used to limit the number of requests sent to a host.
+    """
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """
+        Args:
+            rate (float): The number of tokens added per second.
+            capacity (float, optional): The maximum number of tokens in the bucket. Defaults to 1.0.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes one token from the bucket, waiting until one is available.
+        """
+        wait = self._reserve()
+        if wait > 0:
+            sleep(wait)
+
+    async def acquire_async(self):
+        """
+        Takes one token from the bucket, waiting in the event loop until one is available.
+        """
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _reserve(self) -> float:
+        """
+        Takes one token from the bucket and returns the number of seconds to wait before using it.
+        """
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+            # Reserve the token now so that concurrent callers queue up behind us
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+class HttpClient:
+    """
+    This class is used to send polite HTTP requests through one keep-alive connection pool.
+    """
+    def __init__(self, rate: float = 1.0, burst: float = 1.0, max_retries: int = 3, backoff: float = 1.0,
+                 timeout: float = 30, pool_size: int = 10, cache: ResponseCache = None):
+        """
+        Args:
+            rate (float, optional): The maximum number of requests per second for each host. Defaults to 1.0.
+            burst (float, optional): The number of requests that can be sent at once to a host. Defaults to 1.0.
+            max_retries (int, optional): The number of retries on 429/5xx and connection errors. Defaults to 3.
+            backoff (float, optional): The base delay in seconds of the exponential backoff. Defaults to 1.0.
+            timeout (float, optional): The timeout in seconds of a request. Defaults to 30.
+            pool_size (int, optional): The number of connections kept alive for each host. Defaults to 10.
+            cache (ResponseCache, optional): The cache of the responses. Defaults to None (no cache).
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _get_bucket(self, url: str) -> TokenBucket:
+        """
+        Returns the token bucket of the host of the url.
+        """
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[host]
+
+    def _get_retry_delay(self, response: requests.Response, attempt: int) -> float:
+        """
+        Returns the delay before the next attempt, following the Retry-After header if any.
+        """
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** attempt
+
+    def get(self, url: str, headers: dict = None, max_age: float = None) -> requests.Response:
+        """
+        Sends a GET request, waiting for the host rate limit and retrying on 429/5xx.
+        If the client has a cache, fresh responses are returned without any request
+        and stale ones are revalidated with a conditional request.
+
+        Args:
+            url (str): The url to fetch.
+            headers (dict, optional): Additional headers of the request. Defaults to None.
+            max_age (float, optional): The maximum age in seconds of a cached response returned
+                without revalidation (0 to always revalidate). Defaults to None (the TTL of the cache).
+
+        Returns:
+            requests.Response: The last response received.
+        """
+        if self.cache is None:
+            return self._send(url, headers)
+
+        cached = self.cache.get(url)
+        if cached is not None and self.cache.is_fresh(cached, max_age=max_age):
+            METRICS.increment("http_cache_hits")
+            return _build_response(cached)
+
+        headers = dict(headers or {})
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        response = self._send(url, headers)
+
+        if response.status_code == 304 and cached is not None:
+            METRICS.increment("http_cache_revalidations")
+            self.cache.revalidate(url)
+            return _build_response(cached)
+
+        METRICS.increment("http_cache_misses")
+
+        if response.status_code == 200:
+            self.cache.put(url, response.content, encoding=response.encoding,
+                           etag=response.headers.get("ETag"),
+                           last_modified=response.headers.get("Last-Modified"))
+
+        return response
+
+    def _send(self, url: str, headers: dict = None) -> requests.Response:
+        """
+        Sends a GET request on the network, waiting for the host rate limit and retrying on 429/5xx.
+        """
+        bucket = self._get_bucket(url)
+
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            try:
+                response = self.session.get(url=url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                sleep(self._get_retry_delay(None, attempt))
+                continue
+
+            host = urlsplit(url).netloc
+            METRICS.increment("http_requests", host=host, status=response.status_code)
+            METRICS.increment("http_bytes", len(response.content), host=host)
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                sleep(self._get_retry_delay(response, attempt))
+                continue
+
+            return response
+
+    def close(self):
+        """
+        Closes the connections of the pool.
+        """
+        self.session.close()
+
+
+def _build_response(cached: CachedResponse) -> requests.Response:
+    """
+    Builds a response from a cached response.
+    """
+    response = requests.Response()
+    response.url = cached.url
+    response.status_code = 200
+    response.encoding = cached.encoding
+    response.headers = CaseInsensitiveDict()
+    response._content = cached.body
+    return response
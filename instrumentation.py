@@ -0,0 +1,267 @@
+"""
+This file contains the instrumentation of the pipeline: the wall time of the stages, counters
+(bytes fetched, rows parsed, cache hits, LLM tokens, ...) and the peak memory of the process.
+
+The measures are kept in memory, written as structured (json) logs and exported in the Prometheus
+text format, e.g. for the textfile collector of the node exporter. A stage costs a few microseconds,
+so the instrumentation can stay on in production.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+from time import perf_counter, time
+from functools import wraps
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows: the peak memory is not measured
+    resource = None
+
+
+PREFIX = "guru"
+
+logger = logging.getLogger(PREFIX)
+
+
+class Metrics:
+    """
+    This class is used to store the measures of the pipeline: the counters and the durations of the stages,
+    by name and labels.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        # (stage, labels) -> [count, total seconds, max seconds]
+        self.durations = {}
+        self.lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels):
+        """
+        Adds a value to a counter (e.g. increment("http_bytes", 1024, host="fbref.com")).
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """
+        Sets the value of a gauge.
+        """
+        with self.lock:
+            self.gauges[name, tuple(sorted(labels.items()))] = value
+
+    def observe(self, stage: str, seconds: float, **labels):
+        """
+        Records a duration of a stage.
+        """
+        key = (stage, tuple(sorted(labels.items())))
+        with self.lock:
+            duration = self.durations.get(key)
+            if duration is None:
+                self.durations[key] = [1, seconds, seconds]
+            else:
+                duration[0] += 1
+                duration[1] += seconds
+                duration[2] = max(duration[2], seconds)
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the measures in the Prometheus text format.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            durations = {key: list(value) for key, value in self.durations.items()}
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            lines += [f"{PREFIX}_{name}_total{_format_labels(labels)} {value}"
+                      for (other, labels), value in counters.items() if other == name]
+
+        for name in sorted({name for name, _ in gauges}):
+            lines.append(f"# TYPE {PREFIX}_{name} gauge")
+            lines += [f"{PREFIX}_{name}{_format_labels(labels)} {value}"
+                      for (other, labels), value in gauges.items() if other == name]
+
+        if durations:
+            lines.append(f"# TYPE {PREFIX}_stage_seconds summary")
+            for (stage, labels), (count, total, _) in sorted(durations.items()):
+                labels = (("stage", stage),) + labels
+                lines.append(f"{PREFIX}_stage_seconds_count{_format_labels(labels)} {count}")
+                lines.append(f"{PREFIX}_stage_seconds_sum{_format_labels(labels)} {total}")
+            lines.append(f"# TYPE {PREFIX}_stage_seconds_max gauge")
+            for (stage, labels), (_, _, maximum) in sorted(durations.items()):
+                lines.append(f"{PREFIX}_stage_seconds_max{_format_labels((('stage', stage),) + labels)} {maximum}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str = "data/metrics/guru.prom"):
+        """
+        Writes the measures to a Prometheus text file, writing to a temporary file first
+        so that the collector never reads a partial file.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        os.replace(path + ".tmp", path)
+
+    def reset(self):
+        """
+        Removes all the measures.
+        """
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.durations.clear()
+
+
+# Measures of the process, used by default by the stages (see Stage)
+METRICS = Metrics()
+
+
+class Stage:
+    """
+    This class is used to measure a stage of the pipeline, as a context manager or as a decorator.
+    The wall time and the peak memory are recorded, and the counters added with add are recorded
+    with the name of the stage. The decorator also counts the rows of the dataframes returned.
+
+    Example:
+        with Stage("parse", league="Ligue-1") as measure:
+            tables = extract_tables(content)
+            measure.add(rows=sum(len(table.data) for table in tables))
+    """
+    def __init__(self, name: str, metrics: Metrics = None, **labels):
+        """
+        Args:
+            name (str): The name of the stage.
+            metrics (Metrics, optional): The measures. Defaults to METRICS.
+            **labels: The labels of the measures (e.g. league="Ligue-1").
+        """
+        self.name = name
+        self.metrics = metrics if metrics is not None else METRICS
+        self.labels = labels
+        self.counts = {}
+        self.start = None
+
+    def add(self, **counts):
+        """
+        Adds values to the counters of the stage (e.g. add(rows=380, bytes=52000)).
+        """
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def __enter__(self):
+        self.counts = {}
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = perf_counter() - self.start
+        self.metrics.observe(self.name, seconds, **self.labels)
+        for name, value in self.counts.items():
+            self.metrics.increment(name, value, stage=self.name, **self.labels)
+        if exc_type is not None:
+            self.metrics.increment("stage_errors", stage=self.name, **self.labels)
+
+        peak = get_peak_memory()
+        if peak is not None:
+            self.metrics.set_gauge("process_peak_memory_bytes", peak)
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("stage", extra={"fields": {"stage": self.name, "seconds": round(seconds, 6),
+                                                   "error": exc_type.__name__ if exc_type else None,
+                                                   "peak_memory": peak, **self.labels, **self.counts}})
+        return False
+
+    def __call__(self, function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with Stage(self.name, metrics=self.metrics, **self.labels) as measure:
+                result = function(*args, **kwargs)
+                if hasattr(result, "shape"):
+                    measure.add(rows=result.shape[0])
+                return result
+        return wrapper
+
+
+def get_peak_memory() -> int:
+    """
+    Returns the peak resident memory of the process in bytes, or None if it can not be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives kilobytes, macOS gives bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    This class is used to write the logs as json lines, with the fields of the stages.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"time": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: int = logging.INFO, stream=None):
+    """
+    Writes the logs of the pipeline as json lines.
+
+    Args:
+        level (int, optional): The level of the logs. Defaults to logging.INFO.
+        stream (optional): The stream of the logs. Defaults to sys.stderr.
+    """
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    logger.handlers = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def start_exporter(path: str = "data/metrics/guru.prom", interval: float = 15,
+                   metrics: Metrics = None) -> threading.Event:
+    """
+    Writes the measures to a Prometheus text file every interval seconds, in a background thread.
+
+    Args:
+        path (str, optional): The path of the file. Defaults to "data/metrics/guru.prom".
+        interval (float, optional): The number of seconds between two writes. Defaults to 15.
+        metrics (Metrics, optional): The measures. Defaults to METRICS.
+
+    Returns:
+        threading.Event: The event that stops the exporter when it is set.
+    """
+    metrics = metrics if metrics is not None else METRICS
+    stopped = threading.Event()
+
+    def export():
+        while not stopped.wait(interval):
+            metrics.set_gauge("last_export_timestamp_seconds", time())
+            metrics.write_prometheus(path)
+        metrics.write_prometheus(path)
+
+    threading.Thread(target=export, name="metrics-exporter", daemon=True).start()
+    return stopped
+
+
+def _format_labels(labels: tuple) -> str:
+    """
+    Returns the labels in the Prometheus format (e.g. '{stage="fetch",league="Ligue-1"}').
+    """
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
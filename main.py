@@ -1,17 +1,22 @@
-from langchain.document_loaders import AsyncChromiumLoader
-from langchain.document_transformers import BeautifulSoupTransformer
 import pprint
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import create_extraction_chain
-from langchain.chat_models import ChatOpenAI
 import os
-import pandas as pd
+import json
+import asyncio
 
+from extraction_cache import ExtractionCache
+from http_client import TokenBucket
+from table_extractor import tables_to_text, tables_to_chunks
+from extraction_router import ExtractionRouter
+from instrumentation import Stage, METRICS
+
+# Note: langchain and playwright are imported by the functions that use them, so importing this file
+# (e.g. for its schemas) stays fast and does not need an API key.
 
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
-llm = ChatOpenAI(openai_api_key=OPENAI_API_KEY, temperature=0, model="gpt-3.5-turbo-0613")
+# The default chat model, created on the first extraction (see get_llm)
+_llm = None
 
 schema = {
     "properties": {
@@ -299,31 +304,295 @@ schema_a = {
 
 
 
-def extract(content: str, schema: dict):
-    return create_extraction_chain(schema=schema, llm=llm, verbose=True).run(content)
+def get_llm():
+    """
+    Returns the default chat model (gpt-3.5), created on the first call.
+    """
+    global _llm
+    if _llm is None:
+        from langchain.chat_models import ChatOpenAI
+        _llm = ChatOpenAI(openai_api_key=OPENAI_API_KEY, temperature=0, model="gpt-3.5-turbo-0613")
+    return _llm
+
+
+def get_model_name(llm) -> str:
+    """
+    Returns the name of the model of the chat model, used in the key of the cached extractions.
+    """
+    return getattr(llm, "model_name", type(llm).__name__)
+
+
+def extract(content: str, schema: dict, llm=None, cache: ExtractionCache = None):
+    """
+    Extracts the content with the LLM, unless the same content was already extracted
+    with the same schema and model.
+
+    Args:
+        content (str): The content to extract.
+        schema (dict): The schema of the extraction.
+        llm (optional): The chat model. Defaults to the gpt-3.5 model (see get_llm).
+        cache (ExtractionCache, optional): The cache of the extractions. Defaults to None (no cache).
 
+    Returns:
+        list: The extracted content.
+    """
+    llm = llm if llm is not None else get_llm()
+    model = get_model_name(llm)
+    if cache is not None:
+        extracted_content = cache.get(content, schema, model)
+        if extracted_content is not None:
+            METRICS.increment("extraction_cache_hits", model=model)
+            return extracted_content
 
-def scrape_with_playwright(urls, schema):
-    
-    loader = AsyncChromiumLoader(urls)
-    docs = loader.load()
-    bs_transformer = BeautifulSoupTransformer()
-    docs_transformed = bs_transformer.transform_documents(docs,tags_to_extract=["span"])
-    print("Extracting content with LLM")
+    from langchain.chains import create_extraction_chain
+    from langchain.callbacks import get_openai_callback
 
-    # Grab the first 1000 tokens of the site
-    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=1000, 
-                                                                    chunk_overlap=0, seperator="Regular season")
-    splits = splitter.split_documents(docs_transformed)
-    
-    # Process the first split 
-    extracted_content = extract(
-        schema=schema, content=splits[0].page_content
-    )
-    pprint.pprint(extracted_content)
+    with Stage("llm_extract", model=model) as measure, get_openai_callback() as callback:
+        extracted_content = create_extraction_chain(schema=schema, llm=llm).run(content)
+        measure.add(prompt_tokens=callback.prompt_tokens, completion_tokens=callback.completion_tokens)
+
+    if cache is not None:
+        cache.put(content, schema, model, extracted_content)
+    return extracted_content
+
+
+async def extract_async(content: str, schema: dict, llm=None, cache: ExtractionCache = None,
+                        rate_limiter: TokenBucket = None):
+    """
+    Extracts the content with the LLM without blocking the event loop (see extract).
+    The rate limiter is only used when the content is not in the cache.
+
+    Args:
+        content (str): The content to extract.
+        schema (dict): The schema of the extraction.
+        llm (optional): The chat model. Defaults to the gpt-3.5 model (see get_llm).
+        cache (ExtractionCache, optional): The cache of the extractions. Defaults to None (no cache).
+        rate_limiter (TokenBucket, optional): The limit of the LLM calls. Defaults to None (no limit).
+
+    Returns:
+        list: The extracted content.
+    """
+    llm = llm if llm is not None else get_llm()
+    model = get_model_name(llm)
+    if cache is not None:
+        extracted_content = cache.get(content, schema, model)
+        if extracted_content is not None:
+            METRICS.increment("extraction_cache_hits", model=model)
+            return extracted_content
+
+    from langchain.chains import create_extraction_chain
+    from langchain.callbacks import get_openai_callback
+
+    if rate_limiter is not None:
+        await rate_limiter.acquire_async()
+    with Stage("llm_extract", model=model) as measure, get_openai_callback() as callback:
+        extracted_content = await create_extraction_chain(schema=schema, llm=llm).arun(content)
+        measure.add(prompt_tokens=callback.prompt_tokens, completion_tokens=callback.completion_tokens)
+
+    if cache is not None:
+        cache.put(content, schema, model, extracted_content)
     return extracted_content
 
 
+async def extract_chunks(chunks: list, schema: dict, llm=None, cache: ExtractionCache = None,
+                         concurrency: int = 4, rate: float = 1.0) -> list:
+    """
+    Extracts all the chunks of a page concurrently.
+
+    Args:
+        chunks (list): The contents to extract.
+        schema (dict): The schema of the extraction.
+        llm (optional): The chat model. Defaults to the gpt-3.5 model (see get_llm).
+        cache (ExtractionCache, optional): The cache of the extractions. Defaults to None (no cache).
+        concurrency (int, optional): The maximum number of LLM calls in flight. Defaults to 4.
+        rate (float, optional): The maximum number of LLM calls started per second. Defaults to 1.0.
+
+    Returns:
+        list: The extracted content of each chunk, in the order of the chunks.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limiter = TokenBucket(rate, capacity=concurrency)
+
+    async def extract_chunk(chunk: str):
+        async with semaphore:
+            return await extract_async(chunk, schema, llm=llm, cache=cache, rate_limiter=rate_limiter)
+
+    return await asyncio.gather(*(extract_chunk(chunk) for chunk in chunks))
+
+
+def merge_extractions(results: list) -> list:
+    """
+    Merges the extracted contents of the chunks of a page.
+    When the schema has array properties (e.g. the regular_season table of schema_a or the goalkeepers
+    of schema_team_squad), the rows of the arrays are concatenated and de-duplicated into a single object,
+    and the other properties keep their first value. Otherwise the objects are de-duplicated.
+
+    Args:
+        results (list): The extracted content of each chunk.
+
+    Returns:
+        list: The merged content.
+    """
+    objects = [item for result in results for item in (result or []) if isinstance(item, dict)]
+
+    if not any(isinstance(value, list) for item in objects for value in item.values()):
+        return _deduplicate(objects)
+
+    merged = {}
+    for item in objects:
+        for key, value in item.items():
+            if isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+            elif value not in (None, "") and merged.get(key) in (None, ""):
+                merged[key] = value
+
+    return [{key: _deduplicate(value) if isinstance(value, list) else value for key, value in merged.items()}]
+
+
+def _deduplicate(rows: list) -> list:
+    """
+    Removes the repeated rows (a row cut between two chunks is often extracted twice), keeping the order.
+    """
+    seen = set()
+    unique = []
+    for row in rows:
+        key = json.dumps(row, sort_keys=True, ensure_ascii=False)
+        if key not in seen:
+            seen.add(key)
+            unique.append(row)
+    return unique
+
+
+def prune_documents(docs: list) -> list:
+    """
+    Keeps only the tables of the pages, as compact text. The pages without table
+    fall back to the text of their spans.
+    """
+    pruned = []
+    fallback = []
+    for doc in docs:
+        text = tables_to_text(doc.page_content) if doc.page_content.strip() else ""
+        if text:
+            doc.page_content = text
+            pruned.append(doc)
+        else:
+            fallback.append(doc)
+
+    if fallback:
+        from langchain.document_transformers import BeautifulSoupTransformer
+        pruned += BeautifulSoupTransformer().transform_documents(fallback, tags_to_extract=["span"])
+    return pruned
+
+
+async def extract_page_async(content: str, schema: dict, llm=None, cache: ExtractionCache = None,
+                             chunk_size: int = 1000, concurrency: int = 4, rate: float = 1.0) -> list:
+    """
+    Extracts a page with the LLM. The page is pruned to its tables, cut between their rows with the caption
+    and the header of the table at the top of every chunk, then all the chunks are extracted concurrently and merged.
+
+    Args:
+        content (str): The HTML content of the page.
+        schema (dict): The schema of the extraction.
+        llm (optional): The chat model. Defaults to the gpt-3.5 model (see get_llm).
+        cache (ExtractionCache, optional): The cache of the extractions. Defaults to None (no cache).
+        chunk_size (int, optional): The number of tokens of a chunk. Defaults to 1000.
+        concurrency (int, optional): The maximum number of LLM calls in flight. Defaults to 4.
+        rate (float, optional): The maximum number of LLM calls started per second. Defaults to 1.0.
+
+    Returns:
+        list: The extracted content.
+    """
+    import tiktoken
+
+    # Cut the tables between their rows, every chunk starting with the caption and the header of its table
+    encoding = tiktoken.get_encoding("gpt2")
+    chunks = tables_to_chunks(content, chunk_size, length_function=lambda text: len(encoding.encode(text)))
+
+    if not chunks:
+        from langchain.schema import Document
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        # No table: the text of the spans, split between the lines
+        splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=chunk_size, chunk_overlap=0,
+                                                                        separators=["\n\n", "\n", " "])
+        chunks = [split.page_content for split in splitter.split_documents(prune_documents([Document(
+            page_content=content)]))]
+
+    results = await extract_chunks(chunks, schema, llm=llm, cache=cache, concurrency=concurrency, rate=rate)
+    return merge_extractions(results)
+
+
+def extract_page(content: str, schema: dict, llm=None, cache: ExtractionCache = None, chunk_size: int = 1000,
+                 concurrency: int = 4, rate: float = 1.0) -> list:
+    """
+    Extracts a page with the LLM from synchronous code (see extract_page_async for the arguments).
+    It raises a RuntimeError in a running event loop, where extract_page_async must be awaited instead.
+
+    Returns:
+        list: The extracted content.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(extract_page_async(content, schema, llm=llm, cache=cache, chunk_size=chunk_size,
+                                              concurrency=concurrency, rate=rate))
+    raise RuntimeError("extract_page can not run in an event loop, await extract_page_async instead")
+
+
+def scrape_with_playwright(urls, schema, llm=None, cache: ExtractionCache = None, chunk_size: int = 1000,
+                           concurrency: int = 4, rate: float = 1.0, router: ExtractionRouter = None,
+                           pool: "BrowserPool" = None):
+    """
+    Scrapes pages and extracts their content. The tables of each page are first mapped to the schema
+    without LLM, and the page is only extracted with the LLM when the result does not validate.
+
+    Args:
+        urls (list): The URLs of the pages.
+        schema (dict): The schema of the extraction.
+        llm (optional): The chat model. Defaults to the gpt-3.5 model (see get_llm).
+        cache (ExtractionCache, optional): The cache of the extractions. Defaults to None (no cache).
+        chunk_size (int, optional): The number of tokens of a chunk. Defaults to 1000.
+        concurrency (int, optional): The maximum number of LLM calls in flight. Defaults to 4.
+        rate (float, optional): The maximum number of LLM calls started per second. Defaults to 1.0.
+        router (ExtractionRouter, optional): The router of the extractions, which records the tier
+            of each page. Defaults to a new router with the LLM as fallback.
+        pool (BrowserPool, optional): The browser that renders the pages, kept open between calls.
+            Defaults to a browser opened for this call only.
+
+    Returns:
+        dict: The extracted content of each page, by url (the pages that failed to render are skipped).
+    """
+    if router is None:
+        router = ExtractionRouter(fallback=lambda content, schema: extract_page(
+            content, schema, llm=llm, cache=cache, chunk_size=chunk_size, concurrency=concurrency, rate=rate))
+
+    if pool is not None:
+        docs = pool.load(urls)
+    else:
+        from browser_pool import BrowserPool
+
+        with BrowserPool() as pool:
+            docs = pool.load(urls)
+
+    results = {}
+    for doc in docs:
+        # The pages that failed to render (timeout, network error, ...) have no content to extract
+        if doc.metadata.get("error"):
+            METRICS.increment("pages_failed")
+            print(f"{doc.metadata.get('source')}: not rendered, skipped: {doc.metadata['error']}")
+            continue
+
+        page = router.extract(doc.page_content, schema, source=doc.metadata.get("source"))
+        METRICS.increment("pages_extracted", tier=page.tier)
+        print(f"{page.source}: extracted by the {page.tier} tier in {page.seconds:.2f}s")
+        for error in page.errors[:5]:
+            print(f"  {error}")
+        results[page.source] = page.result
+
+    pprint.pprint(results)
+    return results
+
+
 def main():
 
     # Recuperer le championnat
@@ -342,9 +611,17 @@ def main():
     #print(df)
     #df.to_csv("city_result.csv")
 
+    from browser_pool import BrowserPool
+
     urls = ["https://fbref.com/fr/comps/9/Statistiques-Premier-League"]
-    extracted_content = scrape_with_playwright(urls, schema=schema_a)
+    cache = ExtractionCache()
+    router = ExtractionRouter(fallback=lambda content, schema: extract_page(content, schema, cache=cache))
+    with BrowserPool(wait_for_selector="table") as pool:
+        extracted_content = scrape_with_playwright(urls, schema=schema_a, cache=cache, router=router, pool=pool)
     print(extracted_content)
+    print(cache.stats())
+    print(router.stats())
+    METRICS.write_prometheus()
 
 if __name__ == "__main__": 
     main()
\ No newline at end of file
@@ -0,0 +1,481 @@
+"""
+This file contains the prediction server: a local HTTP service that answers the expected goals
+and the market probabilities of matchups in milliseconds.
+
+The models and the features of the teams are loaded once and replaced atomically when a new artifact
+is trained. The concurrent requests are grouped in micro-batches predicted with one call to each model,
+and the recent matchups are cached.
+
+Usage:
+    python prediction_server.py [--port 8000] [--leagues Premier-League Ligue-1]
+
+    GET  /predict?league=Premier-League&home=Fulham&away=Chelsea
+    POST /predict  {"league": "Premier-League", "matches": [{"home": "Fulham", "away": "Chelsea"}]}
+    POST /reload
+    GET  /health
+    GET  /metrics  (Prometheus text format, with the p50/p99 latency)
+"""
+
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import os
+import threading
+import queue
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import perf_counter
+from typing import NamedTuple
+from urllib.parse import urlsplit, parse_qs
+
+from football_scraper import League, current_season
+from dataset_store import DatasetStore
+from team_index import TeamFeatureIndex
+from scoreline import price_fixtures
+from training import load_models
+from instrumentation import METRICS
+
+
+class LeagueModel(NamedTuple):
+    version: int
+    features: tuple
+    index: TeamFeatureIndex
+    home_model: object
+    away_model: object
+
+
+def load_statistics(league: str, store: DatasetStore = None, table: str = "results_overall") -> pd.DataFrame:
+    """
+    Returns the current statistics of the teams of a league from the dataset.
+
+    Args:
+        league (str): The name of the league.
+        store (DatasetStore, optional): The dataset. Defaults to the dataset in data/dataset.
+        table (str, optional): The table of the statistics. Defaults to "results_overall" (the league table).
+
+    Returns:
+        pd.DataFrame: The statistics, one row per team.
+    """
+    store = store if store is not None else DatasetStore()
+    return store.read(table, leagues=[league], seasons=[current_season()])
+
+
+def load_team_index(league: str, columns: list = None, directory: str = "data/features", store: DatasetStore = None,
+                    table: str = "results_overall") -> TeamFeatureIndex:
+    """
+    Returns the features of the teams of a league from the feature cache (<directory>/<league>.npz),
+    which is rebuilt from the statistics when they were written after it.
+
+    Args:
+        league (str): The name of the league.
+        columns (list, optional): The features (e.g. of the models). Defaults to all the cached features.
+        directory (str, optional): The directory of the feature cache. Defaults to "data/features".
+        store (DatasetStore, optional): The dataset. Defaults to the dataset in data/dataset.
+        table (str, optional): The table of the statistics. Defaults to "results_overall" (the league table).
+
+    Returns:
+        TeamFeatureIndex: The features of the teams.
+    """
+    store = store if store is not None else DatasetStore()
+    path = os.path.join(directory, f"{league}.npz")
+    modified = store.get_modified_time(table, league, current_season())
+
+    if os.path.exists(path) and (modified is None or os.path.getmtime(path) >= modified):
+        index = TeamFeatureIndex.load(path)
+    else:
+        index = TeamFeatureIndex.from_statistics(load_statistics(league, store, table))
+        index.save(path)
+
+    return index.select(columns) if columns is not None else index
+
+
+class MicroBatcher:
+    """
+    This class is used to group the requests of concurrent threads: a worker thread takes the first waiting
+    request, waits a short time for others, and processes them all with one call.
+    """
+    def __init__(self, process, max_batch: int = 64, max_wait: float = 0.002):
+        """
+        Args:
+            process (callable): The function processing a list of requests, returning one result per request.
+            max_batch (int, optional): The maximum number of requests of a batch. Defaults to 64.
+            max_wait (float, optional): The number of seconds to wait for other requests. Defaults to 0.002.
+        """
+        self.process = process
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.requests = 0
+        self.thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, request) -> Future:
+        """
+        Queues a request and returns the future of its result.
+        """
+        future = Future()
+        self.queue.put((request, future))
+        return future
+
+    def close(self):
+        """
+        Stops the worker thread after the queued requests.
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            deadline = perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - perf_counter()
+                try:
+                    item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                results = self.process([request for request, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+class PredictionService:
+    """
+    This class is used to predict matchups with the latest models of the leagues.
+    """
+    def __init__(self, leagues: list = None, model_directory: str = "models", statistics_loader=load_statistics,
+                 index_loader=None, max_batch: int = 64, max_wait: float = 0.002, cache_size: int = 10000,
+                 reload_interval: float = 30, max_goals: int = 10, rho: float = 0.0):
+        """
+        Args:
+            leagues (list, optional): The names of the leagues. Defaults to all the leagues.
+            model_directory (str, optional): The directory of the models. Defaults to "models".
+            statistics_loader (callable, optional): The function returning the statistics of the teams
+                of a league. Defaults to load_statistics.
+            index_loader (callable, optional): The function returning the features of the teams of a league
+                for the features of its models (e.g. load_team_index, which reads the feature cache).
+                Defaults to None (the features are built from the statistics of statistics_loader).
+            max_batch (int, optional): The maximum number of matchups of a batch. Defaults to 64.
+            max_wait (float, optional): The number of seconds a request waits for others. Defaults to 0.002.
+            cache_size (int, optional): The number of matchups cached. Defaults to 10000.
+            reload_interval (float, optional): The number of seconds between two checks for new artifacts
+                (0 to disable). Defaults to 30.
+            max_goals (int, optional): The maximum number of goals of a team. Defaults to 10.
+            rho (float, optional): The Dixon-Coles dependence of the low scores. Defaults to 0.0.
+        """
+        self.leagues = leagues if leagues is not None else [league.value for league in League]
+        self.model_directory = model_directory
+        self.statistics_loader = statistics_loader
+        self.index_loader = index_loader
+        self.cache_size = cache_size
+        self.reload_interval = reload_interval
+        self.max_goals = max_goals
+        self.rho = rho
+
+        self.models = {}
+        self.errors = {}
+        self.versions = 0
+        self.reload_lock = threading.Lock()
+
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.cache_hits = 0
+
+        self.latencies = deque(maxlen=10000)
+        self.batcher = MicroBatcher(self._predict_batch, max_batch=max_batch, max_wait=max_wait)
+        self.stopped = threading.Event()
+
+        self.reload(force=True)
+        if reload_interval:
+            threading.Thread(target=self._watch, name="model-reloader", daemon=True).start()
+
+    def reload(self, force: bool = False) -> list:
+        """
+        Loads the leagues whose artifact changed. The new models and features are built first,
+        then replace the old ones in one assignment, so a request never sees a partial state.
+
+        Args:
+            force (bool, optional): Whether to reload all the leagues (e.g. after new statistics). Defaults to False.
+
+        Returns:
+            list: The reloaded leagues.
+        """
+        reloaded = []
+        with self.reload_lock:
+            for league in self.leagues:
+                try:
+                    artifact = load_models(league, directory=self.model_directory)
+                    current = self.models.get(league)
+                    if not force and current is not None and current.home_model is artifact["models"]["home"]:
+                        continue
+
+                    columns = [feature[:-len("_dom")] for feature in artifact["features"] if feature.endswith("_dom")]
+                    if self.index_loader is not None:
+                        index = self.index_loader(league, columns)
+                    else:
+                        index = TeamFeatureIndex.from_statistics(self.statistics_loader(league), columns=columns)
+                    self.versions += 1
+                    self.models[league] = LeagueModel(self.versions, tuple(artifact["features"]), index,
+                                                      artifact["models"]["home"], artifact["models"]["away"])
+                    reloaded.append(league)
+                except Exception as e:
+                    # Only print the errors once, the watcher retries every interval
+                    if self.errors.get(league) != str(e):
+                        print(f"{league}: models not loaded: {e}")
+                    self.errors[league] = str(e)
+                else:
+                    self.errors.pop(league, None)
+
+        if reloaded:
+            print(f"Loaded the models of {', '.join(reloaded)}")
+        return reloaded
+
+    def predict(self, league: str, home: str, away: str) -> dict:
+        """
+        Predicts a matchup, from the cache or in the next micro-batch.
+
+        Args:
+            league (str): The name of the league.
+            home (str): The home team.
+            away (str): The away team.
+
+        Returns:
+            dict: The teams (home_team, away_team), the expected goals (home_xg, away_xg)
+                and the market probabilities (home, draw, away, ...).
+        """
+        model = self._get_model(league)
+        key = (league, model.version, home, away)
+
+        with self.cache_lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached
+
+        result = self.batcher.submit((model, home, away)).result()
+        self._cache(key, result)
+        return result
+
+    def predict_many(self, league: str, matches: list) -> list:
+        """
+        Predicts several matchups of a league with one call to each model.
+
+        Args:
+            league (str): The name of the league.
+            matches (list): The matchups, as {"home": ..., "away": ...} dicts.
+
+        Returns:
+            list: The prediction of each matchup.
+        """
+        model = self._get_model(league)
+        return self._predict_batch([(model, match["home"], match["away"]) for match in matches])
+
+    def close(self):
+        """
+        Stops the reloads and the micro-batches.
+        """
+        self.stopped.set()
+        self.batcher.close()
+
+    def record_latency(self, seconds: float):
+        """
+        Records the latency of a request.
+        """
+        self.latencies.append(seconds)
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the measures of the service in the Prometheus text format.
+        """
+        latencies = np.array(self.latencies)
+        lines = ["# TYPE guru_prediction_latency_seconds summary"]
+        if len(latencies):
+            for quantile in (0.5, 0.9, 0.99):
+                lines.append(f'guru_prediction_latency_seconds{{quantile="{quantile}"}} '
+                             f'{np.quantile(latencies, quantile)}')
+        lines += [f"guru_prediction_latency_seconds_count {len(latencies)}",
+                  f"guru_prediction_latency_seconds_sum {latencies.sum()}",
+                  "# TYPE guru_prediction_cache_hits_total counter",
+                  f"guru_prediction_cache_hits_total {self.cache_hits}",
+                  "# TYPE guru_prediction_batches_total counter",
+                  f"guru_prediction_batches_total {self.batcher.batches}",
+                  "# TYPE guru_prediction_batched_requests_total counter",
+                  f"guru_prediction_batched_requests_total {self.batcher.requests}",
+                  "# TYPE guru_prediction_models_version gauge",
+                  f"guru_prediction_models_version {self.versions}"]
+        return "\n".join(lines) + "\n" + METRICS.to_prometheus()
+
+    def _get_model(self, league: str) -> LeagueModel:
+        model = self.models.get(league)
+        if model is None:
+            raise KeyError(f"No models for the league {league}")
+        return model
+
+    def _predict_batch(self, requests: list) -> list:
+        """
+        Predicts the requests of a batch with one call to the models of each league.
+        The matchups with an unknown team get an error instead of a prediction.
+        """
+        results = [None] * len(requests)
+        models = {}
+        by_model = {}
+        for position, (model, home, away) in enumerate(requests):
+            models[model.version] = model
+            by_model.setdefault(model.version, []).append(position)
+
+        for version, positions in by_model.items():
+            model = models[version]
+            homes = [requests[position][1] for position in positions]
+            aways = [requests[position][2] for position in positions]
+            known = (model.index.get_ids(homes) >= 0) & (model.index.get_ids(aways) >= 0)
+
+            for position, home, away in zip(np.array(positions)[~known], np.array(homes)[~known],
+                                            np.array(aways)[~known]):
+                results[position] = {"home_team": home, "away_team": away, "error": "unknown team"}
+            if not known.any():
+                continue
+
+            X = model.index.get_matchup_features(np.array(homes)[known], np.array(aways)[known])
+            X = X[list(model.features)]
+            markets = price_fixtures(X, model.home_model, model.away_model, max_goals=self.max_goals, rho=self.rho)
+            for position, home, away, row in zip(np.array(positions)[known], np.array(homes)[known],
+                                                 np.array(aways)[known], markets.to_dict("records")):
+                results[position] = {"home_team": home, "away_team": away, **row}
+        return results
+
+    def _cache(self, key: tuple, result: dict):
+        with self.cache_lock:
+            self.cache[key] = result
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def _watch(self):
+        while not self.stopped.wait(self.reload_interval):
+            self.reload()
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    This class is used to answer the HTTP requests of the prediction server.
+    """
+    # Keep the connections alive between the requests of a client
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def do_GET(self):
+        start = perf_counter()
+        url = urlsplit(self.path)
+
+        if url.path == "/predict":
+            params = {name: values[0] for name, values in parse_qs(url.query).items()}
+            if not {"league", "home", "away"} <= set(params):
+                return self._send_json(400, {"error": "the league, home and away parameters are required"})
+            if params["league"] not in self.service.models:
+                return self._send_json(404, {"error": f"No models for the league {params['league']}"})
+
+            result = self.service.predict(params["league"], params["home"], params["away"])
+            self._send_json(200 if "error" not in result else 404, result)
+            self.service.record_latency(perf_counter() - start)
+        elif url.path == "/metrics":
+            self._send(200, self.service.to_prometheus().encode(), "text/plain; version=0.0.4")
+        elif url.path == "/health":
+            self._send_json(200, {"status": "ok", "leagues": sorted(self.service.models)})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        start = perf_counter()
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if url.path == "/predict":
+            try:
+                request = json.loads(body)
+                results = self.service.predict_many(request["league"], request["matches"])
+            except (KeyError, TypeError, ValueError) as e:
+                return self._send_json(400, {"error": f"invalid request: {e}"})
+            self._send_json(200, results)
+            self.service.record_latency(perf_counter() - start)
+        elif url.path == "/reload":
+            self._send_json(200, {"reloaded": self.service.reload(force=True)})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _send_json(self, status: int, content):
+        self._send(status, json.dumps(content, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # The requests are measured in /metrics instead of being logged one by one
+        pass
+
+
+def create_server(service: PredictionService, host: str = "127.0.0.1", port: int = 8000) -> ThreadingHTTPServer:
+    """
+    Returns the HTTP server of a prediction service (call serve_forever to start it).
+    """
+    handler = type("Handler", (PredictionHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(service: PredictionService, host: str = "127.0.0.1", port: int = 8000):
+    """
+    Serves the predictions of a service until the process is interrupted, then closes the service.
+    """
+    server = create_server(service, host, port)
+    print(f"Serving predictions on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="The address of the server (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=8000, help="The port of the server (default: 8000).")
+    parser.add_argument("--leagues", nargs="*", choices=[league.value for league in League],
+                        help="The leagues to serve (default: all).")
+    parser.add_argument("--models", default="models", help="The directory of the models (default: models).")
+    parser.add_argument("--reload-interval", type=float, default=30,
+                        help="The seconds between two checks for new models (default: 30).")
+    args = parser.parse_args()
+
+    service = PredictionService(args.leagues, model_directory=args.models, index_loader=load_team_index,
+                                reload_interval=args.reload_interval)
+    serve(service, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
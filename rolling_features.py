@@ -0,0 +1,192 @@
+"""
+This file contains the point-in-time features of the teams: for every match, the statistics
+of each team computed only from the matches played before the kickoff.
+
+Unlike merge_statistics_to_match_schedule, which joins the season totals to every match,
+these features do not leak the future into the training rows.
+"""
+
+import pandas as pd
+import numpy as np
+
+
+# Values of the results of a match
+WIN_POINTS = 3
+DRAW_POINTS = 1
+
+# Venues of the teams in the long format
+HOME = 0
+AWAY = 1
+
+
+class RollingFeatureEngine:
+    """
+    This class is used to compute the point-in-time features of the teams, in one pass over the sorted schedule:
+    season averages, home/away season averages and averages over the last matches.
+
+    The engine keeps the totals and the last matches of each team, so that new results can be appended
+    without recomputing the history.
+    """
+    def __init__(self, window: int = 5, xg_columns: tuple = ("xG", "xG.1")):
+        """
+        Args:
+            window (int, optional): The number of last matches of the form features. Defaults to 5.
+            xg_columns (tuple, optional): The columns with the home and away xG of the schedule,
+                ignored when they are not in the schedule. Defaults to ("xG", "xG.1").
+        """
+        self.window = window
+        self.xg_columns = xg_columns
+        self.stats = None
+
+        # Last matches of each team, used as context by append
+        self.tail = None
+        # Totals of each team for the season, and for the season at each venue
+        self.totals = None
+        self.venue_totals = None
+
+    def fit(self, schedule: pd.DataFrame) -> pd.DataFrame:
+        """
+        Computes the features of all the matches, replacing the state of the engine.
+
+        Args:
+            schedule (pd.DataFrame): The finished matches, with the FullDate, Domicile, Extérieur,
+                domicile_but and exterieur_but columns.
+
+        Returns:
+            pd.DataFrame: The schedule with the features of the home (_dom) and away (_ext) teams.
+        """
+        self.stats = ["goals_for", "goals_against", "points"]
+        if all(column in schedule.columns for column in self.xg_columns):
+            self.stats += ["xg_for", "xg_against"]
+
+        self.tail = None
+        self.totals = None
+        self.venue_totals = None
+        return self.append(schedule)
+
+    def append(self, schedule: pd.DataFrame) -> pd.DataFrame:
+        """
+        Computes the features of new matches, played after the matches already processed.
+
+        Args:
+            schedule (pd.DataFrame): The new finished matches.
+
+        Returns:
+            pd.DataFrame: The new matches with the features of the home (_dom) and away (_ext) teams.
+        """
+        if self.stats is None:
+            return self.fit(schedule)
+
+        long = self._to_long(schedule)
+        sums = self.stats + ["played"]
+
+        # The last matches of the teams are the context of the form features
+        if self.tail is not None:
+            long = pd.concat([self.tail, long], ignore_index=True)
+        long = long.iloc[np.lexsort((long["venue"].to_numpy(), long["match"].to_numpy(),
+                                     long["FullDate"].to_numpy(), ~long["context"].to_numpy()))]
+        long = long.reset_index(drop=True)
+
+        # Sums of the matches before each match (the current match is removed from the cumulative sums)
+        by_team = long.groupby("team", sort=False, observed=True)
+        before = by_team[sums].cumsum() - long[sums]
+
+        # Form: the difference of the sums before the match and before the match N matches earlier
+        last = before - before.groupby(long["team"], sort=False, observed=True).shift(self.window).fillna(0)
+        features = pd.DataFrame(index=long.index)
+        for stat in self.stats:
+            features[f"{stat}_last{self.window}"] = last[stat] / last["played"].where(last["played"] > 0)
+
+        season = self._get_season_sums(long, sums, ["team", "season"], self.totals)
+        venue = self._get_season_sums(long, sums, ["team", "season", "venue"], self.venue_totals)
+        features["played"] = season["played"]
+        for stat in self.stats:
+            features[f"{stat}_avg"] = season[stat] / season["played"].where(season["played"] > 0)
+            features[f"{stat}_venue_avg"] = venue[stat] / venue["played"].where(venue["played"] > 0)
+
+        new = ~long["context"].to_numpy()
+        self._update_state(long[new])
+
+        return self._to_wide(schedule, long[new], features[new])
+
+    def _to_long(self, schedule: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the matches in the long format: one row per team and match.
+        """
+        home_goals = schedule["domicile_but"].to_numpy(dtype=np.float64)
+        away_goals = schedule["exterieur_but"].to_numpy(dtype=np.float64)
+        full_date = pd.to_datetime(schedule["FullDate"]).to_numpy()
+        # The seasons start in July
+        season = pd.DatetimeIndex(full_date).year - (pd.DatetimeIndex(full_date).month < 7)
+
+        # The matches are numbered after the ones already processed to keep the order of the ties
+        first = 0 if self.tail is None else int(self.tail["match"].max()) + 1
+        match = np.arange(first, first + len(schedule))
+
+        sides = []
+        for venue, team, goals_for, goals_against in ((HOME, schedule["Domicile"], home_goals, away_goals),
+                                                      (AWAY, schedule["Extérieur"], away_goals, home_goals)):
+            side = pd.DataFrame({
+                "match": match,
+                "FullDate": full_date,
+                "season": season,
+                "team": team.astype(str).to_numpy(),
+                "venue": venue,
+                "goals_for": goals_for,
+                "goals_against": goals_against,
+                "points": np.select([goals_for > goals_against, goals_for == goals_against],
+                                    [WIN_POINTS, DRAW_POINTS], 0).astype(np.float64),
+            })
+            if "xg_for" in self.stats:
+                xg = [schedule[column].to_numpy(dtype=np.float64) for column in self.xg_columns]
+                side["xg_for"], side["xg_against"] = (xg[0], xg[1]) if venue == HOME else (xg[1], xg[0])
+            side["played"] = 1.0
+            side["context"] = False
+            sides.append(side)
+
+        return pd.concat(sides, ignore_index=True)
+
+    def _get_season_sums(self, long: pd.DataFrame, sums: list, keys: list, totals: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the sums of the matches of the season before each match, for the groups of the keys.
+        The context rows are already counted in the totals of the previous calls.
+        """
+        by_group = long.groupby(keys, sort=False, observed=True)
+        before = by_group[sums].cumsum() - long[sums]
+        if totals is None:
+            return before
+
+        # Totals before the first row of each group = stored totals - sums of the context rows
+        context = long[long["context"]].groupby(keys, observed=True)[sums].sum()
+        base = totals.sub(context, fill_value=0)
+        index = pd.MultiIndex.from_frame(long[keys])
+        return before + base.reindex(index).fillna(0).to_numpy()
+
+    def _update_state(self, new: pd.DataFrame):
+        """
+        Adds the new matches to the totals and keeps the last matches of each team.
+        """
+        sums = self.stats + ["played"]
+        for attribute, keys in (("totals", ["team", "season"]), ("venue_totals", ["team", "season", "venue"])):
+            added = new.groupby(keys, observed=True)[sums].sum()
+            current = getattr(self, attribute)
+            setattr(self, attribute, added if current is None else current.add(added, fill_value=0))
+
+        tail = new if self.tail is None else pd.concat([self.tail, new], ignore_index=True)
+        tail = tail.groupby("team", sort=False, observed=True).tail(self.window)
+        self.tail = tail.assign(context=True).reset_index(drop=True)
+
+    def _to_wide(self, schedule: pd.DataFrame, long: pd.DataFrame, features: pd.DataFrame) -> pd.DataFrame:
+        """
+        Adds the features of the home and away teams to the matches.
+        """
+        first = int(long["match"].min()) if len(long) else 0
+        positions = long["match"].to_numpy() - first
+
+        wide = schedule.copy()
+        for venue, suffix in ((HOME, "_dom"), (AWAY, "_ext")):
+            mask = long["venue"].to_numpy() == venue
+            side = features[mask].set_axis(positions[mask], axis=0).sort_index()
+            for column in side.columns:
+                wide[column + suffix] = side[column].to_numpy()
+        return wide
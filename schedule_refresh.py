@@ -0,0 +1,163 @@
+"""
+This file contains the incremental refresh of the finished matches.
+
+A high-water mark (the date of the last finished match) is kept for each league,
+so that only the matches that became final since the last run are parsed and merged.
+"""
+
+import pandas as pd
+import datetime
+import json
+import os
+import threading
+
+from data_preparation import prepare_schedule, merge_statistics_to_match_schedule
+
+
+# Finished matches without a score after this delay are postponed or cancelled, and are skipped
+MAX_SCORE_WAIT = datetime.timedelta(days=2)
+
+
+class Watermarks:
+    """
+    This class is used to store the date of the last finished match of each league.
+    """
+    def __init__(self, path: str = "data/watermarks.json"):
+        """
+        Args:
+            path (str, optional): The path of the json file. Defaults to "data/watermarks.json".
+        """
+        self.path = path
+        self.values = {}
+        # The leagues are refreshed in several threads (see scheduler.RefreshScheduler)
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.values = json.load(file)
+
+    def get(self, league: str) -> pd.Timestamp:
+        """
+        Returns the date of the last finished match of the league, or None if the league was never refreshed.
+        """
+        with self.lock:
+            value = self.values.get(league)
+        return pd.Timestamp(value) if value is not None else None
+
+    def set(self, league: str, value: pd.Timestamp):
+        """
+        Sets the date of the last finished match of the league and saves the file.
+        """
+        with self.lock:
+            self.values[league] = value.isoformat()
+
+            # Create the directory if it does not exist
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+            # Write to a temporary file first so that an interrupted run does not corrupt the file
+            with open(self.path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump(self.values, file, indent=2)
+            os.replace(self.path + ".tmp", self.path)
+
+
+def get_new_finished_matches(df_schedule: pd.DataFrame, watermark: pd.Timestamp = None,
+                             now: datetime.datetime = None, date_column: str = "Date",
+                             time_column: str = "Heure", score_column: str = "Score",
+                             max_score_wait: datetime.timedelta = MAX_SCORE_WAIT) -> pd.DataFrame:
+    """
+    Returns the matches that became final after the watermark, with the FullDate and goals columns.
+    Only these rows are parsed, the older ones are skipped with a string comparison on the date.
+
+    A match is final when it is finished and its score is known. The new matches stop before the kickoff
+    time of the first finished match whose score is not published yet, so that neither it nor the matches
+    played at the same time are skipped once fbref publishes their score. The finished matches still
+    without a score after max_score_wait (postponed or cancelled) do not stop the new matches.
+
+    Args:
+        df_schedule (pd.DataFrame): The raw schedule of the league.
+        watermark (pd.Timestamp, optional): The date of the last final match already processed.
+            Defaults to None (all the matches are new).
+        now (datetime.datetime, optional): The current time. Defaults to datetime.datetime.now().
+        date_column (str, optional): The name of the column with the date. Defaults to "Date".
+        time_column (str, optional): The name of the column with the time. Defaults to "Heure".
+        score_column (str, optional): The name of the column with the score. Defaults to "Score".
+        max_score_wait (datetime.timedelta, optional): The delay after which a finished match without
+            a score is skipped. Defaults to MAX_SCORE_WAIT (2 days).
+
+    Returns:
+        pd.DataFrame: The new final matches, sorted by date (empty, with the same columns, if there is none).
+    """
+    now = now if now is not None else datetime.datetime.now()
+
+    df = df_schedule
+    if watermark is not None:
+        # The dates are in the "%Y-%m-%d" format, so the string comparison is the date comparison
+        df = df[(df[date_column].astype("string") >= watermark.strftime("%Y-%m-%d")).fillna(False).to_numpy()]
+
+    prepared = prepare_schedule(df, as_of=now, finished_only=False, date_column=date_column,
+                                time_column=time_column, score_column=score_column)
+    full_date = prepared["FullDate"]
+    new = prepared["finished"] & prepared["valid_score"]
+    if watermark is not None:
+        new &= full_date > watermark
+
+    # Stop before the kickoff time of the first score that is not published yet
+    pending = prepared["finished"] & ~prepared["valid_score"] & (full_date >= now - max_score_wait)
+    if pending.any():
+        new &= full_date < full_date[pending].min()
+
+    new = new.to_numpy()
+    return df[new].assign(FullDate=full_date[new],
+                          domicile_but=prepared["domicile_but"][new].astype("int64"),
+                          exterieur_but=prepared["exterieur_but"][new].astype("int64")) \
+        .sort_values("FullDate", kind="stable")
+
+
+def refresh_finished_matches(league: str, df_schedule: pd.DataFrame, df_finished: pd.DataFrame,
+                             watermarks: Watermarks, now: datetime.datetime = None) -> tuple:
+    """
+    Appends the matches that became final since the last refresh to the finished matches of the league.
+
+    Args:
+        league (str): The name of the league.
+        df_schedule (pd.DataFrame): The raw schedule of the league.
+        df_finished (pd.DataFrame): The finished matches already processed (can be None).
+        watermarks (Watermarks): The watermarks of the leagues, updated by this function.
+        now (datetime.datetime, optional): The current time. Defaults to datetime.datetime.now().
+
+    Returns:
+        tuple: The updated finished matches and the new matches.
+    """
+    df_new = get_new_finished_matches(df_schedule, watermarks.get(league), now=now)
+    if df_new.empty:
+        return df_finished, df_new
+
+    watermarks.set(league, df_new["FullDate"].max())
+
+    if df_finished is None:
+        return df_new, df_new
+    return pd.concat([df_finished, df_new], ignore_index=True), df_new
+
+
+def append_merged_statistics(df_merged: pd.DataFrame, df_new: pd.DataFrame,
+                             df_statistics: pd.DataFrame) -> pd.DataFrame:
+    """
+    Merges the statistics to the new matches only and appends them to the merged dataframe.
+
+    Args:
+        df_merged (pd.DataFrame): The merged dataframe of the matches already processed (can be None).
+        df_new (pd.DataFrame): The new matches.
+        df_statistics (pd.DataFrame): The teams general statistics.
+
+    Returns:
+        pd.DataFrame: The updated merged dataframe.
+    """
+    if df_new.empty:
+        return df_merged
+
+    merged_new = merge_statistics_to_match_schedule(df_schedule=df_new, df_statistics=df_statistics)
+    if df_merged is None:
+        return merged_new
+    return pd.concat([df_merged, merged_new], ignore_index=True)
@@ -0,0 +1,379 @@
+"""
+This file contains the refresh scheduler: a long-running service that refreshes the data of each league
+shortly after its matches end, instead of whenever someone runs the scripts.
+
+The next poll of a league is planned from the kickoff times of its scraped schedule: 3 hours after the end
+of the next match (the delay of get_finished_matches), less often during the international breaks
+and the off season. The leagues with the most imminent fixtures are refreshed first.
+"""
+
+import pandas as pd
+import numpy as np
+import argparse
+import asyncio
+import datetime
+import heapq
+import itertools
+import os
+from typing import NamedTuple
+
+from football_scraper import League, FootballScrapper, FBREF_URL, current_season
+from http_client import HttpClient
+from http_cache import ResponseCache
+from dataset_store import DatasetStore
+from data_preparation import prepare_schedule
+from schedule_refresh import Watermarks, MAX_SCORE_WAIT, get_new_finished_matches, refresh_finished_matches, \
+    append_merged_statistics
+from team_index import TeamFeatureIndex, predict_fixtures
+from training import load_models
+from instrumentation import Stage, configure_logging, start_exporter
+
+
+# Delay after the kickoff before the score is published (the 3 hours of get_finished_matches)
+RESULT_DELAY = datetime.timedelta(hours=3)
+# Finished matches without a score are polled again after this delay, for at most MAX_SCORE_WAIT
+RETRY_INTERVAL = datetime.timedelta(minutes=30)
+# A gap without fixtures longer than BREAK_GAP is an international break
+BREAK_GAP = datetime.timedelta(days=10)
+# Polls that only check the changes of the schedule (postponed matches, kickoff times)
+IDLE_INTERVAL = datetime.timedelta(days=1)
+BREAK_INTERVAL = datetime.timedelta(days=3)
+OFF_SEASON_INTERVAL = datetime.timedelta(days=7)
+# Maximum delay of the retries of a failed refresh
+MAX_RETRY_INTERVAL = datetime.timedelta(hours=12)
+
+
+class PollPlan(NamedTuple):
+    due: datetime.datetime
+    next_kickoff: datetime.datetime
+    reason: str
+
+
+def plan_next_poll(df_schedule: pd.DataFrame, now: datetime.datetime) -> PollPlan:
+    """
+    Returns when the schedule of a league should be polled again.
+
+    Args:
+        df_schedule (pd.DataFrame): The raw schedule of the league.
+        now (datetime.datetime): The current time.
+
+    Returns:
+        PollPlan: The time of the next poll, the next kickoff (None if there is none) and the reason of the poll.
+    """
+    df = prepare_schedule(df_schedule, as_of=now, finished_only=False)
+    kickoffs = df["FullDate"].to_numpy()
+    known = ~np.isnat(kickoffs)
+
+    upcoming = np.sort(kickoffs[known & (kickoffs > np.datetime64(now))])
+    next_kickoff = pd.Timestamp(upcoming[0]).to_pydatetime() if len(upcoming) else None
+
+    # The first result that is not published yet
+    ends = kickoffs[known & ~df["valid_score"].to_numpy()] + np.timedelta64(RESULT_DELAY)
+    next_result = ends[ends > np.datetime64(now)]
+    next_result = pd.Timestamp(next_result.min()).to_pydatetime() if len(next_result) else None
+
+    # Finished matches whose score is late (the postponed matches are given up after MAX_SCORE_WAIT)
+    late = df["finished"].to_numpy() & ~df["valid_score"].to_numpy() & known & \
+        (kickoffs > np.datetime64(now - MAX_SCORE_WAIT))
+
+    if late.any():
+        return PollPlan(now + RETRY_INTERVAL, next_kickoff, "awaiting scores")
+    if next_kickoff is None:
+        return PollPlan(now + OFF_SEASON_INTERVAL, None, "off season")
+
+    if next_kickoff - now > BREAK_GAP:
+        due, reason = now + BREAK_INTERVAL, "international break"
+    else:
+        due, reason = now + IDLE_INTERVAL, "schedule check"
+    if next_result is not None and next_result <= due:
+        due, reason = next_result, "results"
+    return PollPlan(due, next_kickoff, reason)
+
+
+class LeaguePipeline:
+    """
+    This class is used to refresh the data of a league incrementally: scrape, prepare, features and predict.
+    The schedule is revalidated with a conditional request, and the statistics are only fetched
+    when new matches are final.
+    """
+    def __init__(self, client: HttpClient = None, store: DatasetStore = None, watermarks: Watermarks = None,
+                 model_directory: str = "models", predictions_directory: str = "data/predictions",
+                 base_url: str = FBREF_URL):
+        """
+        Args:
+            client (HttpClient, optional): The HTTP client. Defaults to a new cached client.
+            store (DatasetStore, optional): The dataset. Defaults to the dataset in data/dataset.
+            watermarks (Watermarks, optional): The watermarks of the leagues. Defaults to data/watermarks.json.
+            model_directory (str, optional): The directory of the models. Defaults to "models".
+            predictions_directory (str, optional): The directory of the predictions.
+                Defaults to "data/predictions".
+            base_url (str, optional): The root url of the website. Defaults to FBREF_URL.
+        """
+        self.client = client if client is not None else HttpClient(cache=ResponseCache())
+        self.store = store if store is not None else DatasetStore()
+        self.watermarks = watermarks if watermarks is not None else Watermarks()
+        self.model_directory = model_directory
+        self.predictions_directory = predictions_directory
+        self.base_url = base_url
+
+        # Finished matches, merged matches and statistics of each league (see restore)
+        self.finished = {}
+        self.merged = {}
+        self.statistics = {}
+
+    def restore(self, league: League, table: str = "results_overall"):
+        """
+        Restores the finished matches, the merged matches and the statistics of a league from the dataset,
+        up to its watermark, so that a restarted pipeline does not only keep the matches after the watermark.
+        Nothing is restored if the league was never refreshed.
+
+        Args:
+            league (League): The league.
+            table (str, optional): The table of the statistics. Defaults to "results_overall" (the league table).
+        """
+        watermark = self.watermarks.get(league.value)
+        tables = self.store.tables()
+        if watermark is None or "schedule" not in tables:
+            return
+
+        df_schedule = self.store.read("schedule", leagues=[league.value], seasons=[current_season()])
+        if df_schedule.empty:
+            return
+
+        df_finished = get_new_finished_matches(df_schedule.drop(columns=["league", "season"]))
+        self.finished[league] = df_finished[df_finished["FullDate"] <= watermark]
+
+        if table in tables:
+            df_statistics = self.store.read(table, leagues=[league.value], seasons=[current_season()])
+            if not df_statistics.empty:
+                self.statistics[league] = df_statistics.drop(columns=["league", "season"])
+                self.merged[league] = append_merged_statistics(None, self.finished[league], self.statistics[league])
+
+    def __call__(self, league: League) -> pd.DataFrame:
+        """
+        Refreshes a league.
+
+        Args:
+            league (League): The league.
+
+        Returns:
+            pd.DataFrame: The raw schedule of the league, used to plan the next poll.
+        """
+        if league not in self.finished:
+            self.restore(league)
+
+        scrapper = FootballScrapper(league, client=self.client, base_url=self.base_url)
+        scrapper.get_data(statistics=False, max_age=0)
+        if scrapper.schedule is None:
+            raise RuntimeError(f"No schedule for {league.value}")
+
+        df_finished, df_new = refresh_finished_matches(league.value, scrapper.schedule, self.finished.get(league),
+                                                       self.watermarks)
+        self.finished[league] = df_finished
+
+        if not df_new.empty or league not in self.statistics:
+            scrapper.get_data(schedule=False, max_age=0)
+            if scrapper.statistics:
+                self.statistics[league] = scrapper.statistics[0]
+
+        scrapper.to_parquet(self.store)
+
+        if league in self.statistics:
+            if league in self.merged:
+                self.merged[league] = append_merged_statistics(self.merged[league], df_new, self.statistics[league])
+            elif df_finished is not None:
+                # The statistics were missing until now: merge all the finished matches
+                self.merged[league] = append_merged_statistics(None, df_finished, self.statistics[league])
+            self.predict(league, scrapper.schedule)
+
+        print(f"{league.value}: {len(df_new)} new finished matches")
+        return scrapper.schedule
+
+    def predict(self, league: League, df_schedule: pd.DataFrame):
+        """
+        Predicts the goals of the upcoming fixtures of the league with its latest models,
+        and saves them to <predictions_directory>/<league>.csv. Nothing is done if the league has no models.
+        """
+        try:
+            artifact = load_models(league.value, directory=self.model_directory)
+        except FileNotFoundError:
+            return
+
+        columns = [feature[:-len("_dom")] for feature in artifact["features"] if feature.endswith("_dom")]
+        index = TeamFeatureIndex.from_statistics(self.statistics[league], columns=columns)
+
+        df = prepare_schedule(df_schedule, finished_only=False)
+        fixtures = df[~df["finished"] & df["FullDate"].notna()]
+        predictions = predict_fixtures(fixtures[["FullDate", "Domicile", "Extérieur"]], index,
+                                       artifact["models"]["home"], artifact["models"]["away"])
+
+        os.makedirs(self.predictions_directory, exist_ok=True)
+        predictions.to_csv(os.path.join(self.predictions_directory, f"{league.value}.csv"), index=False)
+
+
+class RefreshScheduler:
+    """
+    This class is used to run the refreshes of the leagues in an asyncio loop, from a priority queue ordered
+    by the time of the next poll and then by the next kickoff. A league has at most one queued job:
+    a job submitted for a league that is already queued or running is coalesced with it.
+    """
+    def __init__(self, pipeline, leagues: list = None, max_concurrent: int = 2, clock=datetime.datetime.now):
+        """
+        Args:
+            pipeline (callable): The refresh of a league, called with the league in a thread,
+                returning the raw schedule of the league (e.g. a LeaguePipeline).
+            leagues (list, optional): The leagues to refresh. Defaults to all the leagues.
+            max_concurrent (int, optional): The maximum number of refreshes at the same time. Defaults to 2.
+            clock (callable, optional): The function returning the current time. Defaults to datetime.now.
+        """
+        self.pipeline = pipeline
+        self.leagues = list(League) if leagues is None else leagues
+        self.max_concurrent = max_concurrent
+        self.clock = clock
+
+        # Heap of (due, priority, sequence, league), and the entry of each queued league
+        self.queue = []
+        self.queued = {}
+        self.sequence = itertools.count()
+        # Running leagues, and the earliest poll requested for them while they run
+        self.running = set()
+        self.requested = {}
+        self.failures = {}
+        self.plans = {}
+
+        self.wakeup = None
+        self.stopped = False
+
+    def submit(self, league: League, due: datetime.datetime = None, priority: float = None) -> bool:
+        """
+        Queues a refresh of the league, unless an earlier one is already queued.
+
+        Args:
+            league (League): The league.
+            due (datetime.datetime, optional): The time of the refresh. Defaults to now.
+            priority (float, optional): The order of the jobs due at the same time (lower first),
+                the timestamp of the next kickoff. Defaults to the first.
+
+        Returns:
+            bool: True if the job was queued, False if it was coalesced with a queued or running job.
+        """
+        due = due if due is not None else self.clock()
+        priority = priority if priority is not None else float("-inf")
+
+        if league in self.running:
+            self.requested[league] = min(due, self.requested.get(league, due))
+            return False
+
+        queued = self.queued.get(league)
+        if queued is not None and queued[:2] <= (due, priority):
+            return False
+
+        entry = (due, priority, next(self.sequence), league)
+        heapq.heappush(self.queue, entry)
+        self.queued[league] = entry
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return True
+
+    def stop(self):
+        """
+        Stops the loop after the running refreshes.
+        """
+        self.stopped = True
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def run(self):
+        """
+        Runs the refreshes until stop is called. All the leagues are refreshed at the start.
+        """
+        self.wakeup = asyncio.Event()
+        self.stopped = False
+        for league in self.leagues:
+            self.submit(league)
+
+        tasks = set()
+        while not self.stopped:
+            self.wakeup.clear()
+            now = self.clock()
+
+            while self.queue and self.queue[0][0] <= now and len(self.running) < self.max_concurrent:
+                entry = heapq.heappop(self.queue)
+                league = entry[3]
+                # Skip the entries replaced by an earlier job
+                if self.queued.get(league) is not entry:
+                    continue
+                del self.queued[league]
+                self.running.add(league)
+                task = asyncio.create_task(self._refresh(league))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            # Drop the replaced entries so that the head of the queue is a real job
+            while self.queue and self.queued.get(self.queue[0][3]) is not self.queue[0]:
+                heapq.heappop(self.queue)
+
+            timeout = None
+            if self.queue and len(self.running) < self.max_concurrent:
+                timeout = max((self.queue[0][0] - now).total_seconds(), 0)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    def _run_pipeline(self, league: League) -> pd.DataFrame:
+        """
+        Runs the pipeline of a league as a measured stage.
+        """
+        with Stage("refresh", league=league.value):
+            return self.pipeline(league)
+
+    async def _refresh(self, league: League):
+        """
+        Refreshes a league in a thread, then queues its next poll.
+        """
+        try:
+            df_schedule = await asyncio.to_thread(self._run_pipeline, league)
+            plan = plan_next_poll(df_schedule, self.clock())
+            self.failures.pop(league, None)
+        except Exception as e:
+            # Retry with an exponential backoff
+            failures = self.failures[league] = self.failures.get(league, 0) + 1
+            delay = min(RETRY_INTERVAL * 2 ** (failures - 1), MAX_RETRY_INTERVAL)
+            previous = self.plans.get(league)
+            plan = PollPlan(self.clock() + delay, previous.next_kickoff if previous else None, f"retry ({e})")
+            print(f"{league.value}: refresh failed: {e}")
+        finally:
+            self.running.discard(league)
+
+        self.plans[league] = plan
+        due = min(plan.due, self.requested.pop(league, plan.due))
+        priority = plan.next_kickoff.timestamp() if plan.next_kickoff is not None else float("inf")
+        self.submit(league, due, priority)
+        print(f"{league.value}: next poll at {due:%Y-%m-%d %H:%M} ({plan.reason})")
+        self.wakeup.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refreshes the data of the leagues after their matches.")
+    parser.add_argument("--leagues", nargs="*", choices=[league.value for league in League],
+                        help="The leagues to refresh (default: all).")
+    parser.add_argument("--max-concurrent", type=int, default=2, help="The maximum number of refreshes at once.")
+    args = parser.parse_args()
+
+    configure_logging()
+    start_exporter()
+
+    leagues = [League(name) for name in args.leagues] if args.leagues else None
+    scheduler = RefreshScheduler(LeaguePipeline(), leagues=leagues, max_concurrent=args.max_concurrent)
+    try:
+        asyncio.run(scheduler.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
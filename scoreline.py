@@ -0,0 +1,139 @@
+"""
+This file contains the probabilities of the scorelines and of the betting markets of the fixtures.
+
+The goals of each team follow a Poisson distribution whose mean is the expected goals of the goal models,
+with the Dixon-Coles correction of the low scores. All the fixtures are computed at once with array operations.
+"""
+
+import pandas as pd
+import numpy as np
+from math import lgamma
+
+
+# Goal lines of the over/under markets
+DEFAULT_LINES = (0.5, 1.5, 2.5, 3.5, 4.5)
+
+
+def expected_goals(model, X: pd.DataFrame) -> np.ndarray:
+    """
+    Returns the expected goals of a goal model: the mean of its predicted distribution of the goals.
+
+    Args:
+        model: A classifier of the goals with predict_proba (e.g. gb_dom or gb_ext).
+        X (pd.DataFrame): The features of the fixtures.
+
+    Returns:
+        np.ndarray: The expected goals of each fixture.
+    """
+    return model.predict_proba(X) @ model.classes_.astype(np.float64)
+
+
+def poisson_matrices(home_rates: np.ndarray, away_rates: np.ndarray, max_goals: int = 10,
+                     rho: float = 0.0) -> np.ndarray:
+    """
+    Returns the probability matrices of the scorelines of the fixtures.
+
+    Args:
+        home_rates (np.ndarray): The expected goals of the home teams.
+        away_rates (np.ndarray): The expected goals of the away teams.
+        max_goals (int, optional): The maximum number of goals of a team. Defaults to 10.
+        rho (float, optional): The Dixon-Coles dependence of the low scores (0 for independent Poisson).
+            Defaults to 0.0.
+
+    Returns:
+        np.ndarray: The probabilities, of shape (fixtures, home goals, away goals), each matrix summing to 1.
+    """
+    home_rates = np.maximum(np.asarray(home_rates, dtype=np.float64), 1e-9)
+    away_rates = np.maximum(np.asarray(away_rates, dtype=np.float64), 1e-9)
+
+    goals = np.arange(max_goals + 1)
+    log_factorials = np.array([lgamma(k + 1) for k in goals])
+
+    home = np.exp(goals * np.log(home_rates)[:, None] - home_rates[:, None] - log_factorials)
+    away = np.exp(goals * np.log(away_rates)[:, None] - away_rates[:, None] - log_factorials)
+    matrices = home[:, :, None] * away[:, None, :]
+
+    if rho:
+        # Dixon-Coles correction of the 0-0, 1-0, 0-1 and 1-1 scores
+        matrices[:, 0, 0] *= 1 - home_rates * away_rates * rho
+        matrices[:, 0, 1] *= 1 + home_rates * rho
+        matrices[:, 1, 0] *= 1 + away_rates * rho
+        matrices[:, 1, 1] *= 1 - rho
+        np.maximum(matrices, 0, out=matrices)
+
+    # The scores above max_goals are cut, so the matrices are normalized
+    matrices /= matrices.sum(axis=(1, 2), keepdims=True)
+    return matrices
+
+
+def get_market_masks(max_goals: int = 10, lines: tuple = DEFAULT_LINES) -> pd.DataFrame:
+    """
+    Returns the scorelines of each market outcome, as a (scorelines, outcomes) matrix of 0 and 1.
+    """
+    home, away = np.meshgrid(np.arange(max_goals + 1), np.arange(max_goals + 1), indexing="ij")
+    home, away = home.ravel(), away.ravel()
+
+    masks = {"home": home > away, "draw": home == away, "away": home < away,
+             "btts_yes": (home > 0) & (away > 0), "btts_no": (home == 0) | (away == 0)}
+    for line in lines:
+        masks[f"over_{line}"] = home + away > line
+        masks[f"under_{line}"] = home + away < line
+
+    return pd.DataFrame(masks).astype(np.float64)
+
+
+def market_probabilities(matrices: np.ndarray, lines: tuple = DEFAULT_LINES,
+                         correct_scores: int = None) -> pd.DataFrame:
+    """
+    Returns the probabilities of the markets of the fixtures: 1X2, both teams to score, over/under
+    and optionally the correct scores. All the markets are computed with a single matrix product.
+
+    Args:
+        matrices (np.ndarray): The probabilities of the scorelines (see poisson_matrices).
+        lines (tuple, optional): The goal lines of the over/under markets. Defaults to DEFAULT_LINES.
+        correct_scores (int, optional): The maximum goals of the correct score columns ("2-1", ...).
+            Defaults to None (no correct score columns).
+
+    Returns:
+        pd.DataFrame: The probabilities, one row per fixture.
+    """
+    max_goals = matrices.shape[1] - 1
+    flat = matrices.reshape(len(matrices), -1)
+    masks = get_market_masks(max_goals, lines)
+
+    markets = pd.DataFrame(flat @ masks.to_numpy(), columns=masks.columns)
+
+    if correct_scores is not None:
+        scores = matrices[:, :correct_scores + 1, :correct_scores + 1].reshape(len(matrices), -1)
+        columns = [f"{home}-{away}" for home in range(correct_scores + 1) for away in range(correct_scores + 1)]
+        markets = pd.concat([markets, pd.DataFrame(scores, columns=columns)], axis=1)
+
+    return markets
+
+
+def price_fixtures(X: pd.DataFrame, home_model, away_model, max_goals: int = 10, rho: float = 0.0,
+                   lines: tuple = DEFAULT_LINES, correct_scores: int = None) -> pd.DataFrame:
+    """
+    Returns the expected goals and the market probabilities of fixtures from the goal models.
+
+    Args:
+        X (pd.DataFrame): The features of the fixtures (e.g. from TeamFeatureIndex.get_matchup_features).
+        home_model: The model of the home team goals (e.g. gb_dom).
+        away_model: The model of the away team goals (e.g. gb_ext).
+        max_goals (int, optional): The maximum number of goals of a team. Defaults to 10.
+        rho (float, optional): The Dixon-Coles dependence of the low scores. Defaults to 0.0.
+        lines (tuple, optional): The goal lines of the over/under markets. Defaults to DEFAULT_LINES.
+        correct_scores (int, optional): The maximum goals of the correct score columns. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The expected goals (home_xg, away_xg) and the probabilities, indexed like X.
+    """
+    home_rates = expected_goals(home_model, X)
+    away_rates = expected_goals(away_model, X)
+
+    matrices = poisson_matrices(home_rates, away_rates, max_goals=max_goals, rho=rho)
+    markets = market_probabilities(matrices, lines=lines, correct_scores=correct_scores)
+    markets.insert(0, "home_xg", home_rates)
+    markets.insert(1, "away_xg", away_rates)
+    markets.index = X.index
+    return markets
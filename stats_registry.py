@@ -0,0 +1,222 @@
+"""
+This file contains the description of the fbref team statistics tables
+and the build of the per-team feature matrix from them.
+"""
+
+import pandas as pd
+import hashlib
+import numpy as np
+import os
+from typing import NamedTuple
+
+
+TEAM_COLUMN = "Équipe"
+
+# Suffix of the columns of the tables with the statistics of the opponents
+AGAINST_SUFFIX = "_A"
+
+# Values of the results of the last matches
+FORM_VALUES = {'D': -1, 'N': 0, 'V': 1}
+
+# Columns that are not used in the tables of the playing time
+PLAYING_TIME_COLUMNS = ('# JC', 'Âge', 'MJ', 'Min', 'Mn/MJ', 'Min%', '90', 'Titulaire', 'Mn/Débuté', 'Compl',
+                        'Remp', 'Mn/Remp', 'RempNE')
+
+MISCELLANEOUS_COLUMNS = ('Fte', 'Préussi', 'Pcon', 'Récupération', 'Gagnés', 'Perdus', '% gagnés')
+
+# Columns of the home and away table, repeated for the away matches ("MJ.1", "V.1", ...)
+HOME_AWAY_COLUMNS = ('MJ', 'V', 'N', 'D', 'BM', 'BE', 'DB', 'Pts', 'Pts/MJ')
+
+# Suffixes of the columns of the home matches and of the away matches of the home and away table
+HOME_AWAY_SUFFIXES = ('_domicile', '_exterieur')
+
+
+class TableSpec(NamedTuple):
+    """
+    This class is used to describe how a statistics table is turned into features.
+    """
+    # Position of the table on the statistics page
+    position: int
+    # Number of header rows of the table on fbref
+    header_rows: int = 2
+    # Columns to drop
+    drop: tuple = ()
+    # Columns to keep (all the columns when None)
+    keep: tuple = None
+    # Whether the table has the statistics of the opponents of the team
+    against: bool = False
+    # Column with the results of the last matches (e.g. "V V N D V")
+    form_column: str = None
+    # Suffixes of the columns of the home and of the away matches, for the tables with both
+    venue_suffixes: tuple = None
+    # Type of the features
+    dtype: str = "float64"
+    # Whether the table is used
+    enabled: bool = True
+
+
+STATS_TABLES = (
+    TableSpec(0, header_rows=1, form_column='5 derniers',
+              drop=('Affluence', 'Meilleur buteur de l\'équipe', 'Gardien de but', 'Notes',
+                    'xG', 'xGA', 'xGD', 'xGD/90')),
+    TableSpec(1, keep=HOME_AWAY_COLUMNS + tuple(f'{column}.1' for column in HOME_AWAY_COLUMNS),
+              venue_suffixes=HOME_AWAY_SUFFIXES),
+    TableSpec(2, drop=('MJ', 'Titulaire', 'Min', '90')),
+    TableSpec(3, drop=('MJ', 'Titulaire', 'Min', '90'), against=True),
+    TableSpec(4, drop=('MJ', 'Titulaire', 'Min', '90', 'V', 'N', 'D', 'Arrêts%.1')),
+    TableSpec(5, drop=('MJ', 'Titulaire', 'Min', '90', 'Arrêts%.1'), against=True),
+    TableSpec(6, drop=('# JC', '90')),
+    TableSpec(7, drop=('# JC', '90'), against=True),
+    TableSpec(8, drop=('Buts', 'xG', 'npxG', 'npxG/Sh')),
+    TableSpec(9, drop=('Buts', 'xG', 'npxG', 'npxG/Sh'), against=True),
+    TableSpec(10, drop=('90',)),
+    TableSpec(11, drop=('90',), against=True),
+    TableSpec(12, drop=('90', '# JC', 'Att', 'Cmp')),
+    TableSpec(13, drop=('90', '# JC', 'Att', 'Cmp'), against=True),
+    TableSpec(14, drop=('90', '# JC')),
+    TableSpec(15, drop=('90', '# JC'), against=True),
+    TableSpec(16, drop=('90', '# JC')),
+    TableSpec(17, drop=('90', '# JC'), against=True),
+    TableSpec(18, drop=('90', '# JC', 'Poss')),
+    TableSpec(19, drop=('90', '# JC', 'Poss'), against=True),
+    TableSpec(20, drop=PLAYING_TIME_COLUMNS),
+    TableSpec(21, drop=PLAYING_TIME_COLUMNS, against=True),
+    TableSpec(22, keep=MISCELLANEOUS_COLUMNS),
+    TableSpec(23, keep=MISCELLANEOUS_COLUMNS, against=True),
+)
+
+
+def read_stats_csv(league_name: str, spec: TableSpec, directory: str = "data", legacy: bool = False) -> pd.DataFrame:
+    """
+    Reads a statistics table saved by FootballScrapper.to_csv.
+
+    Args:
+        league_name (str): The name of the league.
+        spec (TableSpec): The description of the table.
+        directory (str, optional): The data directory. Defaults to "data".
+        legacy (bool, optional): Whether the file was saved before the tables had their header
+            on the first line. Defaults to False.
+
+    Returns:
+        pd.DataFrame: The table.
+    """
+    path = f"{directory}/{league_name}/{league_name}_stats_{spec.position}.csv"
+    return pd.read_csv(path, header=spec.header_rows if legacy else 0, index_col=0)
+
+
+def get_table_features(df: pd.DataFrame, spec: TableSpec) -> pd.DataFrame:
+    """
+    Returns the features of one statistics table, indexed by team.
+
+    Args:
+        df (pd.DataFrame): The statistics table.
+        spec (TableSpec): The description of the table.
+
+    Returns:
+        pd.DataFrame: The features of the table.
+    """
+    # The teams of the "against" tables are named "vs <team>"
+    teams = df[TEAM_COLUMN].astype("string")
+    if spec.against:
+        teams = teams.str.removeprefix("vs ")
+
+    # Select the columns in one indexing (each drop copies the table)
+    columns = list(spec.keep) if spec.keep is not None else [column for column in df.columns
+                                                              if column != TEAM_COLUMN]
+    df = df[[column for column in columns if column not in spec.drop]]
+    df.index = pd.Index(teams, name=TEAM_COLUMN)
+
+    # The columns of the away matches have the same names as the ones of the home matches, suffixed with ".1"
+    if spec.venue_suffixes is not None:
+        home, away = spec.venue_suffixes
+        df = df.rename(columns=lambda column: column[:-len(".1")] + away if column.endswith(".1")
+                       else column + home)
+
+    # Convert the last matches column into usable data
+    if spec.form_column is not None and spec.form_column in df.columns:
+        form = df[spec.form_column].astype("string").str.split(" ", expand=True)
+        form = form.apply(lambda column: column.map(FORM_VALUES)).astype("float64")
+        form.columns = [f"dernier_{i + 1}" for i in range(form.shape[1])]
+        df = pd.concat([df.drop(columns=[spec.form_column]), form], axis=1)
+
+    df = df.select_dtypes("number").astype(spec.dtype)
+
+    if spec.against:
+        df = df.add_suffix(AGAINST_SUFFIX)
+    return df
+
+
+def build_team_features(statistics: list, specs: tuple = STATS_TABLES) -> pd.DataFrame:
+    """
+    Builds the wide feature matrix of the teams from all the statistics tables of a league.
+    A column found in several tables is suffixed with the position of the table it comes from after the first one.
+
+    Args:
+        statistics (list): The statistics tables, in the order of the statistics page.
+        specs (tuple, optional): The description of the tables. Defaults to STATS_TABLES.
+
+    Returns:
+        pd.DataFrame: The features, one row per team.
+    """
+    frames = []
+    seen = set()
+    for spec in specs:
+        if not spec.enabled or spec.position >= len(statistics):
+            continue
+
+        df = get_table_features(statistics[spec.position], spec)
+        df.columns = [column if column not in seen else f"{column}_{spec.position}" for column in df.columns]
+        seen.update(df.columns)
+        frames.append(df)
+
+    return pd.concat(frames, axis=1)
+
+
+def hash_statistics(statistics: list, specs: tuple = STATS_TABLES) -> str:
+    """
+    Returns the hash of the statistics tables and of their description.
+    """
+    digest = hashlib.sha1(repr(specs).encode())
+    for df in statistics:
+        digest.update(repr(list(df.columns)).encode())
+        # Hashing the raw values is much faster than pd.util.hash_pandas_object on the small fbref tables
+        numbers = df.select_dtypes("number")
+        texts = df.select_dtypes(exclude="number")
+        digest.update(repr(list(numbers.columns)).encode())
+        digest.update(numbers.to_numpy(dtype=np.float64).tobytes())
+        digest.update("\x1f".join(map(str, texts.to_numpy().ravel())).encode())
+    return digest.hexdigest()
+
+
+def build_league_features(statistics_by_league: dict, specs: tuple = STATS_TABLES,
+                          cache_directory: str = "data/cache/features") -> pd.DataFrame:
+    """
+    Builds the feature matrix of the teams of several leagues.
+    The features of a league are cached on disk, keyed by the hash of its statistics tables.
+
+    Args:
+        statistics_by_league (dict): The statistics tables, by league name.
+        specs (tuple, optional): The description of the tables. Defaults to STATS_TABLES.
+        cache_directory (str, optional): The cache directory, None to disable the cache.
+            Defaults to "data/cache/features".
+
+    Returns:
+        pd.DataFrame: The features, one row per team, with a "league" column.
+    """
+    frames = []
+    for league_name, statistics in statistics_by_league.items():
+        path = None
+        if cache_directory is not None:
+            path = os.path.join(cache_directory, f"{hash_statistics(statistics, specs)}.parquet")
+
+        if path is not None and os.path.exists(path):
+            df = pd.read_parquet(path)
+        else:
+            df = build_team_features(statistics, specs)
+            if path is not None:
+                os.makedirs(cache_directory, exist_ok=True)
+                df.to_parquet(path)
+
+        frames.append(df.assign(league=league_name))
+
+    return pd.concat(frames)
@@ -0,0 +1,359 @@
+"""
+This file contains the extraction of the HTML tables into typed dataframes.
+"""
+
+from lxml import html as lxml_html
+from lxml import etree
+import pandas as pd
+import numpy as np
+import re
+from typing import NamedTuple
+
+
+# Numbers with "," as thousands separator (e.g. the attendance "73,531")
+THOUSANDS_PATTERN = re.compile(r"^[+-]?\d{1,3}(,\d{3})+(\.\d+)?$")
+
+# Classes of the rows that repeat the header in the body of the fbref tables
+HEADER_ROW_CLASSES = {"thead", "over_header"}
+
+
+class ExtractedTable(NamedTuple):
+    """
+    This class is used to store a table extracted from a page.
+    """
+    id: str
+    caption: str
+    data: pd.DataFrame
+
+
+def extract_tables(content: str, include_commented: bool = False, multi_index: bool = False,
+                   category_threshold: float = 0.5) -> list:
+    """
+    Extracts all the tables of an HTML page.
+
+    Args:
+        content (str): The HTML content of the page.
+        include_commented (bool, optional): Whether to also extract the tables hidden in HTML comments,
+            as fbref does for some of its statistics. Defaults to False.
+        multi_index (bool, optional): Whether to keep all the header levels as a MultiIndex.
+            Defaults to False (only the last header level is kept).
+        category_threshold (float, optional): The maximum ratio of unique values for a text column
+            to be converted to category. Defaults to 0.5.
+
+    Returns:
+        list: The ExtractedTable of the page, in order of appearance.
+    """
+    return [extract_table(element, multi_index=multi_index, category_threshold=category_threshold)
+            for element in find_tables(content, include_commented=include_commented)]
+
+
+def find_tables(content: str, include_commented: bool = False) -> list:
+    """
+    Returns the table elements of an HTML page, in order of appearance.
+
+    Args:
+        content (str): The HTML content of the page.
+        include_commented (bool, optional): Whether to also return the tables hidden in HTML comments.
+            Defaults to False.
+
+    Returns:
+        list: The table elements (empty if the content is empty).
+    """
+    # lxml can not parse an empty document (e.g. a page that failed to render)
+    if not content or not content.strip():
+        return []
+
+    root = lxml_html.fromstring(content)
+
+    elements = root.xpath("//table")
+    if include_commented:
+        for comment in root.xpath("//comment()"):
+            if "<table" in comment.text:
+                elements.extend(lxml_html.fragment_fromstring(comment.text, create_parent="div").xpath(".//table"))
+    return elements
+
+
+def extract_table(element: etree.ElementBase, multi_index: bool = False,
+                  category_threshold: float = 0.5) -> ExtractedTable:
+    """
+    Extracts one table element into a typed dataframe.
+
+    Args:
+        element (etree.ElementBase): The table element.
+        multi_index (bool, optional): Whether to keep all the header levels as a MultiIndex. Defaults to False.
+        category_threshold (float, optional): The maximum ratio of unique values for a text column
+            to be converted to category. Defaults to 0.5.
+
+    Returns:
+        ExtractedTable: The id, the caption and the data of the table.
+    """
+    caption, header, body = get_table_grid(element)
+    width = len(header[0]) if header else len(body[0]) if body else 0
+
+    if multi_index and len(header) > 1:
+        columns = pd.MultiIndex.from_arrays(header)
+    elif header:
+        columns = _deduplicate(header[-1])
+    else:
+        columns = None
+
+    df = pd.DataFrame({position: _convert_column([row[position] for row in body], category_threshold)
+                       for position in range(width)})
+    if columns is not None:
+        df.columns = columns
+
+    return ExtractedTable(element.get("id"), caption, df)
+
+
+def get_table_grid(element: etree.ElementBase) -> tuple:
+    """
+    Returns the texts of a table, with the spanned cells repeated and all the rows of the same width.
+
+    Args:
+        element (etree.ElementBase): The table element.
+
+    Returns:
+        tuple: The caption (None if there is none), the header rows and the non-empty body rows.
+    """
+    caption = element.find("caption")
+    caption = caption.text_content().strip() if caption is not None else None
+
+    header_rows, body_rows = _split_rows(element)
+    header = _build_grid(header_rows)
+    body = [row for row in _build_grid(body_rows) if any(row)]
+
+    # Make all the rows the same width
+    width = max((len(row) for row in header + body), default=0)
+    header = [row + [""] * (width - len(row)) for row in header]
+    body = [row + [""] * (width - len(row)) for row in body]
+    return caption, header, body
+
+
+def tables_to_text(content: str, separator: str = " | ") -> str:
+    """
+    Returns the tables of an HTML page as compact text: the caption of each table then one line per row,
+    the tables being separated by a blank line. Everything outside the tables is dropped,
+    which cuts most of the tokens of a page sent to an LLM.
+
+    Args:
+        content (str): The HTML content of the page.
+        separator (str, optional): The separator of the cells. Defaults to " | ".
+
+    Returns:
+        str: The text of the tables ("" if the page has no table).
+    """
+    texts = []
+    for element in find_tables(content):
+        caption, header, body = get_table_grid(element)
+        lines = [caption] if caption else []
+        lines += [separator.join(row) for row in header + body if any(row)]
+        texts.append("\n".join(lines))
+
+    return "\n\n".join(texts)
+
+
+def tables_to_chunks(content: str, max_length: int, length_function=len, separator: str = " | ") -> list:
+    """
+    Returns the tables of an HTML page as compact text (see tables_to_text), in chunks of at most max_length.
+    A table is only split between its rows, and every chunk of a table starts with its caption and header rows,
+    so that the values of each chunk can be mapped to their columns. The small tables are grouped in one chunk.
+
+    Args:
+        content (str): The HTML content of the page.
+        max_length (int): The maximum length of a chunk (a chunk is longer only when its table header
+            and a single row do not fit).
+        length_function (callable, optional): The length of a text (e.g. its number of tokens). Defaults to len.
+        separator (str, optional): The separator of the cells. Defaults to " | ".
+
+    Returns:
+        list: The chunks (empty if the page has no table).
+    """
+    chunks = []
+    last_length = 0
+    for element in find_tables(content):
+        caption, header, body = get_table_grid(element)
+        head = ([caption] if caption else []) + [separator.join(row) for row in header if any(row)]
+        head_length = sum(length_function(line) + 1 for line in head)
+
+        # Cut the rows of the table, repeating its head in every chunk
+        table_chunks = []
+        lines, length = list(head), head_length
+        for row in body:
+            line = separator.join(row)
+            line_length = length_function(line) + 1
+            if length + line_length > max_length and len(lines) > len(head):
+                table_chunks.append(("\n".join(lines), length))
+                lines, length = list(head), head_length
+            lines.append(line)
+            length += line_length
+        if lines:
+            table_chunks.append(("\n".join(lines), length))
+
+        # Group a table that fits in one chunk with the previous chunk when both fit
+        if len(table_chunks) == 1 and chunks and last_length + table_chunks[0][1] + 1 <= max_length:
+            chunks[-1] += "\n\n" + table_chunks[0][0]
+            last_length += table_chunks[0][1] + 1
+            continue
+
+        chunks += [text for text, _ in table_chunks]
+        last_length = table_chunks[-1][1] if table_chunks else last_length
+
+    return chunks
+
+
+def convert_dtypes(df: pd.DataFrame, category_threshold: float = 0.5) -> pd.DataFrame:
+    """
+    Converts the text columns of the dataframe to int, float or category when possible.
+
+    Args:
+        df (pd.DataFrame): The dataframe with text columns.
+        category_threshold (float, optional): The maximum ratio of unique values for a text column
+            to be converted to category. Defaults to 0.5.
+
+    Returns:
+        pd.DataFrame: The dataframe with typed columns.
+    """
+    columns = {position: _convert_column(["" if pd.isna(value) else str(value) for value in df.iloc[:, position]],
+                                         category_threshold)
+               for position in range(df.shape[1])}
+
+    typed = pd.DataFrame(columns, index=df.index)
+    typed.columns = df.columns
+    return typed
+
+
+def to_float(value: str) -> float:
+    """
+    Converts a text to float ("" is NaN), raising ValueError if it is not a number.
+    """
+    if not value:
+        return np.nan
+    if "," in value and THOUSANDS_PATTERN.match(value):
+        value = value.replace(",", "")
+    number = float(value)
+    # Do not take texts like "nan" or "inf" for numbers
+    if number != number or number in (float("inf"), float("-inf")):
+        raise ValueError(value)
+    return number
+
+
+def _convert_column(values: list, category_threshold: float):
+    """
+    Converts a column of texts to int, float or category when possible ("" is a missing value).
+    The conversion is done on the python list, which is much faster than pandas on the small fbref tables.
+    """
+    non_empty = [value for value in values if value]
+    if not non_empty:
+        return np.full(len(values), np.nan)
+
+    try:
+        numbers = [to_float(value) for value in values]
+    except ValueError:
+        numbers = None
+
+    if numbers is not None:
+        if len(non_empty) == len(values) and all(number.is_integer() for number in numbers):
+            return np.array(numbers, dtype=np.int64)
+        return np.array(numbers, dtype=np.float64)
+
+    if len(set(non_empty)) <= category_threshold * len(values):
+        return pd.Categorical([value if value else None for value in values])
+
+    return np.array([value if value else np.nan for value in values], dtype=object)
+
+
+def _split_rows(element: etree.ElementBase) -> tuple:
+    """
+    Splits the rows of the table into the header rows and the body rows.
+    The repeated header rows of the body and the footer rows are dropped.
+    """
+    header_rows = element.xpath("./thead/tr")
+    body_rows = element.xpath("./tbody/tr | ./tr")
+
+    # Without thead, the header is the first rows made only of th
+    if not header_rows:
+        while body_rows and not body_rows[0].xpath("./td"):
+            header_rows.append(body_rows.pop(0))
+
+    body_rows = [row for row in body_rows if not HEADER_ROW_CLASSES & set(row.get("class", "").split())]
+    return header_rows, body_rows
+
+
+def _build_grid(rows: list) -> list:
+    """
+    Builds the grid of texts of the rows, spreading the cells over their colspan and rowspan.
+    """
+    grid = []
+    # Cells spanning over the next rows: column -> (remaining rows, text)
+    pending = {}
+
+    for row in rows:
+        values = []
+        column = 0
+
+        for cell in row.xpath("./td | ./th"):
+            while column in pending:
+                column = _fill_pending(values, pending, column)
+
+            text = "".join(cell.itertext()).strip()
+            colspan = _get_span(cell, "colspan")
+            rowspan = _get_span(cell, "rowspan")
+
+            for _ in range(colspan):
+                values.append(text)
+                if rowspan > 1:
+                    pending[column] = (rowspan - 1, text)
+                column += 1
+
+        while pending and column <= max(pending):
+            if column in pending:
+                column = _fill_pending(values, pending, column)
+            else:
+                values.append("")
+                column += 1
+
+        grid.append(values)
+
+    return grid
+
+
+def _fill_pending(values: list, pending: dict, column: int) -> int:
+    """
+    Appends the text of a cell spanning from a previous row and returns the next column.
+    """
+    remaining, text = pending[column]
+    values.append(text)
+    if remaining > 1:
+        pending[column] = (remaining - 1, text)
+    else:
+        del pending[column]
+    return column + 1
+
+
+def _get_span(cell: etree.ElementBase, attribute: str) -> int:
+    """
+    Returns the colspan or rowspan of a cell (1 when missing or invalid).
+    """
+    value = cell.get(attribute)
+    if value is None:
+        return 1
+    try:
+        return max(int(value), 1)
+    except ValueError:
+        return 1
+
+
+def _deduplicate(names: list) -> list:
+    """
+    Renames the duplicated column names like pandas does when reading a csv ("xG", "xG.1", ...).
+    """
+    counts = {}
+    columns = []
+    for name in names:
+        if name in counts:
+            counts[name] += 1
+            columns.append(f"{name}.{counts[name]}")
+        else:
+            counts[name] = 0
+            columns.append(name)
+    return columns
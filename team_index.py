@@ -0,0 +1,138 @@
+"""
+This file contains the index of the team features used to build the matchups and score fixtures in batch.
+"""
+
+import pandas as pd
+import numpy as np
+import os
+
+
+class TeamFeatureIndex:
+    """
+    This class is used to store the features of the teams in one contiguous array, with a team name -> row index.
+    The features of N matchups are then built with a single gather instead of N filters and merges.
+    """
+    def __init__(self, teams: list, features: np.ndarray, columns: list):
+        """
+        Args:
+            teams (list): The names of the teams, one per row of the features.
+            features (np.ndarray): The features of the teams.
+            columns (list): The names of the features.
+        """
+        self.teams = pd.Index(teams)
+        if not self.teams.is_unique:
+            raise ValueError(f"Duplicated teams: {list(self.teams[self.teams.duplicated()])}")
+
+        self.features = np.ascontiguousarray(features)
+        self.columns = list(columns)
+        self.matchup_columns = [f"{column}_dom" for column in self.columns] + \
+                               [f"{column}_ext" for column in self.columns]
+
+    @classmethod
+    def from_statistics(cls, df_statistics: pd.DataFrame, team_column: str = "Équipe",
+                        columns: list = None) -> "TeamFeatureIndex":
+        """
+        Builds the index from the teams general statistics (of one or several leagues).
+
+        Args:
+            df_statistics (pd.DataFrame): The teams general statistics, one row per team.
+            team_column (str, optional): The name of the column with the team. Defaults to "Équipe".
+            columns (list, optional): The features. Defaults to all the numeric columns, in order,
+                which are the features kept by get_features.
+
+        Returns:
+            TeamFeatureIndex: The index.
+        """
+        if columns is None:
+            columns = [column for column in df_statistics.select_dtypes("number").columns if column != team_column]
+
+        features = df_statistics[columns].to_numpy(dtype=np.float64)
+        return cls(df_statistics[team_column].astype(str).tolist(), features, columns)
+
+    @classmethod
+    def load(cls, path: str) -> "TeamFeatureIndex":
+        """
+        Loads an index saved with save.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["teams"].tolist(), data["features"], data["columns"].tolist())
+
+    def save(self, path: str):
+        """
+        Saves the index to a .npz file, read back without parsing the statistics again.
+        The file is written to a temporary file first so that a reader never sees a partial file.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(path + ".tmp", "wb") as file:
+            np.savez(file, teams=np.asarray(self.teams, dtype=str), features=self.features,
+                     columns=np.asarray(self.columns, dtype=str))
+        os.replace(path + ".tmp", path)
+
+    def select(self, columns: list) -> "TeamFeatureIndex":
+        """
+        Returns the index with only some features, in the given order (e.g. the features of a model).
+        """
+        positions = [self.columns.index(column) for column in columns]
+        return TeamFeatureIndex(self.teams, self.features[:, positions], columns)
+
+    def get_ids(self, teams) -> np.ndarray:
+        """
+        Returns the row of each team in the features (-1 for the unknown teams).
+        """
+        return self.teams.get_indexer(pd.Index(np.asarray(teams, dtype=object)))
+
+    def get_matchup_features(self, home_teams, away_teams) -> pd.DataFrame:
+        """
+        Returns the features of the matchups, with the columns of merge_statistics_to_match_schedule
+        ("<feature>_dom" then "<feature>_ext"). The matchups with an unknown team have missing values.
+
+        Args:
+            home_teams: The home teams.
+            away_teams: The away teams.
+
+        Returns:
+            pd.DataFrame: The features, one row per matchup.
+        """
+        home_ids = self.get_ids(home_teams)
+        away_ids = self.get_ids(away_teams)
+
+        matrix = np.empty((len(home_ids), 2 * len(self.columns)))
+        matrix[:, :len(self.columns)] = self.features.take(home_ids, axis=0, mode="clip")
+        matrix[:, len(self.columns):] = self.features.take(away_ids, axis=0, mode="clip")
+        matrix[(home_ids < 0) | (away_ids < 0)] = np.nan
+
+        return pd.DataFrame(matrix, columns=self.matchup_columns)
+
+
+def predict_fixtures(schedule_df: pd.DataFrame, index: TeamFeatureIndex, home_model, away_model,
+                     home_column: str = "Domicile", away_column: str = "Extérieur") -> pd.DataFrame:
+    """
+    Predicts the goals of all the fixtures of a schedule (of one or several leagues)
+    with one call to each model.
+
+    Args:
+        schedule_df (pd.DataFrame): The fixtures.
+        index (TeamFeatureIndex): The features of the teams.
+        home_model: The model of the home team goals (e.g. gb_dom).
+        away_model: The model of the away team goals (e.g. gb_ext).
+        home_column (str, optional): The name of the column with the home team. Defaults to "Domicile".
+        away_column (str, optional): The name of the column with the away team. Defaults to "Extérieur".
+
+    Returns:
+        pd.DataFrame: The fixtures with the domicile_but_pred and exterieur_but_pred columns
+            (missing when a team is unknown).
+    """
+    X = index.get_matchup_features(schedule_df[home_column], schedule_df[away_column])
+    known = (index.get_ids(schedule_df[home_column]) >= 0) & (index.get_ids(schedule_df[away_column]) >= 0)
+
+    home_goals = np.full(len(X), np.nan)
+    away_goals = np.full(len(X), np.nan)
+    if known.any():
+        X_known = X[known]
+        home_goals[known] = home_model.predict(X_known)
+        away_goals[known] = away_model.predict(X_known)
+
+    return schedule_df.assign(domicile_but_pred=home_goals, exterieur_but_pred=away_goals)
@@ -0,0 +1,36 @@
+"""
+This file contains the fixtures shared by the tests.
+"""
+
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+# The modules of the bot are at the root of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+@pytest.fixture
+def http_server():
+    """
+    Starts local HTTP servers: http_server(handler_class) returns the root url of a server
+    running the handler. The servers are stopped at the end of the test.
+    """
+    servers = []
+
+    def start(handler) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        # Poll often so that the server stops at once at the end of the test
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,101 @@
+"""
+This file contains the tests of the rendering of the pages and of the pages that fail to render.
+"""
+
+import time
+from http.server import BaseHTTPRequestHandler
+from types import SimpleNamespace
+
+import pytest
+
+from extraction_router import ExtractionRouter, STRUCTURAL
+from instrumentation import METRICS
+from main import scrape_with_playwright
+
+TABLE_PAGE = ("<html><body><table><caption>Classement</caption>"
+              "<tr><th>Rk</th><th>Équipe</th><th>Pts</th></tr>"
+              "<tr><td>1</td><td>Arsenal</td><td>50</td></tr>"
+              "<tr><td>2</td><td>Chelsea</td><td>45</td></tr></table></body></html>")
+
+SCHEMA = {
+    "properties": {
+        "standings": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"team_name": {"type": "string"}, "Pts": {"type": "integer"}},
+                "required": ["team_name", "Pts"],
+            },
+        },
+    },
+    "required": ["standings"],
+}
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """
+    Serves the table page, and the /slow page after longer than the timeout of the pool.
+    """
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(3)
+        body = TABLE_PAGE.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakePool:
+    """
+    Returns the documents of the pool without a browser.
+    """
+    def __init__(self, docs):
+        self.docs = docs
+
+    def load(self, urls):
+        return self.docs
+
+
+def count_failed_pages() -> float:
+    return sum(value for (name, _), value in METRICS.counters.items() if name == "pages_failed")
+
+
+def test_failed_render_is_skipped():
+    docs = [SimpleNamespace(page_content="", metadata={"source": "http://fbref.test/slow", "error": "Timeout"}),
+            SimpleNamespace(page_content=TABLE_PAGE, metadata={"source": "http://fbref.test/table"})]
+    failed = count_failed_pages()
+    router = ExtractionRouter()
+
+    results = scrape_with_playwright(["http://fbref.test/slow", "http://fbref.test/table"], SCHEMA, router=router,
+                                     pool=FakePool(docs))
+
+    assert count_failed_pages() == failed + 1
+    assert router.stats()[STRUCTURAL]["pages"] == 1
+    # One result per rendered page
+    assert list(results) == ["http://fbref.test/table"]
+    assert "Arsenal" in str(results["http://fbref.test/table"])
+
+
+def test_failed_render_with_browser(http_server):
+    pytest.importorskip("playwright.async_api")
+    from browser_pool import BrowserPool
+
+    url = http_server(SlowHandler)
+    failed = count_failed_pages()
+
+    with BrowserPool(timeout=1) as pool:
+        docs = pool.load([f"{url}/slow", f"{url}/table"])
+        assert docs[0].page_content == "" and "error" in docs[0].metadata
+        assert "error" not in docs[1].metadata
+
+        results = scrape_with_playwright([f"{url}/slow", f"{url}/table"], SCHEMA, router=ExtractionRouter(),
+                                         pool=pool)
+
+    assert count_failed_pages() == failed + 1
+    assert list(results) == [f"{url}/table"]
+    assert "Arsenal" in str(results[f"{url}/table"])
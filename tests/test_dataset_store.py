@@ -0,0 +1,44 @@
+"""
+This file contains the tests of the partitioned Parquet dataset.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dataset_store import DatasetStore
+
+
+def test_read_partitions_with_different_types(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    # "Notes" is empty (parsed as float) in a league and text in the other one, "Pts" is int then float
+    store.write(pd.DataFrame({"Équipe": ["Arsenal", "Chelsea"], "Notes": [np.nan, np.nan], "Pts": [50, 45]}),
+                "results_overall", "Premier-League", "2023-2024")
+    store.write(pd.DataFrame({"Équipe": ["Lens"], "Notes": ["Qualifié"], "Pts": [40.5]}),
+                "results_overall", "Ligue-1", "2023-2024")
+
+    df = store.read("results_overall").sort_values("Équipe", ignore_index=True)
+
+    assert list(df["Équipe"]) == ["Arsenal", "Chelsea", "Lens"]
+    assert df["Notes"].isna().tolist() == [True, True, False]
+    assert df.loc[2, "Notes"] == "Qualifié"
+    assert df["Pts"].tolist() == [50, 45, 40.5]
+
+
+def test_read_partitions_written_with_float_empty_columns(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    store.write(pd.DataFrame({"Équipe": ["Lens"], "Notes": ["Qualifié"]}), "results_overall", "Ligue-1", "2023-2024")
+
+    # A partition written before the empty columns were stored as null
+    directory = os.path.join(str(tmp_path), "results_overall", "league=Premier-League", "season=2023-2024")
+    os.makedirs(directory)
+    pq.write_table(pa.table({"Équipe": ["Arsenal"], "Notes": pa.array([None], type=pa.float64())}),
+                   os.path.join(directory, "part-0.parquet"))
+
+    df = store.read("results_overall").sort_values("Équipe", ignore_index=True)
+
+    assert list(df["Équipe"]) == ["Arsenal", "Lens"]
+    assert df["Notes"].isna().tolist() == [True, False]
@@ -0,0 +1,139 @@
+"""
+This file contains the tests of the LLM extraction and of its cache, with a fake chat model.
+"""
+
+import asyncio
+import contextlib
+import sys
+from types import ModuleType, SimpleNamespace
+
+import pytest
+
+from extraction_cache import ExtractionCache
+from main import extract, extract_chunks, extract_page, extract_page_async
+
+SCHEMA = {
+    "properties": {"team_name": {"type": "string"}, "Pts": {"type": "integer"}},
+    "required": ["team_name", "Pts"],
+}
+
+
+class FakeLLM:
+    """
+    Extracts a row named after the content, and counts its calls.
+    """
+    def __init__(self, model_name: str = "fake-model"):
+        self.model_name = model_name
+        self.calls = []
+
+    def extract(self, content: str, schema: dict) -> list:
+        self.calls.append(content)
+        return [{"team_name": content, "Pts": len(self.calls)}]
+
+
+class FakeChain:
+    """
+    Replaces the langchain extraction chain: it runs the fake chat model.
+    """
+    def __init__(self, schema: dict, llm: FakeLLM):
+        self.schema = schema
+        self.llm = llm
+
+    def run(self, content: str) -> list:
+        return self.llm.extract(content, self.schema)
+
+    async def arun(self, content: str) -> list:
+        return self.llm.extract(content, self.schema)
+
+
+@pytest.fixture(autouse=True)
+def fake_langchain(monkeypatch):
+    """
+    Replaces the langchain modules imported by the extraction, so that no request is sent to an API.
+    """
+    chains = ModuleType("langchain.chains")
+    chains.create_extraction_chain = FakeChain
+    callbacks = ModuleType("langchain.callbacks")
+    callbacks.get_openai_callback = lambda: contextlib.nullcontext(SimpleNamespace(prompt_tokens=10,
+                                                                                   completion_tokens=5))
+    monkeypatch.setitem(sys.modules, "langchain", ModuleType("langchain"))
+    monkeypatch.setitem(sys.modules, "langchain.chains", chains)
+    monkeypatch.setitem(sys.modules, "langchain.callbacks", callbacks)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "extractions.db"))
+    yield cache
+    cache.close()
+
+
+def test_extract_cache(cache):
+    llm = FakeLLM()
+
+    first = extract("Arsenal | 50", SCHEMA, llm=llm, cache=cache)
+    # Same content, schema and model: served by the cache
+    assert extract("Arsenal | 50", SCHEMA, llm=llm, cache=cache) == first
+    assert llm.calls == ["Arsenal | 50"]
+    assert cache.stats()["hits"] == 1
+
+    # Another schema: extracted again
+    other_schema = {**SCHEMA, "required": ["team_name"]}
+    assert extract("Arsenal | 50", other_schema, llm=llm, cache=cache) != first
+    assert len(llm.calls) == 2
+
+    # Another model: extracted again
+    other_llm = FakeLLM("other-model")
+    extract("Arsenal | 50", SCHEMA, llm=other_llm, cache=cache)
+    assert other_llm.calls == ["Arsenal | 50"]
+    assert cache.stats()["misses"] == 3
+
+
+def test_extract_without_cache():
+    llm = FakeLLM()
+
+    extract("Arsenal | 50", SCHEMA, llm=llm)
+    extract("Arsenal | 50", SCHEMA, llm=llm)
+
+    assert len(llm.calls) == 2
+
+
+def test_extract_chunks_cache(cache):
+    llm = FakeLLM()
+    chunks = ["Arsenal | 50", "Chelsea | 45"]
+
+    first = asyncio.run(extract_chunks(chunks, SCHEMA, llm=llm, cache=cache, rate=100))
+    assert [result[0]["team_name"] for result in first] == chunks
+    assert sorted(llm.calls) == sorted(chunks)
+
+    # The second run of the page is served by the cache, in the order of the chunks
+    assert asyncio.run(extract_chunks(chunks, SCHEMA, llm=llm, cache=cache, rate=100)) == first
+    assert len(llm.calls) == 2
+
+    # Another schema or another model: all the chunks are extracted again
+    asyncio.run(extract_chunks(chunks, {**SCHEMA, "required": ["team_name"]}, llm=llm, cache=cache, rate=100))
+    assert len(llm.calls) == 4
+    other_llm = FakeLLM("other-model")
+    asyncio.run(extract_chunks(chunks, SCHEMA, llm=other_llm, cache=cache, rate=100))
+    assert sorted(other_llm.calls) == sorted(chunks)
+
+
+def test_extract_page_in_event_loop():
+    async def run():
+        extract_page("<table></table>", SCHEMA, llm=FakeLLM())
+
+    with pytest.raises(RuntimeError, match="extract_page_async"):
+        asyncio.run(run())
+
+
+def test_extract_page_async(cache):
+    pytest.importorskip("tiktoken")
+    llm = FakeLLM()
+    content = ("<table><caption>Classement</caption><tr><th>Équipe</th><th>Pts</th></tr>"
+               "<tr><td>Arsenal</td><td>50</td></tr></table>")
+
+    async def run():
+        return await extract_page_async(content, SCHEMA, llm=llm, cache=cache, rate=100)
+
+    assert asyncio.run(run()) == extract_page(content, SCHEMA, llm=llm, cache=cache, rate=100)
+    assert len(llm.calls) == 1
@@ -0,0 +1,75 @@
+"""
+This file contains the tests of the scrapper of the fbref pages.
+"""
+
+import datetime
+import os
+import sqlite3
+
+import pytest
+
+from football_scraper import FootballScrapper, League
+from history_store import HistoryStore
+from http_cache import ResponseCache
+from http_client import HttpClient
+from table_extractor import extract_tables
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "fixtures")
+
+
+def get_scrapper(client: HttpClient) -> FootballScrapper:
+    """
+    Returns a scrapper with the tables of the recorded Premier League pages.
+    """
+    scrapper = FootballScrapper(League.PREMIER_LEAGUE, client=client, season="2023-2024")
+    with open(os.path.join(FIXTURES, "schedule_premier_league_2023-2024.html"), encoding="utf-8") as file:
+        scrapper.schedule = extract_tables(file.read())[0].data
+    with open(os.path.join(FIXTURES, "statistics_premier_league_2023-2024.html"), encoding="utf-8") as file:
+        tables = extract_tables(file.read(), include_commented=True)
+    scrapper.statistics = [table.data for table in tables]
+    scrapper.statistics_ids = [table.id for table in tables]
+    return scrapper
+
+
+def test_to_history_against_tables(tmp_path):
+    client = HttpClient()
+    store = HistoryStore(str(tmp_path / "history.db"))
+
+    get_scrapper(client).to_history(store, snapshot_date=datetime.date(2023, 8, 15))
+
+    # The rows "vs <team>" of the against tables are snapshots of the team, not other teams
+    teams = [name for (name,) in store.connection.execute("SELECT name FROM teams")]
+    assert len(teams) == 20
+    assert not any(name.startswith("vs ") for name in teams)
+
+    against = store.read_snapshot("stats_squads_standard_against", teams=["Aston Villa"])
+    assert list(against["Équipe"]) == ["Aston Villa"]
+    # Aston Villa conceded 5 goals in its first match
+    assert against.loc[0, "Buts"] == 5
+    assert store.read_snapshot("stats_squads_standard_for", teams=["Aston Villa"]).loc[0, "Buts"] == 1
+    store.close()
+    client.close()
+
+
+def test_close_own_client(tmp_path, monkeypatch):
+    # The default cache of the client is created in the working directory
+    monkeypatch.chdir(tmp_path)
+
+    with FootballScrapper(League.LIGUE_1) as scrapper:
+        assert scrapper.client.cache.get("http://fbref.test/page") is None
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        scrapper.client.cache.get("http://fbref.test/page")
+
+
+def test_close_keeps_given_client(tmp_path):
+    client = HttpClient(cache=ResponseCache(str(tmp_path / "responses.db")))
+    closed = []
+    client.close = lambda: closed.append(True)
+
+    with FootballScrapper(League.LIGUE_1, client=client):
+        pass
+
+    assert not closed
+    assert client.cache.get("http://fbref.test/page") is None
+    client.cache.close()
@@ -0,0 +1,156 @@
+"""
+This file contains the tests of the HTTP client and of the scrape of the leagues against a local server.
+"""
+
+from http.server import BaseHTTPRequestHandler
+from time import monotonic
+
+from benchmarks.fbref_fixtures import generate_schedule_page, generate_statistics_page
+from football_scraper import League, scrape_leagues
+from http_cache import ResponseCache
+from http_client import HttpClient
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves a page and counts the requests received. The subclasses set the responses.
+    """
+    # The paths of the requests received, and their If-None-Match header
+    requests = None
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+        status, headers, body = self.respond()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def respond(self) -> tuple:
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, b"<html>ok</html>"
+
+    def log_message(self, format, *args):
+        pass
+
+
+def get_handler(respond=None) -> type:
+    """
+    Returns a handler class with its own list of requests, answering with respond(handler) if given.
+    """
+    attributes = {"requests": []}
+    if respond is not None:
+        attributes["respond"] = respond
+    return type("TestHandler", (Handler,), attributes)
+
+
+def test_rate_limit(http_server):
+    handler = get_handler()
+    url = http_server(handler)
+    client = HttpClient(rate=10)
+
+    start = monotonic()
+    for _ in range(4):
+        assert client.get(f"{url}/page").status_code == 200
+    elapsed = monotonic() - start
+    client.close()
+
+    # The first request is sent at once, the 3 others wait for a token (1 every 100 ms)
+    assert len(handler.requests) == 4
+    assert elapsed >= 0.3
+
+
+def test_retry_on_server_errors(http_server):
+    def respond(self):
+        # Two failures (a server error then a rate limit), then the page
+        if len(self.requests) == 1:
+            return 500, {}, b"error"
+        if len(self.requests) == 2:
+            return 429, {"Retry-After": "0"}, b"slow down"
+        return 200, {}, b"<html>ok</html>"
+
+    handler = get_handler(respond)
+    client = HttpClient(rate=100, backoff=0.01)
+
+    response = client.get(http_server(handler))
+    client.close()
+
+    assert response.status_code == 200
+    assert response.content == b"<html>ok</html>"
+    assert len(handler.requests) == 3
+
+
+def test_retry_gives_up(http_server):
+    handler = get_handler(lambda self: (503, {}, b"unavailable"))
+    client = HttpClient(rate=100, max_retries=2, backoff=0.01)
+
+    response = client.get(http_server(handler))
+    client.close()
+
+    assert response.status_code == 503
+    assert len(handler.requests) == 3
+
+
+def test_etag_revalidation(http_server, tmp_path):
+    versions = {"etag": '"v1"', "body": b"<html>v1</html>"}
+
+    def respond(self):
+        if self.headers.get("If-None-Match") == versions["etag"]:
+            return 304, {"ETag": versions["etag"]}, b""
+        return 200, {"ETag": versions["etag"], "Content-Type": "text/html; charset=utf-8"}, versions["body"]
+
+    handler = get_handler(respond)
+    url = f"{http_server(handler)}/page"
+    client = HttpClient(rate=100, cache=ResponseCache(str(tmp_path / "responses.db")))
+
+    assert client.get(url).content == b"<html>v1</html>"
+    # Fresh: served by the cache without any request
+    assert client.get(url).content == b"<html>v1</html>"
+    assert len(handler.requests) == 1
+
+    # Stale: revalidated, the server answers 304 and the cached body is served
+    response = client.get(url, max_age=0)
+    assert response.status_code == 200 and response.content == b"<html>v1</html>"
+    assert handler.requests[-1] == ("/page", '"v1"')
+
+    # Changed: the new body replaces the cached one
+    versions.update(etag='"v2"', body=b"<html>v2</html>")
+    assert client.get(url, max_age=0).content == b"<html>v2</html>"
+    assert client.get(url).content == b"<html>v2</html>"
+    assert len(handler.requests) == 3
+    client.close()
+    client.cache.close()
+
+
+def test_scrape_leagues(http_server, tmp_path):
+    schedule = generate_schedule_page().encode()
+    statistics = generate_statistics_page(n_tables=4, n_columns=6).encode()
+
+    def respond(self):
+        body = schedule if "/calendrier/" in self.path else statistics
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, body
+
+    handler = get_handler(respond)
+    url = http_server(handler)
+    cache = ResponseCache(str(tmp_path / "responses.db"))
+    client = HttpClient(rate=100, cache=cache)
+    leagues = [League.PREMIER_LEAGUE, League.LIGUE_1]
+
+    scrappers = scrape_leagues(leagues, client=client, base_url=url)
+
+    assert sorted(path for path, _ in handler.requests) == [
+        "/comps/13/Statistiques-Ligue-1",
+        "/comps/13/calendrier/Scores-et-tableaux-Ligue-1",
+        "/comps/9/Statistiques-Premier-League",
+        "/comps/9/calendrier/Scores-et-tableaux-Premier-League",
+    ]
+    for league in leagues:
+        assert len(scrappers[league].schedule) > 0
+        assert len(scrappers[league].statistics) == 4
+
+    # A second scrape is served by the cache
+    scrape_leagues(leagues, client=client, base_url=url)
+    assert len(handler.requests) == 4
+    client.close()
+    cache.close()
@@ -0,0 +1,41 @@
+"""
+This file contains the tests of the features built from the fbref team statistics tables.
+"""
+
+import pandas as pd
+
+from stats_registry import STATS_TABLES, HOME_AWAY_COLUMNS, build_team_features
+from table_extractor import extract_tables
+
+
+def get_home_away_page() -> str:
+    """
+    Returns a home and away table as fbref renders it: an over header with the venue, then the same columns twice.
+    """
+    columns = "".join(f"<th>{column}</th>" for column in HOME_AWAY_COLUMNS)
+    rows = ""
+    for rank, (team, home, away) in enumerate((("Arsenal", 3, 1), ("Chelsea", 1, 2)), start=1):
+        home_values = "".join(f"<td>{home + i}</td>" for i in range(len(HOME_AWAY_COLUMNS)))
+        away_values = "".join(f"<td>{away + i}</td>" for i in range(len(HOME_AWAY_COLUMNS)))
+        rows += f"<tr><th>{rank}</th><td><a>{team}</a></td>{home_values}{away_values}</tr>"
+
+    width = len(HOME_AWAY_COLUMNS)
+    return ('<html><body><table id="results2023-202491_home_away">'
+            f'<thead><tr class="over_header"><th colspan="2"></th><th colspan="{width}">Domicile</th>'
+            f'<th colspan="{width}">Extérieur</th></tr>'
+            f"<tr><th>Clt</th><th>Équipe</th>{columns}{columns}</tr></thead>"
+            f"<tbody>{rows}</tbody></table></body></html>")
+
+
+def test_home_away_features():
+    home_away = extract_tables(get_home_away_page())[0].data
+    overall = pd.DataFrame({"Équipe": ["Arsenal", "Chelsea"], "MJ": [20, 20], "Pts": [50, 45]})
+
+    df = build_team_features([overall, home_away], STATS_TABLES[:2])
+
+    assert list(df.index) == ["Arsenal", "Chelsea"]
+    assert df.loc["Arsenal", "MJ_domicile"] == 3 and df.loc["Arsenal", "MJ_exterieur"] == 1
+    assert df.loc["Chelsea", "Pts/MJ_domicile"] == 1 + 8 and df.loc["Chelsea", "Pts/MJ_exterieur"] == 2 + 8
+    # The overall columns keep their names
+    assert df.loc["Arsenal", "Pts"] == 50
+    assert len(df.columns) == 2 + 2 * len(HOME_AWAY_COLUMNS)
@@ -0,0 +1,40 @@
+"""
+This file contains the tests of the extraction of the tables of the recorded fbref pages.
+"""
+
+import os
+
+from table_extractor import extract_tables
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "fixtures")
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as file:
+        return file.read()
+
+
+def test_recorded_schedule():
+    tables = extract_tables(read_fixture("schedule_premier_league_2023-2024.html"))
+
+    assert [table.id for table in tables] == ["sched_2023-2024_9_1"]
+    df = tables[0].data
+    # The repeated header and the spacer rows are dropped
+    assert len(df) == 19
+    assert list(df.columns[:9]) == ["Sem.", "Jour", "Date", "Heure", "Domicile", "xG", "Score", "xG.1", "Extérieur"]
+    assert df.loc[0, "Domicile"] == "Burnley" and df.loc[0, "Score"] == "0–3"
+    assert df["Score"].isna().sum() == 9
+
+
+def test_recorded_statistics():
+    content = read_fixture("statistics_premier_league_2023-2024.html")
+
+    assert len(extract_tables(content)) == 2
+    tables = extract_tables(content, include_commented=True)
+
+    assert [table.id for table in tables] == ["results2023-202491_overall", "results2023-202491_home_away",
+                                              "stats_squads_standard_for", "stats_squads_standard_against"]
+    assert all(len(table.data) == 20 for table in tables)
+    assert tables[0].data["Pts"].sum() == 3 * 7 + 2 * 3
+    assert tables[1].data.columns[-1] == "xGD/90.1"
+    assert tables[3].data["Équipe"].str.startswith("vs ").all()
@@ -0,0 +1,207 @@
+"""
+This file contains the training of the home and away goal models of every league.
+
+The models are cross-validated on time-ordered folds and the hyperparameter sweeps of all the leagues
+run in one process pool. The fitted models are saved as artifacts keyed by the hash of the training data
+and of the parameters, so an unchanged league is not retrained.
+"""
+
+import pandas as pd
+import numpy as np
+import hashlib
+import itertools
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.model_selection import TimeSeriesSplit
+
+from data_preparation import get_features, get_home_target, get_ext_target
+
+
+# Parameters of the models of the notebooks
+DEFAULT_PARAMS = {"n_estimators": 100, "learning_rate": 0.1, "max_depth": 1, "random_state": 42}
+
+DEFAULT_PARAM_GRID = {"n_estimators": [50, 100, 200], "learning_rate": [0.05, 0.1], "max_depth": [1, 2],
+                      "random_state": [42]}
+
+TARGETS = ("home", "away")
+
+
+def get_training_data(merged_df: pd.DataFrame) -> tuple:
+    """
+    Returns the features and the targets of the merged matches, sorted by date for the time-ordered folds.
+
+    Args:
+        merged_df (pd.DataFrame): The matches merged with the statistics of the teams.
+
+    Returns:
+        tuple: The features, the home goals and the away goals.
+    """
+    merged_df = merged_df.sort_values("FullDate", kind="stable")
+    return get_features(merged_df), get_home_target(merged_df), get_ext_target(merged_df)
+
+
+def get_param_combinations(param_grid: dict) -> list:
+    """
+    Returns all the combinations of the parameter grid.
+    """
+    names = sorted(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(param_grid[name] for name in names))]
+
+
+def hash_training_data(X: pd.DataFrame, y_home: pd.Series, y_away: pd.Series, param_grid: dict) -> str:
+    """
+    Returns the key of the artifact of a league: the hash of the training data and of the parameter grid.
+    """
+    digest = hashlib.sha1(json.dumps(param_grid, sort_keys=True).encode())
+    digest.update(repr(list(X.columns)).encode())
+    for data in (X, y_home, y_away):
+        digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def cross_validate(X: pd.DataFrame, y: pd.Series, params: dict, n_splits: int = 5) -> float:
+    """
+    Returns the mean accuracy of a model on time-ordered folds (each fold is validated on later matches).
+
+    Args:
+        X (pd.DataFrame): The features, sorted by date.
+        y (pd.Series): The target.
+        params (dict): The parameters of the model.
+        n_splits (int, optional): The number of folds. Defaults to 5.
+
+    Returns:
+        float: The mean accuracy.
+    """
+    scores = []
+    for train_index, test_index in TimeSeriesSplit(n_splits=n_splits).split(X):
+        model = GradientBoostingClassifier(**params).fit(X.iloc[train_index], y.iloc[train_index])
+        scores.append(model.score(X.iloc[test_index], y.iloc[test_index]))
+    return float(np.mean(scores))
+
+
+def fit_model(X: pd.DataFrame, y: pd.Series, params: dict) -> GradientBoostingClassifier:
+    """
+    Fits a model on all the matches.
+    """
+    return GradientBoostingClassifier(**params).fit(X, y)
+
+
+def train_leagues(datasets: dict, param_grid: dict = None, n_splits: int = 5, directory: str = "models",
+                  max_workers: int = None, force: bool = False) -> dict:
+    """
+    Trains the home and away goal models of several leagues in a process pool.
+    Every (league, target, parameters) cross-validation is a task of the pool, then the best parameters
+    of each model are fitted on all the matches and saved.
+
+    Args:
+        datasets (dict): The features, home goals and away goals (see get_training_data), by league name.
+        param_grid (dict, optional): The parameters to sweep. Defaults to DEFAULT_PARAM_GRID.
+        n_splits (int, optional): The number of time-ordered folds. Defaults to 5.
+        directory (str, optional): The directory of the artifacts. Defaults to "models".
+        max_workers (int, optional): The number of processes. Defaults to the number of CPUs.
+        force (bool, optional): Whether to retrain the leagues that already have an artifact. Defaults to False.
+
+    Returns:
+        dict: The path of the artifact, by league name.
+    """
+    param_grid = param_grid if param_grid is not None else DEFAULT_PARAM_GRID
+    combinations = get_param_combinations(param_grid)
+
+    paths = {}
+    to_train = {}
+    for league_name, (X, y_home, y_away) in datasets.items():
+        key = hash_training_data(X, y_home, y_away, param_grid)
+        paths[league_name] = os.path.join(directory, league_name, f"{key}.pkl")
+
+        if not force and os.path.exists(paths[league_name]):
+            print(f"{league_name}: unchanged, skipped")
+            _set_latest(directory, league_name, paths[league_name])
+        else:
+            to_train[league_name] = (X, {"home": y_home, "away": y_away})
+
+    if not to_train:
+        return paths
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Cross-validate every combination of every model
+        futures = {}
+        for league_name, (X, targets) in to_train.items():
+            for target in TARGETS:
+                for i, params in enumerate(combinations):
+                    futures[league_name, target, i] = executor.submit(cross_validate, X, targets[target],
+                                                                      params, n_splits)
+        scores = {key: future.result() for key, future in futures.items()}
+
+        # Fit the best parameters of every model on all the matches
+        best = {}
+        for league_name, (X, targets) in to_train.items():
+            for target in TARGETS:
+                i = max(range(len(combinations)), key=lambda i: scores[league_name, target, i])
+                best[league_name, target] = (combinations[i], scores[league_name, target, i])
+                futures[league_name, target] = executor.submit(fit_model, X, targets[target], combinations[i])
+
+        for league_name, (X, _) in to_train.items():
+            artifact = {
+                "features": list(X.columns),
+                "models": {target: futures[league_name, target].result() for target in TARGETS},
+                "params": {target: best[league_name, target][0] for target in TARGETS},
+                "scores": {target: best[league_name, target][1] for target in TARGETS},
+            }
+            _save_artifact(artifact, paths[league_name])
+            _set_latest(directory, league_name, paths[league_name])
+            print(f"{league_name}: trained, accuracy home {artifact['scores']['home']:.3f}, "
+                  f"away {artifact['scores']['away']:.3f}")
+
+    return paths
+
+
+def _save_artifact(artifact: dict, path: str):
+    """
+    Saves an artifact, writing to a temporary file first so that a reader never sees a partial file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as file:
+        pickle.dump(artifact, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+
+def _set_latest(directory: str, league_name: str, path: str):
+    """
+    Points the latest artifact of the league to the path.
+    """
+    latest = os.path.join(directory, league_name, "latest.json")
+    with open(latest + ".tmp", "w", encoding="utf-8") as file:
+        json.dump({"artifact": os.path.basename(path)}, file)
+    os.replace(latest + ".tmp", latest)
+
+
+# Loaded artifacts: (directory, league name) -> (artifact file name, artifact)
+_loaded_artifacts = {}
+
+
+def load_models(league_name: str, directory: str = "models") -> dict:
+    """
+    Loads the latest artifact of a league. The artifact is only read from disk the first time
+    and when a new artifact was trained since.
+
+    Args:
+        league_name (str): The name of the league.
+        directory (str, optional): The directory of the artifacts. Defaults to "models".
+
+    Returns:
+        dict: The artifact, with the "features", "models" ("home" and "away"), "params" and "scores" keys.
+    """
+    with open(os.path.join(directory, league_name, "latest.json"), encoding="utf-8") as file:
+        name = json.load(file)["artifact"]
+
+    loaded = _loaded_artifacts.get((directory, league_name))
+    if loaded is not None and loaded[0] == name:
+        return loaded[1]
+
+    with open(os.path.join(directory, league_name, name), "rb") as file:
+        artifact = pickle.load(file)
+    _loaded_artifacts[directory, league_name] = (name, artifact)
+    return artifact